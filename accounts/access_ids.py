@@ -0,0 +1,41 @@
+"""
+Access ID generators.
+
+An access ID is the session key handed to a project after login. Generators only
+need to return a unique, unguessable string of at most 100 characters; they must
+not touch the database or block, since they run on every ``project_ssocall``.
+Pick one with the ``SSO_ACCESS_ID_GENERATOR`` setting.
+"""
+import base64
+import secrets
+import uuid
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BaseAccessIdGenerator:
+    def generate(self, user_id, project_id):
+        raise NotImplementedError('Subclasses must implement generate()')
+
+
+class RandomAccessIdGenerator(BaseAccessIdGenerator):
+    """
+    256 random bits, URL-safe base64 encoded. Same 44 character shape as the
+    old timestamp hashes, but collisions are not a practical concern.
+    """
+    def generate(self, user_id, project_id):
+        return base64.urlsafe_b64encode(secrets.token_bytes(32)).decode('utf-8')
+
+
+class UUIDAccessIdGenerator(BaseAccessIdGenerator):
+    """Random UUID4 hex string, for projects that expect a shorter ID."""
+    def generate(self, user_id, project_id):
+        return uuid.uuid4().hex
+
+
+@lru_cache(maxsize=1)
+def get_access_id_generator():
+    """The configured generator; cleared by accounts.signals when the setting changes."""
+    return import_string(settings.SSO_ACCESS_ID_GENERATOR)()
@@ -9,8 +9,43 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import *
 
+# Unfiltered changelists over tables larger than this show PostgreSQL's row estimate
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that avoids an exact COUNT(*) over a whole large table by using the
+    planner's estimate (pg_class.reltuples). Filtered lists, small tables and other
+    databases get an exact count.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            connection = connections[queryset.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [queryset.model._meta.db_table])
+                    row = cursor.fetchone()
+                # reltuples is -1 until the table has been analyzed
+                if row and row[0] > ESTIMATED_COUNT_THRESHOLD:
+                    return int(row[0])
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow without bound."""
+    paginator = EstimatedCountPaginator
+    # Skip the second, unfiltered COUNT(*) shown next to filtered results
+    show_full_result_count = False
+
 class ProfileInline(admin.StackedInline):
     model = Profile
     can_delete = False
@@ -19,20 +54,59 @@ class ProfileInline(admin.StackedInline):
 class UserAdmin(BaseUserAdmin):
     inlines = (ProfileInline,)
 
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(LargeTableAdmin):
     list_display = ('user', 'name', 'department', 'passing_year', 'degree', 'email_verified')
+    list_select_related = ('user',)
+    list_filter = ('email_verified', 'department', 'degree', 'passing_year')
+    search_fields = ('=roll', 'name')
     readonly_fields = ('email_verified', 'verification_token')
 
-class LoginSessionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'project', 'created_at')
+class LoginSessionAdmin(LargeTableAdmin):
+    list_display = ('user', 'project', 'active', 'created_at')
+    list_select_related = ('user', 'project')
+    list_filter = ('active', 'project')
+    search_fields = ('=user__username',)
+    # Served by the created_at index
+    date_hierarchy = 'created_at'
     readonly_fields = ('user', 'project', 'created_at')
 
-class SSOSessionAdmin(admin.ModelAdmin):
-    list_display = ('user', 'session_key', 'active')
+class SSOSessionAdmin(LargeTableAdmin):
+    list_display = ('user', 'session_key', 'active', 'created_at')
+    list_select_related = ('user',)
+    list_filter = ('active',)
+    search_fields = ('=user__username',)
+    date_hierarchy = 'created_at'
     readonly_fields = ('user', 'session_key', 'active')
 
 class ProjectAdmin(admin.ModelAdmin):
-    list_display = ('name', 'id', 'redirect_url', 'description')  
+    list_display = ('name', 'id', 'redirect_url', 'description', 'is_verified')
+    list_filter = ('is_verified',)
+    search_fields = ('name',)
+    # Maintained with atomic updates by the login flow
+    readonly_fields = ('active_logins',)
+    actions = ['verify']
+
+    @admin.action(description='Verify selected projects')
+    def verify(self, request, queryset):
+        count = queryset.filter(is_verified=False).update(is_verified=True)
+        # update() sends no post_save signal
+        if count:
+            from .catalog import invalidate
+            invalidate()
+        self.message_user(request, f'{count} projects verified.', messages.SUCCESS)
+
+
+class OutboundEmailAdmin(LargeTableAdmin):
+    list_display = ('subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('attempts', 'claimed_at', 'last_error', 'created_at', 'sent_at')
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected emails')
+    def requeue(self, request, queryset):
+        from .outbox import requeue
+        count = requeue(queryset)
+        self.message_user(request, f'{count} emails requeued.', messages.SUCCESS)
 
 
 admin.site.unregister(User)
@@ -41,4 +115,5 @@ admin.site.register(User, UserAdmin)
 admin.site.register(Profile, ProfileAdmin)
 admin.site.register(Project, ProjectAdmin)
 admin.site.register(SSOSession, SSOSessionAdmin)
-admin.site.register(LoginSession, LoginSessionAdmin)
\ No newline at end of file
+admin.site.register(LoginSession, LoginSessionAdmin)
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""
+Retention for LoginSession and SSOSession history.
+
+Rows older than the retention window are streamed into gzipped JSONL files
+(Django's ``jsonl`` serialization format) and then deleted in small batches of
+one DELETE each, so neither step holds more than one chunk in memory or a long
+lock on the table.
+Archives can be loaded back with ``restore_archive`` for audits.
+"""
+import gzip
+import logging
+import os
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core import serializers
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from . import userdata_cache
+from .models import LoginSession, SSOSession
+from .signals import invalidate_session_user_data
+from .sweeper import reconcile_active_logins
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_MODELS = {
+    'login': LoginSession,
+    'sso': SSOSession,
+}
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def archive_model(model, cutoff, output_dir, chunk_size=1000, delete=True):
+    """
+    Archive rows of ``model`` created before ``cutoff`` into one .jsonl.gz file and
+    delete them. Returns ``(path, archived, deleted)``; path is None if nothing matched.
+    """
+    queryset = model.objects.filter(created_at__lt=cutoff).order_by('pk')
+    serializer = serializers.get_serializer('jsonl')()
+
+    os.makedirs(output_dir, exist_ok=True)
+    filename = f"{model._meta.model_name}-before-{cutoff:%Y%m%d}-{timezone.now():%Y%m%d%H%M%S}.jsonl.gz"
+    path = os.path.join(output_dir, filename)
+
+    archived = 0
+    last_pk = None
+    with gzip.open(path, 'wt', encoding='utf-8') as archive_file:
+        for chunk in _chunks(queryset.iterator(chunk_size=chunk_size), chunk_size):
+            serializer.serialize(chunk, stream=archive_file)
+            archived += len(chunk)
+            last_pk = chunk[-1].pk
+
+    if not archived:
+        os.remove(path)
+        return None, 0, 0
+
+    deleted = 0
+    if delete:
+        # Only delete what made it into the archive file
+        archived_rows = model.objects.filter(created_at__lt=cutoff, pk__lte=last_pk).order_by('pk')
+        key_field = 'sessionkey' if model is LoginSession else 'pk'
+        with _without_session_delete_signal(model):
+            while True:
+                rows = list(archived_rows.values_list('pk', key_field)[:chunk_size])
+                if not rows:
+                    break
+                batch_deleted, _ = model.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+                deleted += batch_deleted
+                if model is LoginSession:
+                    userdata_cache.invalidate_sessions([key for _, key in rows])
+
+    logger.info(f"Archived {archived} {model._meta.verbose_name_plural} to {path}, deleted {deleted}")
+    return path, archived, deleted
+
+
+@contextmanager
+def _without_session_delete_signal(model):
+    """
+    Nothing references session rows, so with no delete receivers connected
+    ``QuerySet.delete()`` issues a single DELETE per batch instead of loading every
+    row to send post_delete. The one receiver, which drops a session's cached
+    getuserdata payload, is replaced by one invalidate_sessions() call per batch.
+    archive_sessions runs as a management command, so no other thread is deleting
+    sessions in this process meanwhile.
+    """
+    if model is not LoginSession:
+        yield
+        return
+    post_delete.disconnect(invalidate_session_user_data, sender=LoginSession)
+    try:
+        yield
+    finally:
+        post_delete.connect(invalidate_session_user_data, sender=LoginSession)
+
+
+def archive_sessions(retention_days, output_dir, models=('login', 'sso'), chunk_size=1000, delete=True):
+    """Archive every session model older than ``retention_days``. Returns a list of results."""
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    results = []
+    for name in models:
+        results.append((name,) + archive_model(ARCHIVED_MODELS[name], cutoff, output_dir, chunk_size, delete))
+
+    # Deleting still-active LoginSessions leaves their logins counted
+    if delete and any(name == 'login' and deleted for name, _, _, deleted in results):
+        reconcile_active_logins()
+    return results
+
+
+def restore_archive(path, chunk_size=1000):
+    """
+    Load an archive file back with bulk inserts. Rows that already exist or whose
+    user/project has since been deleted are skipped. Returns ``(restored, skipped)``.
+    """
+    restored = skipped = 0
+    with gzip.open(path, 'rt', encoding='utf-8') as archive_file:
+        objects = (item.object for item in serializers.deserialize('jsonl', archive_file))
+        for chunk in _chunks(objects, chunk_size):
+            model = type(chunk[0])
+            existing = set(model.objects.filter(pk__in=[obj.pk for obj in chunk]).values_list('pk', flat=True))
+            valid = [obj for obj in _with_existing_references(chunk) if obj.pk not in existing]
+            # created_at is auto_now_add, so inserts stamp the current time; put the
+            # archived timestamps back afterwards
+            created = [obj.created_at for obj in valid]
+            model.objects.bulk_create(valid, batch_size=chunk_size)
+            for obj, created_at in zip(valid, created):
+                obj.created_at = created_at
+            model.objects.bulk_update(valid, ['created_at'], batch_size=chunk_size)
+            restored += len(valid)
+            skipped += len(chunk) - len(valid)
+    return restored, skipped
+
+
+def _with_existing_references(chunk):
+    """Drop objects pointing at users/projects that no longer exist (one query per relation)."""
+    for field in chunk[0]._meta.concrete_fields:
+        if not field.is_relation:
+            continue
+        ids = {getattr(obj, field.attname) for obj in chunk}
+        found = set(field.related_model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+        chunk = [obj for obj in chunk if getattr(obj, field.attname) in found]
+    return chunk
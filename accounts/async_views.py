@@ -0,0 +1,170 @@
+"""
+Async versions of the hot SSO endpoints, mounted in place of the sync views when
+``SSO_ASYNC_VIEWS`` is on and the site is served over ASGI (``config.asgi``).
+
+They use the async ORM and cache APIs directly. Anything that still blocks
+(password hashing, transactions, template rendering) runs in a worker thread via
+``sync_to_async``, so nothing blocking runs on the event loop. Behaviour and
+responses match the views in ``accounts.views``.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth import aauthenticate, alogin
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import status
+
+from . import metrics, tokens, userdata_cache
+from .forms import LoginForm
+from .models import LoginSession, Profile, Project, SSOSession
+from .sweeper import expire_stale_sessions
+from .utils import build_user_data, generate_encrypted_id
+from .views import get_access_id
+
+logger = logging.getLogger(__name__)
+
+arender = sync_to_async(render)
+
+
+async def login_view(request):
+    """
+    Handle user login and update SSO session information.
+    """
+    next_url = request.GET.get('next', 'home')
+    user = await request.auser()
+
+    if user.is_authenticated:
+        messages.success(request, f'Welcome, {user.username}!')
+        return redirect(next_url)
+
+    if request.method == 'POST':
+        try:
+            roll = request.POST.get('username')
+            password = request.POST.get('password')
+            user = await aauthenticate(request, username=roll, password=password)
+
+            if user is not None:
+                profile = await Profile.objects.aget(user=user)
+                if profile.email_verified:
+                    await alogin(request, user)
+
+                    await SSOSession.objects.aupdate_or_create(
+                        user=user,
+                        session_key=request.session.session_key,
+                        defaults={'device': request.META['HTTP_USER_AGENT'][:100], 'active': True}
+                    )
+
+                    next_url = request.POST.get('next', next_url)
+                    metrics.inc('sso_password_logins_total', ('success',))
+                    messages.success(request, f'Welcome, {user.username}!')
+                    return redirect(next_url)
+                else:
+                    metrics.inc('sso_password_logins_total', ('unverified',))
+                    messages.error(request, 'Email not verified. Please verify your email to log in.')
+            else:
+                metrics.inc('sso_password_logins_total', ('invalid',))
+                messages.error(request, 'Invalid roll number or password, are you registered?')
+        except Profile.DoesNotExist:
+            # e.g. accounts made with createsuperuser
+            metrics.inc('sso_password_logins_total', ('error',))
+            logger.error(f"Login error: user {roll} has no profile")
+            messages.error(request, 'An error occurred while logging in. Please try again.')
+        except Exception as e:
+            metrics.inc('sso_password_logins_total', ('error',))
+            logger.error(f"Login error: {e}")
+            messages.error(request, 'An error occurred while logging in. Please try again.')
+
+    form = LoginForm()
+    return await arender(request, 'login.html', {'form': form, 'next': next_url})
+
+
+@sync_to_async
+def _reserve_login_session(project, user, sessionkey):
+    """
+    Reserve a login on the project and create its LoginSession in one transaction
+    (transactions cannot span awaits). Returns None if the project is full.
+    """
+    with transaction.atomic():
+        if not project.reserve_login():
+            expire_stale_sessions(project=project)
+            if not project.reserve_login():
+                return None
+        return LoginSession.objects.create(sessionkey=sessionkey, user=user, project=project)
+
+
+@login_required(login_url='/login/')
+async def project_ssocall(request, id):
+    project = await aget_object_or_404(Project, id=id)
+    user = await request.auser()
+    profile = await Profile.objects.aget(user=user)
+
+    session = await _reserve_login_session(project, user, generate_encrypted_id(user.id, project.id))
+    if session is None:
+        metrics.inc('sso_logins_total', (str(project.id), 'refused'))
+        messages.error(request, 'This unverified project has reached its maximum login limit (10 active logins).')
+        return redirect('home')
+    metrics.inc('sso_logins_total', (str(project.id), 'issued'))
+
+    return await arender(request, 'ssologin.html', {
+        'project': project,
+        'redirecturl': f'{project.redirect_url}?accessid={get_access_id(session, profile)}',
+        'user': profile.name
+    })
+
+
+def _request_data(request):
+    """The request payload, JSON or form encoded, as DRF's request.data would parse it."""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+@csrf_exempt
+@require_POST
+async def return_user_data(request):
+    """
+    API to return user profile data based on the session ID.
+    Ensures session validity and expiration check.
+    """
+    data = _request_data(request)
+    if not isinstance(data, dict):
+        return JsonResponse({"detail": "JSON parse error"}, status=status.HTTP_400_BAD_REQUEST)
+
+    session_id = data.get('id')
+    if not session_id:
+        return JsonResponse({"error": "Session ID is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        session_id = tokens.session_key_for(session_id)
+    except tokens.InvalidAccessToken:
+        return JsonResponse({"error": "Invalid access token"}, status=status.HTTP_403_FORBIDDEN)
+
+    cached = await userdata_cache.aget_user_data(session_id)
+    if cached is not None:
+        return JsonResponse(cached, status=200)
+
+    try:
+        session = await LoginSession.objects.select_related('user__profile').aget(sessionkey=session_id)
+    except LoginSession.DoesNotExist:
+        return JsonResponse({"error": "Session not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    # Same check as LoginSession.is_session_valid, only leaving the loop to write
+    if timezone.now() > session.expires_at:
+        if session.active:
+            await sync_to_async(session.deactivate)()
+        return JsonResponse({"error": "Session has expired"}, status=status.HTTP_403_FORBIDDEN)
+
+    data = build_user_data(session.user.profile)
+    await userdata_cache.aset_user_data(session, data)
+    return JsonResponse(data, status=200)
@@ -0,0 +1,79 @@
+"""
+Cached catalog of verified projects shown in the sidebar of the home page.
+
+The catalog holds only the columns the template uses, with logo URLs and
+thumbnail srcsets (accounts/thumbnails.py) resolved once, and is cached until a
+Project is saved, deleted or verified (see accounts/signals.py and
+ProjectAdmin.verify). Every invalidation bumps a version
+that is also part of the ``{% cache %}`` key of the rendered sidebar fragment,
+so the HTML is rebuilt at the same moment as the data.
+
+The version, the catalog and the fragment live in the default cache, which must
+be shared by all workers (Redis) for an invalidation to reach them all. With the
+default per-process locmem cache only the worker that saved the project sees the
+change at once; the others catch up within SSO_PROJECT_CATALOG_TIMEOUT, and a
+system check (accounts/checks.py) warns about it.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from . import thumbnails
+from .models import Project
+
+KEY_PREFIX = 'sso:catalog'
+VERSION_KEY = f'{KEY_PREFIX}:version'
+
+
+def get_version():
+    """Current catalog version, part of every cache key derived from the catalog."""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+async def aget_version():
+    """``get_version()`` for async code (the page cache middleware under ASGI)."""
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, 1, None)
+        version = await cache.aget(VERSION_KEY, 1)
+    return version
+
+
+def get_verified_projects(version=None):
+    """Verified projects as dicts with name, description, main_url, logo_url and logo_variants."""
+    version = version or get_version()
+    key = f'{KEY_PREFIX}:projects:{version}'
+    projects = cache.get(key)
+    if projects is None:
+        projects = _load_verified_projects()
+        cache.set(key, projects, settings.SSO_PROJECT_CATALOG_TIMEOUT)
+    return projects
+
+
+def _load_verified_projects():
+    logo_storage = Project._meta.get_field('logo').storage
+    rows = Project.objects.filter(is_verified=True).values('id', 'name', 'description', 'main_url', 'logo', 'logo_thumbnails')
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'main_url': row['main_url'],
+            'logo_url': logo_storage.url(row['logo']) if row['logo'] else '',
+            'logo_variants': thumbnails.logo_variants(row['logo_thumbnails']),
+        }
+        for row in rows
+    ]
+
+
+def invalidate():
+    """Drop the cached catalog and its rendered fragment by moving to a new version."""
+    cache.add(VERSION_KEY, 1, None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(VERSION_KEY, 2, None)
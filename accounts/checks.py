@@ -0,0 +1,49 @@
+"""
+System checks for state that every worker must share through a cache.
+
+Several features keep their state in a cache so that all gunicorn/uvicorn workers
+and the email worker see the same values. The default ``CACHE_URL``
+(``locmemcache://``) gives each process its own private cache, which is fine
+for a single development server but silently splits that state in production.
+These checks warn about it whenever DEBUG is off; they run with ``migrate``,
+``check`` and ``runserver``.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PER_PROCESS_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def shared_cache_uses():
+    """(what keeps state in the cache, its cache alias, what goes wrong if it is per process)"""
+    return [
+        ('The project catalog and sitemap', 'default',
+         'other workers serve the old sidebar and sitemap for up to SSO_PROJECT_CATALOG_TIMEOUT seconds '
+         'after a project changes'),
+        ('SSO_PAGE_CACHE_ALIAS', settings.SSO_PAGE_CACHE_ALIAS,
+         'workers keep serving cached pages after a project changes'),
+        ('SSO_METRICS_CACHE_ALIAS', settings.SSO_METRICS_CACHE_ALIAS,
+         'each worker exports only its own totals from /metrics'),
+        ('EMAIL_STATE_CACHE_ALIAS', settings.EMAIL_STATE_CACHE_ALIAS,
+         "each worker can send a sender account's whole daily quota"),
+    ]
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    if settings.DEBUG:
+        return []
+    warnings = []
+    for name, alias, consequence in shared_cache_uses():
+        backend = settings.CACHES.get(alias, {}).get('BACKEND')
+        if backend in PER_PROCESS_BACKENDS:
+            warnings.append(Warning(
+                f"{name} (cache '{alias}'): {backend.rsplit('.', 1)[-1]} is not shared "
+                f"between processes, so {consequence}.",
+                hint="Point CACHE_URL at a shared cache such as Redis.",
+                id='accounts.W001',
+            ))
+    return warnings
@@ -1,13 +1,315 @@
 import threading
-from django.core.mail import EmailMessage
+from collections import deque
+from django.core.cache import caches
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
+from django.utils import timezone
 import random
 import logging
 import time
 import warnings
+from . import metrics, profiling
 
 logger = logging.getLogger(__name__)
 
+
+class SMTPConnectionPool:
+    """
+    Long-lived connections for one entry of EMAIL_CONFIGS.
+
+    Connections are built from the config explicitly (never from the global
+    EMAIL_* settings) and handed to each EmailMessage. Idle connections are
+    dropped after EMAIL_POOL_IDLE_TIMEOUT, and ones that sat unused for more than
+    EMAIL_POOL_HEALTH_CHECK_INTERVAL are checked with NOOP before reuse.
+    """
+
+    def __init__(self, config, max_size, idle_timeout, health_check_interval):
+        self.config = config
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            'connects': 0,
+            'connect_seconds': 0.0,
+            'sends': 0,
+            'send_seconds': 0.0,
+            'failures': 0,
+            'discarded': 0,
+        }
+
+    def _record(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+        sender = self.config['EMAIL_HOST_USER']
+        if 'sends' in increments:
+            metrics.inc('sso_email_sends_total', (sender, 'sent'))
+            metrics.observe('sso_email_send_duration_seconds', (sender,), increments['send_seconds'])
+        if 'failures' in increments:
+            metrics.inc('sso_email_sends_total', (sender, 'failed'))
+
+    def _new_connection(self):
+        connection = get_connection(
+            host=self.config['EMAIL_HOST'],
+            port=self.config['EMAIL_PORT'],
+            username=self.config['EMAIL_HOST_USER'],
+            password=self.config['EMAIL_HOST_PASSWORD'],
+            use_tls=self.config['EMAIL_USE_TLS'],
+            fail_silently=False,
+        )
+        start = time.perf_counter()
+        with profiling.track('smtp', self.config['EMAIL_HOST']):
+            connection.open()
+        self._record(connects=1, connect_seconds=time.perf_counter() - start)
+        return connection
+
+    def _is_healthy(self, connection, idle_for):
+        smtp = getattr(connection, 'connection', None)
+        if smtp is None or idle_for < self.health_check_interval:
+            return True
+        try:
+            return smtp.noop()[0] == 250
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        self._record(discarded=1)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Return an open connection, reusing an idle healthy one when possible."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection, released_at = self._idle.pop()
+            idle_for = time.monotonic() - released_at
+            if idle_for < self.idle_timeout and self._is_healthy(connection, idle_for):
+                return connection
+            self._discard(connection)
+        return self._new_connection()
+
+    def release(self, connection, healthy=True):
+        """Return a connection to the pool; broken or surplus connections are closed."""
+        if healthy:
+            with self._lock:
+                if len(self._idle) < self.max_size:
+                    self._idle.append((connection, time.monotonic()))
+                    return
+        self._discard(connection)
+
+    def send(self, message):
+        """Send an EmailMessage over a pooled connection."""
+        connection = self.acquire()
+        start = time.perf_counter()
+        try:
+            message.connection = connection
+            with profiling.track('smtp', self.config['EMAIL_HOST']):
+                message.send()
+        except Exception:
+            self._record(failures=1)
+            self.release(connection, healthy=False)
+            raise
+        self._record(sends=1, send_seconds=time.perf_counter() - start)
+        self.release(connection)
+
+    def send_many(self, messages):
+        """
+        Send several EmailMessages reusing one connection; a failed message gets
+        its connection replaced and the rest continue. Returns the failed messages.
+        """
+        failed = []
+        connection = None
+        for position, message in enumerate(messages):
+            if connection is None:
+                try:
+                    connection = self.acquire()
+                except Exception as e:
+                    logger.error(f"Could not connect to {self.config['EMAIL_HOST']}: {str(e)}")
+                    return failed + list(messages[position:])
+            start = time.perf_counter()
+            try:
+                message.connection = connection
+                with profiling.track('smtp', self.config['EMAIL_HOST']):
+                    message.send()
+            except Exception as e:
+                logger.error(f"Email to {message.to} via {self.config['EMAIL_HOST_USER']} failed: {str(e)}")
+                self._record(failures=1)
+                failed.append(message)
+                self.release(connection, healthy=False)
+                connection = None
+                continue
+            self._record(sends=1, send_seconds=time.perf_counter() - start)
+        if connection is not None:
+            self.release(connection)
+        return failed
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+
+class CircuitBreaker:
+    """
+    Per-configuration circuit breaker.
+
+    CLOSED: sends go through. After EMAIL_CIRCUIT_FAILURE_THRESHOLD consecutive
+    failures the circuit OPENs and the account is skipped until its recovery
+    timeout passes (doubling, with jitter, every time it re-opens). Then it is
+    HALF_OPEN: one probe send is let through, which closes or re-opens it.
+    Failures reported while OPEN (sends that started before it opened) are ignored.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold, recovery_timeout, max_recovery_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.max_recovery_timeout = max_recovery_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.consecutive_opens = 0
+        self.open_until = 0.0
+        self._probe_in_flight = False
+
+    def is_available(self):
+        """Whether a send could be attempted now (does not claim the half-open probe)."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.time() >= self.open_until
+            return not self._probe_in_flight
+
+    def allow_request(self):
+        """Claim permission to send; in HALF_OPEN only one caller gets through."""
+        with self._lock:
+            if self.state == self.OPEN and time.time() >= self.open_until:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"Email config {self.name} circuit half-open, probing")
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Email config {self.name} circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.consecutive_opens = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                # Sends that started before the circuit opened; it is already backing off
+                return
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.consecutive_opens += 1
+                timeout = min(
+                    self.recovery_timeout * 2 ** (self.consecutive_opens - 1),
+                    self.max_recovery_timeout,
+                )
+                # Jitter so workers don't all probe a recovering account at once
+                timeout *= random.uniform(0.8, 1.2)
+                self.state = self.OPEN
+                self.open_until = time.time() + timeout
+                self._probe_in_flight = False
+                logger.warning(f"Email config {self.name} circuit opened for {timeout:.0f}s after {self.failures} failures")
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'consecutive_opens': self.consecutive_opens,
+                'retry_at': self.open_until if self.state == self.OPEN else None,
+            }
+
+
+class SenderQuota:
+    """
+    Daily sent counts and the rotation cursor, kept in a shared cache
+    (EMAIL_STATE_CACHE_ALIAS) so every worker on every node sees the same numbers.
+    Counts are per SMTP host and login, so one address used with two providers
+    has two quotas. The cache must be shared between processes (accounts/checks.py
+    warns when it is not), or each worker would allow the whole quota.
+
+    A send reserves one message of an account's quota before it goes out and
+    gives it back if the send fails, so concurrent workers cannot push an
+    account past its DAILY_QUOTA.
+    """
+    KEY_PREFIX = 'sso:email'
+    COUNTER_TIMEOUT = 2 * 24 * 3600
+
+    def __init__(self, configs):
+        self.accounts = [f"{config['EMAIL_HOST']}:{config['EMAIL_HOST_USER']}" for config in configs]
+        self.quotas = [config.get('DAILY_QUOTA', 500) for config in configs]
+
+    @property
+    def cache(self):
+        return caches[settings.EMAIL_STATE_CACHE_ALIAS]
+
+    def _key(self, index):
+        return f'{self.KEY_PREFIX}:sent:{self.accounts[index]}:{timezone.now():%Y%m%d}'
+
+    def sent_today(self):
+        keys = [self._key(index) for index in range(len(self.accounts))]
+        counts = self.cache.get_many(keys)
+        return [counts.get(key, 0) for key in keys]
+
+    def remaining(self):
+        return [max(0, quota - sent) for quota, sent in zip(self.quotas, self.sent_today())]
+
+    def reserve(self, index, count=1):
+        """Take up to ``count`` messages of today's quota; returns how many were granted."""
+        key = self._key(index)
+        self.cache.add(key, 0, self.COUNTER_TIMEOUT)
+        try:
+            total = self.cache.incr(key, count)
+        except ValueError:
+            # Evicted between add() and incr()
+            self.cache.set(key, count, self.COUNTER_TIMEOUT)
+            total = count
+        over = max(0, total - self.quotas[index])
+        granted = count - min(over, count)
+        if granted < count:
+            self.release(index, count - granted)
+        return granted
+
+    def release(self, index, count=1):
+        try:
+            self.cache.decr(self._key(index), count)
+        except ValueError:
+            pass
+
+    def rotation_offset(self):
+        """Shared round-robin cursor used to break ties between accounts."""
+        key = f'{self.KEY_PREFIX}:rotation'
+        self.cache.add(key, 0, None)
+        try:
+            return self.cache.incr(key)
+        except ValueError:
+            return 0
+
+
 class EmailSender:
     _instance = None
     _lock = threading.Lock()
@@ -17,38 +319,60 @@ class EmailSender:
             with cls._lock:
                 if not cls._instance:
                     cls._instance = super(EmailSender, cls).__new__(cls)
-                    cls._instance._current_config_index = 0
-                    cls._instance._config_failure_count = [0] * len(settings.EMAIL_CONFIGS)
+                    cls._instance._quota = SenderQuota(settings.EMAIL_CONFIGS)
+                    cls._instance._breakers = [
+                        CircuitBreaker(
+                            config['EMAIL_HOST_USER'],
+                            failure_threshold=settings.EMAIL_CIRCUIT_FAILURE_THRESHOLD,
+                            recovery_timeout=settings.EMAIL_CIRCUIT_RECOVERY_TIMEOUT,
+                            max_recovery_timeout=settings.EMAIL_CIRCUIT_MAX_RECOVERY_TIMEOUT,
+                        )
+                        for config in settings.EMAIL_CONFIGS
+                    ]
+                    cls._instance._pools = [
+                        SMTPConnectionPool(
+                            config,
+                            max_size=settings.EMAIL_POOL_SIZE,
+                            idle_timeout=settings.EMAIL_POOL_IDLE_TIMEOUT,
+                            health_check_interval=settings.EMAIL_POOL_HEALTH_CHECK_INTERVAL,
+                        )
+                        for config in settings.EMAIL_CONFIGS
+                    ]
         return cls._instance
     
-    def _rotate_email_config(self):
+    def _rotate_email_config(self, tried=()):
         """
-        Rotate to the next email configuration in a round-robin manner,
-        with a fallback mechanism for failed configurations.
+        Pick the configuration with the most daily quota left across the whole
+        deployment, skipping ones already tried this round and ones whose circuit
+        is open; ties rotate round-robin. One message of its quota is reserved.
+        Returns the index of the configuration to use, or None if none is usable.
         """
         total_configs = len(settings.EMAIL_CONFIGS)
-        
-        # Find the next available configuration
-        for _ in range(total_configs):
-            self._current_config_index = (self._current_config_index + 1) % total_configs
-            
-            # Reset failure count if it exceeds a threshold
-            if self._config_failure_count[self._current_config_index] > 3:
-                self._config_failure_count[self._current_config_index] = 0
-            
-            # If the configuration hasn't failed too many times, use it
-            if self._config_failure_count[self._current_config_index] < 3:
-                break
-        
-        config = settings.EMAIL_CONFIGS[self._current_config_index]
-        
-        # Update Django's email settings dynamically
-        from django.conf import settings as django_settings
-        django_settings.EMAIL_HOST = config['EMAIL_HOST']
-        django_settings.EMAIL_PORT = config['EMAIL_PORT']
-        django_settings.EMAIL_USE_TLS = config['EMAIL_USE_TLS']
-        django_settings.EMAIL_HOST_USER = config['EMAIL_HOST_USER']
-        django_settings.EMAIL_HOST_PASSWORD = config['EMAIL_HOST_PASSWORD']
+        remaining = self._quota.remaining()
+        offset = self._quota.rotation_offset()
+        candidates = sorted(
+            (index for index in range(total_configs)
+             if index not in tried and remaining[index] > 0 and self._breakers[index].is_available()),
+            key=lambda index: (-remaining[index], (index - offset) % total_configs),
+        )
+        for index in candidates:
+            if not self._quota.reserve(index):
+                continue
+            if self._breakers[index].allow_request():
+                return index
+            self._quota.release(index)
+        return None
+
+    def _backoff(self, attempt, total_configs):
+        """
+        Exponential backoff with full jitter, applied once every configuration
+        has been tried in the current round.
+        """
+        if (attempt + 1) % total_configs:
+            return
+        retry_round = (attempt + 1) // total_configs
+        delay = min(settings.EMAIL_RETRY_BASE_DELAY * 2 ** (retry_round - 1), settings.EMAIL_RETRY_MAX_DELAY)
+        time.sleep(random.uniform(0, delay))
     
     def send_email(self, subject, message, recipient_list, html_message=None, max_attempts=3):
         """
@@ -69,16 +393,23 @@ class EmailSender:
 
         total_configs = len(settings.EMAIL_CONFIGS)
         
+        tried = set()
         for attempt in range(max_attempts * total_configs):
+            # Rotate email configuration for each attempt
+            if len(tried) == total_configs:
+                tried.clear()
+            index = self._rotate_email_config(tried)
+            if index is None:
+                # Fail fast instead of stalling the caller on accounts known to be down or out of quota
+                logger.error(f"Failed to send email to {recipient_list}: every email configuration is unavailable")
+                return False
+            tried.add(index)
             try:
-                # Rotate email configuration for each attempt
-                self._rotate_email_config()
-                
                 # Create email message
                 email = EmailMessage(
                     subject=subject,
                     body=message,
-                    from_email=settings.EMAIL_CONFIGS[self._current_config_index]['EMAIL_HOST_USER'],
+                    from_email=settings.EMAIL_CONFIGS[index]['EMAIL_HOST_USER'],
                     to=recipient_list
                 )
                 
@@ -87,35 +418,123 @@ class EmailSender:
                     email.content_subtype = "html"
                     email.body = html_message
                 
-                # Send the email
-                email.send()
+                # Send the email over a pooled connection for this configuration
+                self._pools[index].send(email)
                 
-                # Reset failure count for this configuration
-                self._config_failure_count[self._current_config_index] = 0
+                self._breakers[index].record_success()
                 
                 logger.info(f"Email sent successfully to {recipient_list}")
                 return True
             
             except Exception as e:
-                # Increment failure count for this configuration
-                self._config_failure_count[self._current_config_index] += 1
+                self._breakers[index].record_failure()
+                self._quota.release(index)
                 
                 logger.error(f"Email send attempt {attempt + 1} failed: {str(e)}")
                 
-                # Add a small delay between attempts to prevent rapid retries
-                time.sleep(2)
-                
                 # If all configurations have been tried multiple times, give up
                 if attempt == (max_attempts * total_configs - 1):
                     logger.error(f"Failed to send email to {recipient_list} after {max_attempts * total_configs} attempts")
                     return False
+                
+                self._backoff(attempt, total_configs)
         
         return False
 
+    def send_batch(self, messages, config_index):
+        """
+        Send prepared EmailMessages from one configuration over a single pooled
+        connection, without retries. Returns the messages that failed.
+        """
+        from_email = settings.EMAIL_CONFIGS[config_index]['EMAIL_HOST_USER']
+        for message in messages:
+            message.from_email = from_email
+
+        granted = self._quota.reserve(config_index, len(messages))
+        if not granted:
+            return list(messages)
+
+        failed = self._pools[config_index].send_many(messages[:granted])
+        if failed:
+            self._quota.release(config_index, len(failed))
+        if len(failed) < granted:
+            self._breakers[config_index].record_success()
+        for _ in failed:
+            self._breakers[config_index].record_failure()
+        # Messages over the account's daily quota were never attempted
+        return failed + list(messages[granted:])
+
+    def available_configs(self):
+        """
+        Remaining daily quota of each configuration whose circuit lets sends
+        through and that has quota left, as ``{index: remaining}``.
+        """
+        remaining = self._quota.remaining()
+        return {
+            index: remaining[index]
+            for index, breaker in enumerate(self._breakers)
+            if breaker.is_available() and remaining[index] > 0
+        }
+
+    def health(self):
+        """Circuit state and today's quota use per configuration, keyed by sender address."""
+        sent_today = self._quota.sent_today()
+        return {
+            breaker.name: dict(
+                breaker.snapshot(),
+                sent_today=sent_today[index],
+                daily_quota=self._quota.quotas[index],
+            )
+            for index, breaker in enumerate(self._breakers)
+        }
+
+    def stats(self):
+        """Connection and send timings per configuration, keyed by sender address."""
+        return {
+            pool.config['EMAIL_HOST_USER']: dict(pool.stats)
+            for pool in self._pools
+        }
+
 # Convenience function for easy email sending
 def send_email(subject, message, recipient_list, html_message=None):
     """
     Convenience wrapper for EmailSender
     """
     email_sender = EmailSender()
-    return email_sender.send_email(subject, message, recipient_list, html_message) 
\ No newline at end of file
+    return email_sender.send_email(subject, message, recipient_list, html_message)
+
+
+def queue_email(subject, message, recipient_list, html_message=None):
+    """
+    Store an email in the outbox for the background worker (`manage.py email_worker`)
+    """
+    queue_emails([(subject, message, recipient_list, html_message)])
+    return True
+
+
+def queue_emails(emails, batch_size=500):
+    """
+    Store many emails in the outbox with bulk inserts; ``emails`` is an iterable of
+    ``(subject, message, recipient_list, html_message)`` tuples. Returns the count.
+    """
+    from .models import OutboundEmail
+
+    created = OutboundEmail.objects.bulk_create([
+        OutboundEmail(
+            subject=subject,
+            body=message,
+            html_body=html_message or '',
+            recipients=list(recipient_list),
+        )
+        for subject, message, recipient_list, html_message in emails
+    ], batch_size=batch_size)
+    return len(created)
+
+
+def send_or_queue_email(subject, message, recipient_list, html_message=None):
+    """
+    Queue the email when EMAIL_OUTBOX_ENABLED is set, otherwise send it inline
+    """
+    if settings.EMAIL_OUTBOX_ENABLED:
+        return queue_email(subject, message, recipient_list, html_message)
+    return send_email(subject, message, recipient_list, html_message)
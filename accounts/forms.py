@@ -48,7 +48,10 @@ class LoginForm(AuthenticationForm):
 class ProjectForm(forms.ModelForm):
     class Meta:
         model = Project
-        fields = ['name', 'description', 'main_url', 'redirect_url', 'logo']
+        fields = ['name', 'description', 'main_url', 'redirect_url', 'logo', 'signed_access_tokens']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
+        }
+        help_texts = {
+            'signed_access_tokens': 'Send a signed token as the accessid that can be verified against /.well-known/jwks.json without calling getuserdata.',
         }
\ No newline at end of file
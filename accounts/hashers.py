@@ -0,0 +1,33 @@
+"""
+Password hashers whose cost comes from settings instead of Django's hard-coded defaults.
+
+They keep Django's algorithm names, so existing hashes keep verifying. Django
+upgrades a stored hash whenever ``must_update`` reports that its cost differs
+from the configured one (or its algorithm is not the preferred one), which
+happens inside ``authenticate()`` on the user's next successful login.
+See ``PASSWORD_HASH_*`` in config/settings.py and
+``python manage.py bench_password_hashers`` for sizing.
+"""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class TunablePBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with PASSWORD_HASH_ITERATIONS rounds (Django's default when unset)."""
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS or hashers.PBKDF2PasswordHasher.iterations
+
+
+class TunableScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """scrypt with a work factor (N) of PASSWORD_HASH_SCRYPT_WORK_FACTOR."""
+
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_HASH_SCRYPT_WORK_FACTOR or hashers.ScryptPasswordHasher.work_factor
+
+    # scrypt needs about 128 * N * r bytes and OpenSSL refuses more than 32 MiB
+    # unless told otherwise; allow up to N = 2 ** 18 (also for verifying hashes
+    # made with a larger work factor than the current one)
+    maxmem = 512 * 1024 * 1024
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from accounts.archive import archive_sessions, ARCHIVED_MODELS
+
+
+class Command(BaseCommand):
+    help = 'Archive LoginSession/SSOSession rows older than the retention window to .jsonl.gz and delete them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.SESSION_RETENTION_DAYS,
+                            help='Keep rows newer than this many days')
+        parser.add_argument('--output-dir', default=settings.SESSION_ARCHIVE_DIR,
+                            help='Directory for the archive files')
+        parser.add_argument('--model', choices=sorted(ARCHIVED_MODELS), action='append',
+                            help='Only archive this model (repeatable, default: all)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows read and deleted per batch')
+        parser.add_argument('--keep', action='store_true',
+                            help='Write the archive but do not delete the rows')
+
+    def handle(self, *args, **options):
+        results = archive_sessions(
+            retention_days=options['days'],
+            output_dir=str(options['output_dir']),
+            models=options['model'] or sorted(ARCHIVED_MODELS),
+            chunk_size=options['chunk_size'],
+            delete=not options['keep'],
+        )
+        for name, path, archived, deleted in results:
+            if path is None:
+                self.stdout.write(f'{name}: nothing older than {options["days"]} days')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: archived {archived} rows to {path}, deleted {deleted}'))
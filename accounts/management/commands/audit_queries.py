@@ -0,0 +1,167 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.core.signals import request_finished
+from django.db import connection, transaction, close_old_connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import Profile, Project, LoginSession, SSOSession, LOGIN_SESSION_LIFETIME, SSO_SESSION_LIFETIME
+from accounts.management.commands.bench_ssocall import bench_host
+from accounts.sweeper import reconcile_active_logins
+from datetime import timedelta
+import json
+import uuid
+
+# Maximum queries per view on the seeded dataset; raise deliberately, never silently
+QUERY_BUDGETS = {
+    'home (anonymous)': 1,
+    'home (anonymous, cached)': 0,
+    'home (logged in)': 4,
+    'project_ssocall': 8,
+    'return_user_data': 3,
+    'return_user_data (cached)': 0,
+    'return_user_data_batch': 1,
+    'confirm_email': 2,
+    'resetpassword': 2,
+    'logout': 10,
+}
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a dataset inside a rolled-back transaction, check per-view query counts '
+        'against budgets and fail if a hot query cannot use an index'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=5000, help='LoginSession/SSOSession rows to seed')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every query plan')
+
+    def handle(self, *args, **options):
+        self.failures = []
+        self.verbose_plans = options['verbose_plans']
+
+        # Client requests would otherwise close the connection and lose the transaction
+        request_finished.disconnect(close_old_connections)
+        try:
+            with transaction.atomic():
+                self.run_audit(options['sessions'])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            request_finished.connect(close_old_connections)
+
+        if self.failures:
+            raise CommandError('Query audit failed:\n  ' + '\n  '.join(self.failures))
+        self.stdout.write(self.style.SUCCESS('Query audit passed'))
+
+    def seed(self, count):
+        suffix = uuid.uuid4().hex[:6]
+        users = User.objects.bulk_create([User(username=f'audit-{suffix}-{i}') for i in range(100)])
+        if users[0].pk is None:
+            users = list(User.objects.filter(username__startswith=f'audit-{suffix}-').order_by('pk'))
+        Profile.objects.bulk_create([
+            Profile(user=user, roll=f'a{suffix}{i}', name='Audit', passing_year=2030, email_verified=True,
+                    verification_token=uuid.uuid4().hex if i % 10 == 0 else '')
+            for i, user in enumerate(users)
+        ])
+        projects = [Project.objects.create(name=f'audit-{suffix}-{i}', redirect_url='https://example.com/cb',
+                                           is_verified=True) for i in range(10)]
+
+        old = timezone.now() - LOGIN_SESSION_LIFETIME - timedelta(days=1)
+        LoginSession.objects.bulk_create([
+            LoginSession(user=users[i % len(users)], project=projects[i % len(projects)],
+                         sessionkey=f'audit-{suffix}-{i}', active=i % 5 == 0)
+            for i in range(count)
+        ], batch_size=1000)
+        SSOSession.objects.bulk_create([
+            SSOSession(user=users[i % len(users)], device='audit', session_key=f'{suffix}{i}', active=i % 5 == 0)
+            for i in range(count)
+        ], batch_size=1000)
+        # Most history is old
+        LoginSession.objects.filter(sessionkey__startswith=f'audit-{suffix}-').exclude(active=True).update(created_at=old)
+        SSOSession.objects.filter(session_key__startswith=suffix).exclude(active=True).update(created_at=old)
+
+        reconcile_active_logins()
+        return users, projects
+
+    def run_audit(self, count):
+        users, projects = self.seed(count)
+        user, project = users[0], projects[0]
+        profile = Profile.objects.get(user=user)
+        Profile.objects.filter(pk=profile.pk).update(reset_token='audit-reset')
+        session = LoginSession.objects.filter(project=project, active=True).first()
+        sso_session = SSOSession.objects.filter(user=user).first()
+        verify_token = Profile.objects.exclude(verification_token='').values_list('verification_token', flat=True)[0]
+
+        self.check_plans([
+            ('getuserdata session lookup', LoginSession.objects.filter(sessionkey=session.sessionkey)),
+            ('active sessions of a project', LoginSession.objects.filter(project=project, active=True)),
+            ('active sessions of a user', LoginSession.objects.filter(user=user, active=True)),
+            ('stale login sessions', LoginSession.objects.filter(
+                active=True, created_at__lt=timezone.now() - LOGIN_SESSION_LIFETIME)),
+            ('old login sessions', LoginSession.objects.filter(created_at__lt=timezone.now() - timedelta(hours=12))),
+            ('home recent SSO sessions', SSOSession.objects.filter(user=user).order_by('-created_at')[:5]),
+            ('logout SSO session', SSOSession.objects.filter(user=user, session_key=sso_session.session_key)),
+            ('stale SSO sessions', SSOSession.objects.filter(
+                active=True, created_at__lt=timezone.now() - SSO_SESSION_LIFETIME)),
+            ('verification token', Profile.objects.filter(verification_token=verify_token)),
+            ('reset token', Profile.objects.filter(reset_token='audit-reset')),
+        ])
+
+        host = bench_host()
+        anonymous = Client(HTTP_HOST=host)
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+
+        self.check_view('home (anonymous)', anonymous.get, reverse('home'))
+        self.check_view('home (anonymous, cached)', anonymous.get, reverse('home'))
+        self.check_view('home (logged in)', client.get, reverse('home'))
+        self.check_view('project_ssocall', client.get, reverse('project_ssocall', kwargs={'id': project.id}))
+        self.check_view('return_user_data', anonymous.post, reverse('return_user_data'),
+                        data=json.dumps({'id': session.sessionkey}), content_type='application/json')
+        self.check_view('return_user_data (cached)', anonymous.post, reverse('return_user_data'),
+                        data=json.dumps({'id': session.sessionkey}), content_type='application/json')
+        batch = list(LoginSession.objects.filter(project=project, active=True).values_list('sessionkey', flat=True)[1:21])
+        self.check_view('return_user_data_batch', anonymous.post, reverse('return_user_data_batch'),
+                        data=json.dumps({'ids': batch}), content_type='application/json')
+        self.check_view('confirm_email', anonymous.get, reverse('confirm_email', kwargs={'token': verify_token}))
+        self.check_view('resetpassword', anonymous.get, reverse('resetpassword', kwargs={'token': 'audit-reset'}))
+        self.check_view('logout', client.get, reverse('logout'), HTTP_USER_AGENT='audit')
+
+    def check_view(self, name, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = method(url, secure=True, **kwargs)
+        count = len(queries)
+        budget = QUERY_BUDGETS[name]
+        status = 'ok' if count <= budget else 'OVER BUDGET'
+        self.stdout.write(f'{name:<28} {response.status_code}  {count:>3} queries (budget {budget}) {status}')
+        if count > budget:
+            self.failures.append(f'{name}: {count} queries, budget is {budget}')
+
+    def check_plans(self, hot_queries):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(
+                f'Skipping query plan checks: {connection.vendor} plans are not representative of production'
+            ))
+            return
+
+        with connection.cursor() as cursor:
+            # With sequential scans priced out, a Seq Scan in the plan means no index can serve the query
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for name, queryset in hot_queries:
+            plan = queryset.explain()
+            uses_seq_scan = 'Seq Scan' in plan
+            self.stdout.write(f'{name:<32} {"SEQ SCAN" if uses_seq_scan else "index"}')
+            if self.verbose_plans or uses_seq_scan:
+                self.stdout.write(plan)
+            if uses_seq_scan:
+                self.failures.append(f'{name}: sequential scan')
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = on')
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from accounts.models import Project
+from accounts.thumbnails import is_current, refresh_project_thumbnails
+from accounts import catalog
+
+
+class Command(BaseCommand):
+    help = 'Generate the WebP/PNG logo thumbnails of projects that are missing them or have outdated ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Regenerate the thumbnails of every project with a logo')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only list the projects that would be processed')
+
+    def handle(self, *args, **options):
+        projects = Project.objects.exclude(logo='').exclude(logo__isnull=True).order_by('created_at')
+        refreshed = failed = 0
+        for project in projects.iterator(chunk_size=100):
+            if is_current(project) and not options['force']:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'{project}: {project.logo.name}')
+                continue
+            refresh_project_thumbnails(project, force=True)
+            if project.logo_thumbnails:
+                refreshed += 1
+            else:
+                failed += 1
+                self.stderr.write(f'{project}: could not read {project.logo.name}')
+
+        if refreshed:
+            catalog.invalidate()
+        self.stdout.write(self.style.SUCCESS(f'Generated thumbnails for {refreshed} projects ({failed} failed)'))
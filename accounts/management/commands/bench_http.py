@@ -0,0 +1,132 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from accounts.models import Profile, Project, LoginSession, SSOSession
+from accounts.management.commands.bench_ssocall import add_live_database_argument, check_live_database, percentile
+import requests
+import threading
+import time
+import uuid
+
+SCENARIOS = ('getuserdata', 'ssocall', 'login')
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test a running server (gunicorn sync workers or an ASGI server with '
+        'SSO_ASYNC_VIEWS=True) and report requests/sec and latency percentiles per endpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Base URL of the running server, e.g. http://127.0.0.1:8000')
+        parser.add_argument('--scenario', choices=SCENARIOS, action='append',
+                            help='Endpoint to load (repeatable; default: all)')
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent clients')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run each scenario')
+        parser.add_argument('--host', help='Host header to send (default: the server URL host)')
+        add_live_database_argument(parser)
+
+    def handle(self, *args, **options):
+        check_live_database(options)
+        self.base_url = options['url'].rstrip('/')
+        self.headers = {'User-Agent': 'bench_http'}
+        if options['host']:
+            self.headers['Host'] = options['host']
+
+        # The benchmark talks to the server's database directly to seed its data,
+        # so it must run with the same settings as the server
+        suffix = uuid.uuid4().hex[:8]
+        self.password = uuid.uuid4().hex
+        self.user = User.objects.create_user(username=f'http-{suffix}', password=self.password)
+        Profile.objects.create(user=self.user, roll=f'h{suffix}', name='Benchmark User',
+                               passing_year=2030, email_verified=True)
+        self.project = Project.objects.create(name=f'http-{suffix}', redirect_url='https://example.com/callback',
+                                              is_verified=True)
+        self.session = LoginSession.objects.create(sessionkey=f'http-{suffix}', user=self.user, project=self.project)
+        self.session_cookie = self.logged_in_session()
+
+        try:
+            self.stdout.write(f"{'scenario':<12} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}  statuses")
+            for scenario in options['scenario'] or SCENARIOS:
+                self.run_scenario(scenario, options['concurrency'], options['duration'])
+        finally:
+            # Server-side sessions: the ssocall one and one per successful login
+            login_sessions = SSOSession.objects.filter(user=self.user).values_list('session_key', flat=True)
+            self.delete_sessions([self.session_cookie, *login_sessions])
+            self.user.delete()
+            self.project.delete()
+
+    def logged_in_session(self):
+        """Create a server-side session for the benchmark user, as Client.force_login does."""
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store[SESSION_KEY] = str(self.user.pk)
+        store[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        store[HASH_SESSION_KEY] = self.user.get_session_auth_hash()
+        store.save()
+        return store.session_key
+
+    def delete_sessions(self, session_keys):
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        for session_key in session_keys:
+            if session_key:
+                store.delete(session_key)
+
+    def new_client(self, scenario):
+        client = requests.Session()
+        client.headers.update(self.headers)
+        if scenario == 'ssocall':
+            client.cookies.set(settings.SESSION_COOKIE_NAME, self.session_cookie)
+        return client
+
+    def request(self, client, scenario):
+        if scenario == 'getuserdata':
+            return client.post(f"{self.base_url}{reverse('return_user_data')}", json={'id': self.session.sessionkey})
+        if scenario == 'ssocall':
+            return client.get(f"{self.base_url}{reverse('project_ssocall', kwargs={'id': self.project.id})}",
+                              allow_redirects=False)
+
+        # login: fetch the form for a CSRF cookie, then post credentials
+        client.cookies.clear()
+        url = f"{self.base_url}{reverse('login')}"
+        form = client.get(url)
+        # CSRF_COOKIE_SECURE cookies are not sent back over plain HTTP, so set it explicitly
+        token = form.cookies.get(settings.CSRF_COOKIE_NAME, '')
+        client.cookies.set(settings.CSRF_COOKIE_NAME, token)
+        return client.post(url, data={
+            'username': self.user.username, 'password': self.password, 'csrfmiddlewaretoken': token,
+        }, headers={'Referer': url}, allow_redirects=False)
+
+    def run_scenario(self, scenario, concurrency, duration):
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+        deadline = time.monotonic() + duration
+
+        def worker(_):
+            client = self.new_client(scenario)
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    code = self.request(client, scenario).status_code
+                except requests.RequestException as e:
+                    code = type(e).__name__
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[code] = statuses.get(code, 0) + 1
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(worker, range(concurrency)))
+        wall = time.monotonic() - started
+
+        if not latencies:
+            raise CommandError(f'No {scenario} requests completed; is the server running at {self.base_url}?')
+        self.stdout.write(
+            f'{scenario:<12} {len(latencies):>9} {len(latencies) / wall:>9.1f} '
+            f'{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f}  {statuses}'
+        )
@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password, PBKDF2PasswordHasher, ScryptPasswordHasher
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from concurrent.futures import ProcessPoolExecutor
+import time
+
+PASSWORD = 'correct horse battery staple'
+
+# Tunable hasher and the setting holding its cost (see accounts/hashers.py)
+TUNABLE_HASHERS = {
+    'pbkdf2_sha256': ('accounts.hashers.TunablePBKDF2PasswordHasher', 'PASSWORD_HASH_ITERATIONS'),
+    'scrypt': ('accounts.hashers.TunableScryptPasswordHasher', 'PASSWORD_HASH_SCRYPT_WORK_FACTOR'),
+}
+
+
+def hasher_settings(algorithm, cost):
+    """Settings that make ``algorithm`` the preferred hasher at ``cost``."""
+    path, cost_setting = TUNABLE_HASHERS[algorithm]
+    return {
+        'PASSWORD_HASHERS': [path] + [other for other in settings.PASSWORD_HASHERS if other != path],
+        cost_setting: cost,
+    }
+
+
+def measure(algorithm, cost, duration):
+    """Verify one password hash repeatedly for ``duration`` seconds; returns (checks, seconds)."""
+    with override_settings(**hasher_settings(algorithm, cost)):
+        encoded = make_password(PASSWORD)
+        checks = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            if not check_password(PASSWORD, encoded):
+                raise RuntimeError(f'{algorithm} failed to verify its own hash')
+            checks += 1
+        return checks, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure password verifications per second (the CPU cost of a login POST) for '
+        'each hasher setting, per worker process, to size PASSWORD_HASH_* and hardware'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=sorted(TUNABLE_HASHERS), action='append',
+                            help='Hasher to measure (repeatable; default: pbkdf2_sha256)')
+        parser.add_argument('--iterations', type=int, nargs='+',
+                            default=[PBKDF2PasswordHasher.iterations // 4, PBKDF2PasswordHasher.iterations // 2,
+                                     PBKDF2PasswordHasher.iterations],
+                            help='PBKDF2 iteration counts to compare')
+        parser.add_argument('--work-factor', type=int, nargs='+',
+                            default=[ScryptPasswordHasher.work_factor, ScryptPasswordHasher.work_factor * 2],
+                            help='scrypt work factors (N, a power of two) to compare')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes hashing at once, as many as web workers per host')
+        parser.add_argument('--duration', type=float, default=3, help='Seconds to measure each setting')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1:
+            raise CommandError('--workers must be at least 1')
+
+        current = {
+            'pbkdf2_sha256': settings.PASSWORD_HASH_ITERATIONS or PBKDF2PasswordHasher.iterations,
+            'scrypt': settings.PASSWORD_HASH_SCRYPT_WORK_FACTOR or ScryptPasswordHasher.work_factor,
+        }
+        costs = {'pbkdf2_sha256': options['iterations'], 'scrypt': options['work_factor']}
+
+        self.stdout.write(f'{workers} worker process(es), {options["duration"]:g}s per setting')
+        self.stdout.write(f"{'algorithm':<14} {'cost':>9} {'ms/login':>9} {'logins/s/worker':>16} {'logins/s total':>15}")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for algorithm in options['algorithm'] or ['pbkdf2_sha256']:
+                for cost in costs[algorithm]:
+                    results = list(executor.map(
+                        measure, [algorithm] * workers, [cost] * workers, [options['duration']] * workers
+                    ))
+                    total = sum(checks / seconds for checks, seconds in results)
+                    marker = '  (current)' if algorithm == settings.PASSWORD_HASH_ALGORITHM and cost == current[algorithm] else ''
+                    self.stdout.write(
+                        f'{algorithm:<14} {cost:>9} {1000 * workers / total:>9.1f} '
+                        f'{total / workers:>16.1f} {total:>15.1f}{marker}'
+                    )
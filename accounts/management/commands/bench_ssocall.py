@@ -0,0 +1,127 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from concurrent.futures import ThreadPoolExecutor
+from accounts.models import Profile, Project, LoginSession
+import statistics
+import threading
+import time
+import uuid
+
+
+def bench_host():
+    """Pick a host that passes ALLOWED_HOSTS validation."""
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+def add_live_database_argument(parser):
+    parser.add_argument('--allow-live-database', action='store_true',
+                        help='Run even with DEBUG off; the benchmark creates (and afterwards deletes) '
+                             'a user, a project and their sessions in the configured database')
+
+
+def check_live_database(options):
+    """
+    The benchmarks load real servers and threads through the configured database, so
+    they cannot run inside a rolled-back transaction. Refuse to touch what may be the
+    production database unless asked to.
+    """
+    if not settings.DEBUG and not options['allow_live_database']:
+        raise CommandError(
+            f"DEBUG is off, so '{connection.settings_dict['NAME']}' may be a live database; this benchmark "
+            f"writes to it. Point it at a scratch database or pass --allow-live-database."
+        )
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark project_ssocall latency under concurrent same-user/same-project bursts '
+        'and check that Project.active_logins stays exact'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent clients')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per client')
+        parser.add_argument('--unverified', action='store_true', help='Benchmark against an unverified project')
+        parser.add_argument('--logout-every', type=int, default=0,
+                            help='Log out (deactivating all sessions) every N requests per client')
+        add_live_database_argument(parser)
+
+    def handle(self, *args, **options):
+        check_live_database(options)
+        suffix = uuid.uuid4().hex[:8]
+        user = User.objects.create_user(username=f'bench-{suffix}', password=uuid.uuid4().hex)
+        Profile.objects.create(user=user, roll=f'b{suffix}', name='Benchmark User', passing_year=2030, email_verified=True)
+        project = Project.objects.create(
+            name=f'bench-{suffix}',
+            redirect_url='https://example.com/callback',
+            is_verified=not options['unverified'],
+        )
+
+        url = reverse('project_ssocall', kwargs={'id': project.id})
+        logout_url = reverse('logout')
+        logout_every = options['logout_every']
+        host = bench_host()
+        latencies = []
+        statuses = {}
+        lock = threading.Lock()
+
+        def worker(_):
+            client = Client(HTTP_HOST=host)
+            client.force_login(user)
+            local_latencies = []
+            local_statuses = {}
+            try:
+                for i in range(1, options['requests'] + 1):
+                    start = time.perf_counter()
+                    response = client.get(url, secure=True)
+                    local_latencies.append(time.perf_counter() - start)
+                    local_statuses[response.status_code] = local_statuses.get(response.status_code, 0) + 1
+                    if logout_every and i % logout_every == 0:
+                        client.get(logout_url, secure=True, HTTP_USER_AGENT='bench_ssocall')
+                        client.force_login(user)
+            finally:
+                # Delete the server-side session
+                client.logout()
+                connection.close()
+            with lock:
+                latencies.extend(local_latencies)
+                for code, count in local_statuses.items():
+                    statuses[code] = statuses.get(code, 0) + count
+
+        try:
+            wall_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                list(executor.map(worker, range(options['threads'])))
+            wall = time.perf_counter() - wall_start
+
+            project.refresh_from_db(fields=['active_logins'])
+            counter = project.active_logins
+            actual = LoginSession.objects.filter(project=project, active=True).count()
+        finally:
+            project.delete()
+            user.delete()
+
+        self.stdout.write(f"Requests:   {len(latencies)} ({options['threads']} threads)")
+        self.stdout.write(f'Statuses:   {statuses}')
+        self.stdout.write(f'Throughput: {len(latencies) / wall:.1f} req/s')
+        self.stdout.write(f'Mean:       {statistics.mean(latencies) * 1000:.2f} ms')
+        for pct in (50, 95, 99):
+            self.stdout.write(f'p{pct}:        {percentile(latencies, pct) * 1000:.2f} ms')
+        self.stdout.write(f'Max:        {max(latencies) * 1000:.2f} ms')
+        self.stdout.write(f'active_logins: {counter} (active sessions: {actual})')
+
+        if counter != actual:
+            raise CommandError(f'active_logins drifted: counter is {counter} but {actual} sessions are active')
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from accounts.outbox import process_batch
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the outbox with retries and dead-lettering'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Emails sent in parallel')
+        parser.add_argument('--batch-size', type=int, default=20, help='Emails claimed per batch')
+        parser.add_argument('--poll-interval', type=float, default=5, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain due emails and exit')
+
+    def handle(self, *args, **options):
+        if not settings.EMAIL_OUTBOX_ENABLED:
+            self.stdout.write(self.style.WARNING('EMAIL_OUTBOX_ENABLED is off; views are sending emails inline.'))
+
+        while True:
+            try:
+                claimed, sent = process_batch(options['batch_size'], options['concurrency'])
+            except Exception as e:
+                logger.error(f'Email worker error: {str(e)}')
+                self.stdout.write(self.style.ERROR(f'Error: {str(e)}'))
+                claimed = sent = 0
+                if options['once']:
+                    raise
+
+            if claimed:
+                self.stdout.write(f'Sent {sent}/{claimed} emails')
+                continue
+            if options['once']:
+                break
+            close_old_connections()
+            time.sleep(options['poll_interval'])
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from accounts.sweeper import sweep
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Expire stale LoginSession/SSOSession rows and reconcile Project.active_logins'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Sessions deactivated per UPDATE')
+        parser.add_argument('--no-reconcile', action='store_true', help='Skip recomputing active_logins')
+        parser.add_argument('--interval', type=int, default=0, help='Keep running, sweeping every N seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                expired_logins, expired_sso, corrected = sweep(
+                    batch_size=options['batch_size'],
+                    reconcile=not options['no_reconcile'],
+                )
+                self.stdout.write(self.style.SUCCESS(
+                    f'Expired {expired_logins} login sessions and {expired_sso} SSO sessions, '
+                    f'corrected {corrected} project counters'
+                ))
+            except Exception as e:
+                logger.error(f'Error sweeping sessions: {str(e)}')
+                self.stdout.write(self.style.ERROR(f'Error: {str(e)}'))
+                if not options['interval']:
+                    raise
+
+            if not options['interval']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from accounts.exports import EXPORTS, FORMATS, parse_boundary, stream_export
+import gzip
+import sys
+
+
+class Command(BaseCommand):
+    help = 'Stream profiles, projects or session history to CSV or JSONL with flat memory use'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=sorted(EXPORTS), help='What to export')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--since', help='Only rows from this ISO date/datetime on')
+        parser.add_argument('--until', help='Only rows up to this ISO date/datetime (whole day for a date)')
+        parser.add_argument('--output', '-o', help='File to write (gzipped if it ends in .gz; default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_boundary(options['since'])
+            until = parse_boundary(options['until'], end=True)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = stream_export(options['name'], options['format'], since, until, options['chunk_size'])
+        output = options['output']
+        if not output:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            return
+
+        opener = gzip.open if output.endswith('.gz') else open
+        with opener(output, 'wt', encoding='utf-8', newline='') as export_file:
+            for chunk in chunks:
+                export_file.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported {options['name']} to {output}"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+import os
+
+
+class Command(BaseCommand):
+    help = 'Generate an Ed25519 private key for signing access tokens'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Where to write the PEM encoded private key')
+        parser.add_argument('--force', action='store_true', help='Overwrite an existing key file')
+
+    def handle(self, *args, **options):
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+        from cryptography.hazmat.primitives import serialization
+
+        path = options['path']
+        if os.path.exists(path) and not options['force']:
+            raise CommandError(f'{path} already exists, use --force to overwrite it')
+
+        key = Ed25519PrivateKey.generate()
+        pem = key.private_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PrivateFormat.PKCS8,
+            encryption_algorithm=serialization.NoEncryption(),
+        )
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as key_file:
+            key_file.write(pem)
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote signing key to {path}'))
+        self.stdout.write('Set SSO_TOKEN_SIGNING_KEY_FILE to this path to enable signed access tokens.')
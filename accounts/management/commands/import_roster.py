@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts.roster import import_roster, read_roster
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        'Create accounts for a roster of students from a CSV or JSONL file (optionally .gz) '
+        'and queue their verification emails. Columns: roll, name, passing_year and optionally '
+        'department, degree, email, password'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Roster file (.csv, .jsonl, optionally gzipped)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Override the format implied by the extension')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows inserted per batch')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Processes hashing passwords')
+        parser.add_argument('--no-email', action='store_true', help='Do not queue verification emails')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the roster without creating anything')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['path']):
+            raise CommandError(f"No such file: {options['path']}")
+
+        def report(line_number, message):
+            self.stderr.write(f'line {line_number}: {message}')
+
+        start = time.monotonic()
+        counts = import_roster(
+            read_roster(options['path'], options['format']),
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            send_verification=not options['no_email'],
+            dry_run=options['dry_run'],
+            on_error=report,
+        )
+        elapsed = time.monotonic() - start
+
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {counts['created']} accounts in {elapsed:.1f}s; {counts['existing']} already registered, "
+            f"{counts['invalid']} invalid rows, {counts['queued']} verification emails queued"
+        ))
+        if counts['queued'] and not settings.EMAIL_OUTBOX_ENABLED:
+            self.stdout.write(self.style.WARNING(
+                'Queued emails are only sent by `python manage.py email_worker`; make sure one is running'
+            ))
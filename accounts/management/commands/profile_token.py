@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from accounts.profiling import PROFILE_HEADER, make_profile_token
+
+
+class Command(BaseCommand):
+    help = 'Print a signed X-SSO-Profile header; requests that send it log a detailed profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Staff user the profiles are requested by')
+        parser.add_argument('--max-age', type=int, default=settings.SSO_PROFILE_TOKEN_MAX_AGE,
+                            help='Seconds the header stays valid (at most SSO_PROFILE_TOKEN_MAX_AGE)')
+
+    def handle(self, *args, **options):
+        if not User.objects.filter(username=options['username'], is_active=True, is_staff=True).exists():
+            raise CommandError(f"No active staff user {options['username']!r}")
+        max_age = min(options['max_age'], settings.SSO_PROFILE_TOKEN_MAX_AGE)
+        token = make_profile_token(options['username'], max_age)
+        self.stdout.write(f'{PROFILE_HEADER}: {token}')
+        self.stderr.write(self.style.SUCCESS(f"Valid for {max_age} seconds"))
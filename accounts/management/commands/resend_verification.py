@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.management.base import BaseCommand, CommandError
+from accounts.email_utils import EmailSender
+from accounts.models import Profile
+from accounts.utils import build_verification_email
+import json
+import logging
+import os
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Pace sends to at most ``rate`` messages per second (0 disables the limit)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_allowed = time.monotonic()
+
+    def wait(self):
+        """Block until the next message may go out."""
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_allowed > now:
+            time.sleep(self.next_allowed - now)
+        self.next_allowed = max(now, self.next_allowed) + self.interval
+
+
+class Command(BaseCommand):
+    help = 'Re-send verification emails to every unverified profile in resumable, rate-limited batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=200, help='Profiles loaded and re-tokened per batch')
+        parser.add_argument('--rate', type=float, default=5, help='Maximum emails per second (0 for no limit)')
+        parser.add_argument('--checkpoint', default='resend_verification.checkpoint.json',
+                            help='File recording progress; rerunning retries failed profiles, then resumes '
+                                 'after the last finished batch')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the profiles that would be emailed')
+
+    def load_checkpoint(self, path, restart):
+        if restart or not os.path.exists(path):
+            return {'last_pk': 0, 'sent': 0, 'failed': []}
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def save_checkpoint(self, path, state):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as checkpoint_file:
+            json.dump(state, checkpoint_file)
+        os.replace(tmp_path, path)
+
+    def handle(self, *args, **options):
+        if not settings.EMAIL_CONFIGS or not settings.EMAIL_CONFIGS[0]['EMAIL_HOST_USER']:
+            raise CommandError('No email configuration is set up')
+
+        state = self.load_checkpoint(options['checkpoint'], options['restart'])
+        unverified = Profile.objects.filter(email_verified=False)
+        pending = unverified.filter(pk__gt=state['last_pk'])
+        # Profiles whose email failed in an earlier run are retried first, once per run
+        retry = state['failed']
+        state['failed'] = []
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"{pending.count()} unverified profiles after pk {state['last_pk']}, "
+                f"{unverified.filter(pk__in=retry).count()} to retry"
+            )
+            return
+
+        sender = EmailSender()
+        limiter = RateLimiter(options['rate'])
+        chunk_size = options['chunk_size']
+
+        while True:
+            configs = sender.available_configs()
+            if not configs:
+                if not retry and not pending.filter(pk__gt=state['last_pk']).exists():
+                    break
+                raise CommandError(
+                    f"Every email configuration is unavailable or out of daily quota; "
+                    f"rerun later to resume after pk {state['last_pk']}"
+                )
+
+            # Never load more profiles than the sender accounts can still send today
+            limit = min(chunk_size, sum(configs.values()))
+            if retry:
+                batch_pks, retry = retry[:limit], retry[limit:]
+                # Ones verified since then are skipped
+                profiles = list(unverified.filter(pk__in=batch_pks).select_related('user').order_by('pk'))
+            else:
+                profiles = list(pending.filter(pk__gt=state['last_pk']).select_related('user').order_by('pk')[:limit])
+                if not profiles:
+                    break
+                state['last_pk'] = profiles[-1].pk
+
+            # Mint all tokens for the batch in one UPDATE
+            for profile in profiles:
+                profile.verification_token = str(uuid.uuid4())
+            Profile.objects.bulk_update(profiles, ['verification_token'])
+
+            messages = []
+            for profile in profiles:
+                subject, message, html_message = build_verification_email(profile.user, profile.verification_token)
+                email = EmailMessage(subject=subject, body=html_message, to=[profile.user.email])
+                email.content_subtype = 'html'
+                email.profile_pk = profile.pk
+                messages.append(email)
+
+            # Spread the batch across the healthy sender accounts, giving each account
+            # no more than its remaining quota; the pool reuses one connection per
+            # account while the limiter spaces out the individual messages
+            failed = []
+            start = 0
+            for index, remaining in sorted(configs.items(), key=lambda item: -item[1]):
+                share = messages[start:start + remaining]
+                if not share:
+                    break
+                start += len(share)
+                for message in share:
+                    limiter.wait()
+                    failed.extend(sender.send_batch([message], index))
+
+            state['sent'] += len(messages) - len(failed)
+            state['failed'].extend(message.profile_pk for message in failed)
+            # Retries not reached yet stay in the checkpoint for the next run
+            self.save_checkpoint(options['checkpoint'], dict(state, failed=retry + state['failed']))
+            self.stdout.write(f"Sent {len(messages) - len(failed)}/{len(messages)} (up to pk {state['last_pk']})")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {state['sent']} sent, {len(state['failed'])} failed"
+            + (f" (profile pks in {options['checkpoint']})" if state['failed'] else '')
+        ))
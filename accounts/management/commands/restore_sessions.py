@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from accounts.archive import restore_archive
+
+
+class Command(BaseCommand):
+    help = 'Restore session rows from archive files written by archive_sessions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='.jsonl.gz archive files')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows inserted per batch')
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            restored, skipped = restore_archive(path, chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'{path}: restored {restored} rows, skipped {skipped}'))
@@ -0,0 +1,260 @@
+"""
+Prometheus metrics for the SSO endpoints, logins, email delivery and caches.
+
+Recording a sample only updates a dict in this process under a lock. A daemon
+thread, started by the first sample in each process, adds the accumulated
+increments every SSO_METRICS_FLUSH_INTERVAL seconds (and at exit) to counters in
+the SSO_METRICS_CACHE_ALIAS cache, pipelined into one round trip on Redis, so
+requests (and the event loop under ASGI) never wait on the cache. Only when that
+is a shared backend such as Redis do every gunicorn worker and the email worker
+add to the same totals, which then survive worker restarts; with the default
+locmem cache each process exports its own counts, and a system check
+(accounts/checks.py) warns about it. ``render()`` reads all series with one
+``get_many`` and adds gauges that are read from the database at scrape time. Series are enumerated from known label values (views in SSO_METRICS_VIEWS,
+existing projects, EMAIL_CONFIGS senders), so nothing else is exported.
+
+Served at ``/metrics`` (see ``views.metrics``).
+"""
+import atexit
+import bisect
+import logging
+import os
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'sso:metrics'
+# Histogram sums are stored as integers in millionths
+SUM_SCALE = 1_000_000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SMTP_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STATUS_CLASSES = ('2xx', '3xx', '4xx', '5xx')
+CACHE_OUTCOMES = {'hits': 'hit', 'misses': 'miss', 'uncacheable': 'uncacheable'}
+
+# name: (type, help, {label: values or the name of a dynamic source}, histogram buckets)
+METRICS = {
+    'sso_requests_total': (
+        'counter', 'Requests to the instrumented views by response status class',
+        {'view': 'views', 'status': STATUS_CLASSES}, None,
+    ),
+    'sso_request_duration_seconds': (
+        'histogram', 'Request latency of the instrumented views, including middleware',
+        {'view': 'views'}, LATENCY_BUCKETS,
+    ),
+    'sso_request_db_queries': (
+        'histogram', 'Database queries per request of the instrumented views',
+        {'view': 'views'}, QUERY_BUCKETS,
+    ),
+    'sso_logins_total': (
+        'counter', 'SSO logins into projects: access IDs issued, or refused because the project was full',
+        {'project': 'projects', 'outcome': ('issued', 'refused')}, None,
+    ),
+    'sso_password_logins_total': (
+        'counter', 'Password login attempts by outcome',
+        {'outcome': ('success', 'invalid', 'unverified', 'error')}, None,
+    ),
+    'sso_email_sends_total': (
+        'counter', 'Emails handed to SMTP per sender account by outcome',
+        {'sender': 'senders', 'outcome': ('sent', 'failed')}, None,
+    ),
+    'sso_email_send_duration_seconds': (
+        'histogram', 'SMTP time of successful sends per sender account',
+        {'sender': 'senders'}, SMTP_BUCKETS,
+    ),
+    'sso_cache_requests_total': (
+        'counter', 'Cache lookups by cache and outcome',
+        {'cache': ('page', 'userdata', 'media_url'), 'outcome': tuple(CACHE_OUTCOMES.values())}, None,
+    ),
+}
+
+_lock = threading.Lock()
+_pending = defaultdict(int)
+_flusher_pid = None
+
+
+def _cache():
+    return caches[settings.SSO_METRICS_CACHE_ALIAS]
+
+
+def _key(name, labels, suffix):
+    return f"{KEY_PREFIX}:{name}:{'|'.join(labels)}:{suffix}"
+
+
+def _add(increments):
+    global _flusher_pid
+    with _lock:
+        for series, value in increments.items():
+            _pending[series] += value
+        if _flusher_pid != os.getpid():
+            # First sample in this process (workers fork after import)
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True).start()
+
+
+def _flush_periodically():
+    stop = threading.Event()
+    while not stop.wait(settings.SSO_METRICS_FLUSH_INTERVAL):
+        flush()
+
+
+def inc(name, labels=(), value=1):
+    """Add ``value`` to a counter; ``labels`` are the label values in METRICS order."""
+    _add({(name, labels, ''): value})
+
+
+def record_cache_lookup(cache, outcome):
+    """Count a lookup in one of the caches' own ``hits``/``misses``/``uncacheable`` terms."""
+    inc('sso_cache_requests_total', (cache, CACHE_OUTCOMES[outcome]))
+
+
+def observe(name, labels, value):
+    """Record one histogram sample."""
+    buckets = METRICS[name][3]
+    increments = {(name, labels, 'count'): 1, (name, labels, 'sum'): round(value * SUM_SCALE)}
+    index = bisect.bisect_left(buckets, value)
+    if index < len(buckets):
+        increments[(name, labels, f'le{index}')] = 1
+    _add(increments)
+
+
+def _incr_many(cache, increments):
+    """Add each value to its counter, in one pipelined round trip on Redis."""
+    if isinstance(cache, RedisCache):
+        # Django's Redis backend has no bulk incr; INCRBY creates missing keys
+        # without expiry, and the backend reads plain integers back as ints
+        client = cache._cache.get_client(write=True)
+        with client.pipeline(transaction=False) as pipeline:
+            for key, value in increments.items():
+                pipeline.incrby(cache.make_and_validate_key(key), value)
+            pipeline.execute()
+        return
+    for key, value in increments.items():
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            # First increment of this series
+            if not cache.add(key, value, None):
+                cache.incr(key, value)
+
+
+def flush():
+    """Add this process's pending increments to the shared counters."""
+    global _pending
+    with _lock:
+        pending, _pending = _pending, defaultdict(int)
+    increments = {_key(*series): value for series, value in pending.items() if value}
+    if not increments:
+        return
+    try:
+        _incr_many(_cache(), increments)
+    except Exception:
+        logger.exception("Could not flush metrics to the shared cache")
+
+
+atexit.register(flush)
+
+
+def _label_sources(projects):
+    return {
+        'views': list(settings.SSO_METRICS_VIEWS),
+        'projects': [str(pk) for pk, *_ in projects],
+        'senders': [config['EMAIL_HOST_USER'] for config in settings.EMAIL_CONFIGS],
+    }
+
+
+def _combinations(labels, sources):
+    combinations = [()]
+    for values in labels.values():
+        values = sources[values] if isinstance(values, str) else values
+        combinations = [combination + (value,) for combination in combinations for value in values]
+    return combinations
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _gauges(projects):
+    """(name, help, [(label pairs, value)]) read at scrape time."""
+    from .email_utils import EmailSender
+    from .models import LoginSession, OutboundEmail, SSOSession
+
+    health = EmailSender().health()
+    return [
+        ('sso_project_info', 'Project names and verification status, to join on the project label',
+         [((('project', pk), ('name', name or ''), ('verified', str(verified).lower())), 1)
+          for pk, name, verified, _ in projects]),
+        ('sso_project_active_logins', 'Logins currently counted against each project',
+         [((('project', pk),), active) for pk, _, _, active in projects]),
+        ('sso_active_login_sessions', 'Active project login sessions',
+         [((), LoginSession.objects.filter(active=True).count())]),
+        ('sso_active_sso_sessions', 'Active browser sessions',
+         [((), SSOSession.objects.filter(active=True).count())]),
+        ('sso_email_outbox_pending', 'Queued emails waiting for the email worker',
+         [((), OutboundEmail.objects.filter(status=OutboundEmail.PENDING).count())]),
+        ('sso_email_sent_today', 'Emails sent today per sender account',
+         [((('sender', sender),), state['sent_today']) for sender, state in health.items()]),
+        ('sso_email_daily_quota', 'Daily quota per sender account',
+         [((('sender', sender),), state['daily_quota']) for sender, state in health.items()]),
+    ]
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    from .models import Project
+
+    flush()
+    projects = list(Project.objects.values_list('pk', 'name', 'is_verified', 'active_logins'))
+    sources = _label_sources(projects)
+
+    series = []
+    for name, (kind, _, labels, buckets) in METRICS.items():
+        suffixes = [''] if kind == 'counter' else [f'le{i}' for i in range(len(buckets))] + ['count', 'sum']
+        for values in _combinations(labels, sources):
+            series.extend((name, values, suffix) for suffix in suffixes)
+    stored = _cache().get_many([_key(*item) for item in series])
+
+    def value(name, values, suffix):
+        return stored.get(_key(name, values, suffix), 0)
+
+    lines = []
+    for name, (kind, help, labels, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} {kind}')
+        for values in _combinations(labels, sources):
+            pairs = list(zip(labels, values))
+            if kind == 'counter':
+                lines.append(f'{name}{_format_labels(pairs)} {value(name, values, "")}')
+                continue
+            cumulative = 0
+            for index, bound in enumerate(buckets):
+                cumulative += value(name, values, f'le{index}')
+                lines.append(f'{name}_bucket{_format_labels(pairs + [("le", bound)])} {cumulative}')
+            count = value(name, values, 'count')
+            lines.append(f'{name}_bucket{_format_labels(pairs + [("le", "+Inf")])} {count}')
+            lines.append(f'{name}_sum{_format_labels(pairs)} {_format_value(value(name, values, "sum") / SUM_SCALE)}')
+            lines.append(f'{name}_count{_format_labels(pairs)} {count}')
+
+    for name, help, samples in _gauges(projects):
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} gauge')
+        for pairs, sample in samples:
+            lines.append(f'{name}{_format_labels(pairs)} {sample}')
+    return '\n'.join(lines) + '\n'
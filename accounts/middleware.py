@@ -0,0 +1,201 @@
+import hashlib
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from . import catalog, metrics
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'uncacheable': 0}
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+    metrics.record_cache_lookup('page', outcome)
+
+
+def get_page_cache_stats():
+    """
+    Page cache counters for this process; ``uncacheable`` counts the misses whose
+    response could not be stored.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / lookups if lookups else 0.0
+    return stats
+
+
+class AnonymousPageCacheMiddleware:
+    """
+    Full-page cache for anonymous GETs of the pages in SSO_PAGE_CACHE_URL_NAMES.
+
+    Only requests without a session or messages cookie or a query string are
+    looked up (any query string would otherwise get its own entry), and a
+    response is only stored if rendering it did not touch anything per-visitor:
+    no CSRF token was issued, the session was not written, no messages were added
+    and no cookie was set. Pages with forms (login, register) therefore stay
+    uncached. Cached pages carry an ETag, ``Cache-Control: public`` and ``Vary:
+    Cookie`` so a CDN or reverse proxy in front can serve repeats as well. Keys
+    include the project catalog version, so a project change refreshes the home
+    page. Both the catalog version and SSO_PAGE_CACHE_ALIAS must live in a cache
+    shared by all workers for that to reach every worker (accounts/checks.py).
+
+    Must come after the session, auth and messages middleware. Runs natively
+    under both WSGI and ASGI, using the async cache API in the latter.
+    """
+    KEY_PREFIX = 'sso:pagecache'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.is_candidate(request):
+            return self.get_response(request)
+
+        key = self.cache_key(request, catalog.get_version())
+        cache = caches[settings.SSO_PAGE_CACHE_ALIAS]
+        entry = cache.get(key)
+        if entry is not None:
+            _record('hits')
+            return self.build_response(request, entry)
+
+        _record('misses')
+        response = self.get_response(request)
+        if request.method != 'GET' or not self.is_cacheable(request, response) or request.user.is_authenticated:
+            _record('uncacheable')
+            return response
+
+        entry = self.make_entry(response)
+        cache.set(key, entry, settings.SSO_PAGE_CACHE_TIMEOUT)
+        return self.build_response(request, entry)
+
+    async def __acall__(self, request):
+        if not self.is_candidate(request):
+            return await self.get_response(request)
+
+        key = self.cache_key(request, await catalog.aget_version())
+        cache = caches[settings.SSO_PAGE_CACHE_ALIAS]
+        entry = await cache.aget(key)
+        if entry is not None:
+            _record('hits')
+            return self.build_response(request, entry)
+
+        _record('misses')
+        response = await self.get_response(request)
+        if (request.method != 'GET' or not self.is_cacheable(request, response)
+                or (await request.auser()).is_authenticated):
+            _record('uncacheable')
+            return response
+
+        entry = self.make_entry(response)
+        await cache.aset(key, entry, settings.SSO_PAGE_CACHE_TIMEOUT)
+        return self.build_response(request, entry)
+
+    def is_candidate(self, request):
+        if not settings.SSO_PAGE_CACHE_TIMEOUT or request.method not in ('GET', 'HEAD'):
+            return False
+        if request.META.get('QUERY_STRING'):
+            return False
+        if settings.SESSION_COOKIE_NAME in request.COOKIES or CookieStorage.cookie_name in request.COOKIES:
+            return False
+        try:
+            url_name = resolve(request.path_info).url_name
+        except Resolver404:
+            return False
+        return url_name in settings.SSO_PAGE_CACHE_URL_NAMES
+
+    def is_cacheable(self, request, response):
+        # The caller also checks that the visitor is anonymous
+        if response.status_code != 200 or response.streaming or response.cookies:
+            return False
+        if request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+            return False
+        session = getattr(request, 'session', None)
+        if session is not None and session.modified:
+            return False
+        storage = getattr(request, '_messages', None)
+        return storage is None or not storage.added_new
+
+    def cache_key(self, request, catalog_version):
+        return f'{self.KEY_PREFIX}:{catalog_version}:{request.scheme}:{request.get_host()}:{request.path}'
+
+    def make_entry(self, response):
+        content = response.content
+        return {
+            'content': content,
+            'content_type': response['Content-Type'],
+            'etag': f'"{hashlib.md5(content).hexdigest()}"',
+        }
+
+    def build_response(self, request, entry):
+        response = get_conditional_response(request, etag=entry['etag'])
+        if response is None:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        patch_cache_control(response, public=True, max_age=settings.SSO_PAGE_CACHE_MAX_AGE)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+
+def _view_name(match):
+    # DRF's @api_view and class-based views wrap the function in a class
+    view = getattr(match.func, 'cls', None) or getattr(match.func, 'view_class', None) or match.func
+    return view.__name__
+
+
+class MetricsMiddleware:
+    """
+    Records latency, status and database query count of the views named in
+    SSO_METRICS_VIEWS (accounts/metrics.py). Goes first, so the latency includes
+    the other middleware; the query count comes from ProfilingMiddleware
+    (accounts/profiling.py), which must follow it. Runs natively under both
+    WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, start)
+        return response
+
+    def record(self, request, response, start):
+        match = request.resolver_match
+        view = _view_name(match) if match else None
+        if view in settings.SSO_METRICS_VIEWS:
+            metrics.inc('sso_requests_total', (view, f'{response.status_code // 100}xx'))
+            metrics.observe('sso_request_duration_seconds', (view,), time.perf_counter() - start)
+            profile = getattr(request, 'profile', None)
+            if profile is not None:
+                metrics.observe('sso_request_db_queries', (view,), profile.queries)
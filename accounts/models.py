@@ -1,9 +1,23 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
 import uuid
+from collections import Counter
 from django.utils import timezone
+from django.utils.functional import cached_property
 from datetime import timedelta
-from minio_storage.storage import MinioMediaStorage
+from . import thumbnails, userdata_cache
+from .storage import CachedMinioMediaStorage
+
+# How long an access ID handed to a project stays valid
+LOGIN_SESSION_LIFETIME = timedelta(hours=1)
+
+# How long an SSOSession is shown as active
+SSO_SESSION_LIFETIME = timedelta(hours=1)
+
+# Active login cap for projects that have not been verified yet
+UNVERIFIED_PROJECT_LOGIN_LIMIT = 10
 
 class Profile(models.Model):
     """
@@ -70,6 +84,15 @@ class Profile(models.Model):
     verification_token = models.CharField(max_length=100, blank=True)
     reset_token = models.CharField(max_length=100, blank=True)
 
+    class Meta:
+        indexes = [
+            # Token lookups in confirm_email / resetpassword; most rows have no token
+            models.Index(fields=['verification_token'], condition=~models.Q(verification_token=''),
+                         name='profile_verify_token_idx'),
+            models.Index(fields=['reset_token'], condition=~models.Q(reset_token=''),
+                         name='profile_reset_token_idx'),
+        ]
+
     def __str__(self):
         """Return the roll number as a string representation."""
         return self.roll
@@ -85,25 +108,57 @@ class Project(models.Model):
     - redirect_url: The URL where users are redirected after logging in.
     - description: A short description of the project.
     - logo: An image representing the project (e.g., a logo).
+    - logo_thumbnails: Resized variants of the logo (see accounts/thumbnails.py).
+    - signed_access_tokens: Hand the project a signed token instead of an opaque access ID.
     """
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=100, null=True, blank=True)
     description = models.TextField(null=True, blank=True)
     main_url = models.URLField(null=True, blank=True)
     redirect_url = models.URLField(null=True, blank=True)
-    logo = models.ImageField(upload_to='project_logos/', storage=MinioMediaStorage(), null=True, blank=True)
+    logo = models.ImageField(upload_to='project_logos/', storage=CachedMinioMediaStorage(), null=True, blank=True)
+    logo_thumbnails = models.JSONField(default=dict, blank=True, editable=False)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     is_verified = models.BooleanField(default=False)
     active_logins = models.IntegerField(default=0)
+    signed_access_tokens = models.BooleanField(default=False)
 
     def __str__(self):
         return self.name or str(self.id)
 
+    @cached_property
+    def logo_variants(self):
+        """``srcset`` values for the logo thumbnails; empty until they are generated."""
+        return thumbnails.logo_variants(self.logo_thumbnails)
+
+    def save(self, *args, **kwargs):
+        # active_logins is only ever changed with atomic UPDATEs; writing back the
+        # in-memory value here would overwrite concurrent increments.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'active_logins'
+            ]
+        super().save(*args, **kwargs)
+
     def can_accept_new_login(self):
         if self.is_verified:
             return True
-        return self.active_logins < 10
+        return self.active_logins < UNVERIFIED_PROJECT_LOGIN_LIMIT
+
+    def reserve_login(self):
+        """
+        Atomically count a new login against this project.
+        Returns False (and changes nothing) if an unverified project is at its limit.
+        """
+        reserved = Project.objects.filter(
+            models.Q(is_verified=True) | models.Q(active_logins__lt=UNVERIFIED_PROJECT_LOGIN_LIMIT),
+            pk=self.pk,
+        ).update(active_logins=F('active_logins') + 1)
+        if reserved:
+            self.active_logins += 1
+        return bool(reserved)
 
     
 class SSOSession(models.Model):
@@ -127,14 +182,52 @@ class SSOSession(models.Model):
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Recent sessions on the home page
+            models.Index(fields=['user', '-created_at'], name='ssosession_user_created_idx'),
+            # Logout
+            models.Index(fields=['user', 'session_key'], name='ssosession_user_key_idx'),
+            # Sweeper and retention
+            models.Index(fields=['created_at'], condition=models.Q(active=True), name='ssosession_stale_idx'),
+            models.Index(fields=['created_at'], name='ssosession_created_idx'),
+        ]
+
     def is_session_valid(self):
-        if timezone.now() <= self.created_at + timedelta(hours=1):
+        if timezone.now() <= self.created_at + SSO_SESSION_LIFETIME:
             return True
         else:
             self.active = False
             self.save()
             return False
     
+def release_project_logins(project_id, count=1):
+    """Atomically give back a project's active logins, never going below zero."""
+    Project.objects.filter(pk=project_id).update(active_logins=Greatest(F('active_logins') - count, 0))
+
+
+class LoginSessionQuerySet(models.QuerySet):
+    def deactivate(self):
+        """
+        Mark the active sessions in this queryset inactive and release their
+        projects' active logins in one UPDATE per project.
+        Returns the number of sessions deactivated.
+        """
+        with transaction.atomic():
+            rows = list(
+                self.filter(active=True).order_by('pk').select_for_update()
+                .values_list('pk', 'project_id', 'sessionkey')
+            )
+            if not rows:
+                return 0
+            LoginSession.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(active=False)
+            for project_id, count in Counter(project_id for _, project_id, _ in rows).items():
+                release_project_logins(project_id, count)
+
+        userdata_cache.invalidate_sessions([sessionkey for _, _, sessionkey in rows])
+        return len(rows)
+
+
 class LoginSession(models.Model):
     """
     This model tracks login sessions for users for specific Project.
@@ -154,37 +247,91 @@ class LoginSession(models.Model):
     active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LoginSessionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Active sessions of a project (limits, project_details, per-project expiry)
+            models.Index(fields=['project', 'created_at'], condition=models.Q(active=True),
+                         name='loginsession_active_proj_idx'),
+            # Logout deactivates a user's active sessions
+            models.Index(fields=['user'], condition=models.Q(active=True), name='loginsession_active_user_idx'),
+            # Sweeper and retention
+            models.Index(fields=['created_at'], condition=models.Q(active=True), name='loginsession_stale_idx'),
+            models.Index(fields=['created_at'], name='loginsession_created_idx'),
+        ]
+
+    @property
+    def expires_at(self):
+        return self.created_at + LOGIN_SESSION_LIFETIME
+
     def is_session_valid(self):
         """
         Check if the session is still valid (valid for 1 hour after creation).
         Returns True if the current time is within 1 hour of session creation, otherwise False.
         """
-        is_valid = timezone.now() <= self.created_at + timedelta(hours=1)
+        is_valid = timezone.now() <= self.expires_at
         if not is_valid and self.active:
-            self.active = False
-            self.save()
-            # Decrement the project's active_logins counter
-            if self.project:
-                self.project.active_logins = max(0, self.project.active_logins - 1)
-                self.project.save()
+            self.deactivate()
         return is_valid
-        
+
+    def deactivate(self):
+        """Deactivate this session and release its project's active login."""
+        LoginSession.objects.filter(pk=self.pk).deactivate()
+        self.active = False
+
     def save(self, *args, **kwargs):
-        # If this is a new session being created
-        if not self.pk and self.active:
-            # No need to increment here as it's handled in the view
-            pass
-        # If this is an existing session being deactivated
-        elif self.pk and not self.active:
-            # Get the current state in the database
-            try:
-                original = LoginSession.objects.get(pk=self.pk)
-                # Only decrement if the session was previously active
-                if original.active and not self.active:
-                    # Decrement the project's active_logins counter
-                    if self.project:
-                        self.project.active_logins = max(0, self.project.active_logins - 1)
-                        self.project.save()
-            except LoginSession.DoesNotExist:
-                pass  # This should not happen, but just in case
+        # An existing session being deactivated: flip it with a conditional UPDATE so
+        # the project's counter is released exactly once, however many saves race.
+        if self.pk and not self.active:
+            if LoginSession.objects.filter(pk=self.pk, active=True).update(active=False):
+                release_project_logins(self.project_id)
         super().save(*args, **kwargs)
+
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting in the outbox for the background worker (`manage.py email_worker`).
+
+    Fields:
+    - subject, body, html_body, recipients: The message itself.
+    - status: pending -> sending -> sent, or dead after too many failed attempts.
+    - attempts: How many times the worker has tried to send it.
+    - next_attempt_at: When the worker may pick it up next (used for retry backoff).
+    - claimed_at: When a worker last claimed it; stale claims are retried.
+    - last_error: Why the last attempt failed.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # The worker's claim query
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='pending'),
+                         name='outbox_pending_idx'),
+            models.Index(fields=['claimed_at'], condition=models.Q(status='sending'),
+                         name='outbox_sending_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {", ".join(self.recipients)}'
@@ -0,0 +1,95 @@
+"""
+Persistent email outbox.
+
+Views queue messages with ``email_utils.queue_email`` and return immediately;
+``python manage.py email_worker`` claims pending rows with ``SKIP LOCKED`` (so
+several workers can run side by side), sends them with ``EmailSender``, retries
+failures with exponential backoff and dead-letters messages that keep failing.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .email_utils import EmailSender
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# A claim older than this is assumed to belong to a worker that died mid-send
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+
+def claim_batch(limit):
+    """Atomically move up to ``limit`` due messages to SENDING and return them."""
+    now = timezone.now()
+    due = OutboundEmail.objects.filter(
+        Q(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+        | Q(status=OutboundEmail.SENDING, claimed_at__lt=now - CLAIM_TIMEOUT)
+    ).order_by('next_attempt_at')
+
+    with transaction.atomic():
+        ids = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+        OutboundEmail.objects.filter(pk__in=ids).update(
+            status=OutboundEmail.SENDING, claimed_at=now, attempts=F('attempts') + 1
+        )
+    return list(OutboundEmail.objects.filter(pk__in=ids))
+
+
+def retry_delay(attempts):
+    """Exponential backoff: base, 2x base, 4x base, ... capped at one day."""
+    return timedelta(seconds=min(settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), 86400))
+
+
+def deliver(message):
+    """Send one claimed message and record the outcome. Returns True on success."""
+    try:
+        sent = EmailSender().send_email(
+            message.subject, message.body, message.recipients,
+            html_message=message.html_body or None, max_attempts=1,
+        )
+        error = '' if sent else 'All email configurations failed'
+    except Exception as e:
+        sent, error = False, str(e)
+
+    now = timezone.now()
+    if sent:
+        OutboundEmail.objects.filter(pk=message.pk).update(status=OutboundEmail.SENT, sent_at=now, last_error='')
+    elif message.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        logger.error(f"Giving up on email {message.pk} to {message.recipients} after {message.attempts} attempts: {error}")
+        OutboundEmail.objects.filter(pk=message.pk).update(status=OutboundEmail.DEAD, last_error=error)
+    else:
+        OutboundEmail.objects.filter(pk=message.pk).update(
+            status=OutboundEmail.PENDING,
+            next_attempt_at=now + retry_delay(message.attempts),
+            last_error=error,
+        )
+    return sent
+
+
+def _deliver_and_close(message):
+    try:
+        return deliver(message)
+    finally:
+        connection.close()
+
+
+def process_batch(batch_size, concurrency):
+    """Claim and send one batch. Returns ``(claimed, sent)``."""
+    messages = claim_batch(batch_size)
+    if not messages:
+        return 0, 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(_deliver_and_close, messages))
+    return len(messages), sum(results)
+
+
+def requeue(queryset):
+    """Put messages (typically dead letters) back in the queue with a fresh attempt budget."""
+    return queryset.exclude(status=OutboundEmail.SENT).update(
+        status=OutboundEmail.PENDING, attempts=0, next_attempt_at=timezone.now(), last_error=''
+    )
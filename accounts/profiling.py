@@ -0,0 +1,326 @@
+"""
+Per-request profiling: query count and database time, template render time and
+time spent in SMTP and MinIO calls.
+
+ProfilingMiddleware starts a RequestProfile for every request and makes it the
+current one (a context variable, so it follows the request into ``sync_to_async``
+threads). Queries are timed by an execute wrapper installed on every database
+connection as it is created, which adds them to the current profile; templates by the
+ProfiledDjangoTemplates backend, and email_utils and storage wrap their network
+calls in ``track('smtp')``/``track('minio')``. Requests slower than
+SSO_SLOW_REQUEST_MS and queries slower than SSO_SLOW_QUERY_MS are logged as JSON
+to the ``accounts.profiling`` logger. Template time includes any queries the
+template runs, so the two can overlap.
+
+Staff can ask for a detailed profile of a single request without turning on
+DEBUG by sending the signed ``X-SSO-Profile`` header from ``python manage.py
+profile_token`` or ``/staff/profile-token/``. It expires after
+SSO_PROFILE_TOKEN_MAX_AGE seconds and stops working as soon as its user is no
+longer active staff. That request also runs under
+cProfile. Its queries (without parameters), template renders, external calls and
+hottest functions are logged, and a ``Server-Timing`` header summarises it for
+the browser's dev tools. Under ASGI the middleware runs natively and skips
+cProfile, which would profile every task on the event loop, so there the log has
+no functions.
+"""
+import cProfile
+import json
+import logging
+import pstats
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-SSO-Profile'
+PROFILE_SALT = 'accounts.profiling'
+EXTERNAL_KINDS = ('smtp', 'minio')
+# Limits on what a detailed profile logs
+MAX_LOGGED_QUERIES = 50
+MAX_LOGGED_FUNCTIONS = 30
+MAX_SQL_LENGTH = 2000
+
+_current = ContextVar('sso_request_profile', default=None)
+
+
+def make_profile_token(username, max_age=None):
+    """
+    Signed value for the X-SSO-Profile header, valid for ``max_age`` seconds and
+    never longer than SSO_PROFILE_TOKEN_MAX_AGE.
+    """
+    max_age = min(max_age or settings.SSO_PROFILE_TOKEN_MAX_AGE, settings.SSO_PROFILE_TOKEN_MAX_AGE)
+    return signing.dumps({'by': username, 'exp': int(time.time()) + max_age}, salt=PROFILE_SALT)
+
+
+def _token_username(value):
+    try:
+        payload = signing.loads(value, salt=PROFILE_SALT)
+    except signing.BadSignature:
+        return None
+    if not isinstance(payload, dict) or payload.get('exp', 0) < time.time():
+        return None
+    return payload.get('by')
+
+
+def _profiling_staff(username):
+    return User.objects.filter(username=username, is_active=True, is_staff=True)
+
+
+def check_profile_token(value):
+    """
+    The username a profile token was issued to, or None if it is invalid or
+    expired, or that user is no longer active staff.
+    """
+    username = _token_username(value)
+    if username is None or not _profiling_staff(username).exists():
+        return None
+    return username
+
+
+async def acheck_profile_token(value):
+    """``check_profile_token()`` for async code."""
+    username = _token_username(value)
+    if username is None or not await _profiling_staff(username).aexists():
+        return None
+    return username
+
+
+class RequestProfile:
+    """What one request spent its time on."""
+
+    def __init__(self, requested_by=None):
+        self.requested_by = requested_by
+        self.detailed = requested_by is not None
+        self.duration = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.timings = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.slow_queries = []
+        self.query_log = []
+        self.call_log = []
+        self._active = set()
+        self._slow_query_seconds = settings.SSO_SLOW_QUERY_MS / 1000
+
+    def execute(self, execute, sql, params, many, context):
+        """Database execute wrapper timing every query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_seconds += elapsed
+            if self._slow_query_seconds and elapsed >= self._slow_query_seconds:
+                self.slow_queries.append((sql, elapsed))
+            if self.detailed:
+                self.query_log.append((sql, elapsed))
+
+    def summary(self, request, response):
+        match = request.resolver_match
+        kwargs = match.kwargs if match else {}
+        # Tokens in URLs (confirm-email, reset-password) are credentials: log the route instead
+        secret = any('token' in key for key in kwargs)
+        summary = {
+            'method': request.method,
+            'path': f'/{match.route}' if secret else request.path,
+            'view': match.view_name if match else None,
+            'url_kwargs': {key: str(value) for key, value in kwargs.items() if 'token' not in key},
+            'status': response.status_code,
+            'duration_ms': round(self.duration * 1000, 2),
+            'queries': self.queries,
+            'db_ms': round(self.db_seconds * 1000, 2),
+            'template_ms': round(self.timings['template'] * 1000, 2),
+        }
+        for kind in EXTERNAL_KINDS:
+            summary[f'{kind}_ms'] = round(self.timings[kind] * 1000, 2)
+            summary[f'{kind}_calls'] = self.calls[kind]
+        return summary
+
+    def server_timing(self):
+        """``Server-Timing`` header value (milliseconds)."""
+        entries = [f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries"']
+        for kind in ('template',) + EXTERNAL_KINDS:
+            entries.append(f'{kind};dur={self.timings[kind] * 1000:.2f}')
+        entries.append(f'total;dur={self.duration * 1000:.2f}')
+        return ', '.join(entries)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Database execute wrapper adding the query to the current request's profile."""
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    return profile.execute(execute, sql, params, many, context)
+
+
+def install_execute_wrapper(connection):
+    # Connections are per thread, so async views' queries run on a connection
+    # other than the event loop's; a permanent wrapper catches them all
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+@contextmanager
+def track(kind, label=''):
+    """Add the time spent in the block to ``kind`` in the current request's profile."""
+    profile = _current.get()
+    if profile is None or kind in profile._active:
+        # Not in a request, or nested in a call already being timed
+        yield
+        return
+    profile._active.add(kind)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        profile._active.discard(kind)
+        profile.timings[kind] += elapsed
+        profile.calls[kind] += 1
+        if profile.detailed:
+            profile.call_log.append((kind, label, elapsed))
+
+
+class ProfiledTemplate(Template):
+    def render(self, context=None, request=None):
+        with track('template', self.origin.template_name):
+            return super().render(context, request)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each render for the request profile."""
+
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _hottest_functions(profiler):
+    stats = pstats.Stats(profiler)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    functions = []
+    for function in stats.fcn_list[:MAX_LOGGED_FUNCTIONS]:
+        _, calls, own, cumulative, _ = stats.stats[function]
+        functions.append({
+            'function': pstats.func_std_string(function),
+            'calls': calls,
+            'own_ms': round(own * 1000, 2),
+            'cumulative_ms': round(cumulative * 1000, 2),
+        })
+    return functions
+
+
+class ProfilingMiddleware:
+    """
+    Profiles every request (see the module docstring). Goes right after
+    MetricsMiddleware, which takes its query counts from ``request.profile``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        header = request.headers.get(PROFILE_HEADER)
+        profile = RequestProfile(check_profile_token(header) if header else None)
+        request.profile = profile
+        profiler = cProfile.Profile() if profile.detailed else None
+
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            profile.duration = time.perf_counter() - start
+            _current.reset(token)
+
+        self.report(request, response, profile, profiler)
+        return response
+
+    async def __acall__(self, request):
+        header = request.headers.get(PROFILE_HEADER)
+        profile = RequestProfile(await acheck_profile_token(header) if header else None)
+        request.profile = profile
+
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.duration = time.perf_counter() - start
+            _current.reset(token)
+
+        self.report(request, response, profile, None)
+        return response
+
+    def report(self, request, response, profile, profiler):
+        if not (profile.detailed or profile.slow_queries or
+                profile.duration * 1000 >= settings.SSO_SLOW_REQUEST_MS > 0):
+            return
+        summary = profile.summary(request, response)
+
+        for sql, elapsed in profile.slow_queries:
+            logger.warning(json.dumps({
+                'event': 'slow_query',
+                'path': summary['path'],
+                'view': summary['view'],
+                'ms': round(elapsed * 1000, 2),
+                'sql': sql[:MAX_SQL_LENGTH],
+            }))
+
+        if settings.SSO_SLOW_REQUEST_MS and profile.duration * 1000 >= settings.SSO_SLOW_REQUEST_MS:
+            logger.warning(json.dumps({'event': 'slow_request', **summary}))
+
+        if profile.detailed:
+            profile_id = uuid.uuid4().hex
+            queries = sorted(profile.query_log, key=lambda query: query[1], reverse=True)
+            repeated = Counter(sql for sql, _ in profile.query_log)
+            logger.warning(json.dumps({
+                'event': 'profile',
+                'id': profile_id,
+                'requested_by': profile.requested_by,
+                **summary,
+                'queries_by_time': [
+                    {'ms': round(elapsed * 1000, 2), 'sql': sql[:MAX_SQL_LENGTH]}
+                    for sql, elapsed in queries[:MAX_LOGGED_QUERIES]
+                ],
+                'repeated_queries': [
+                    {'count': count, 'sql': sql[:MAX_SQL_LENGTH]}
+                    for sql, count in repeated.most_common() if count > 1
+                ],
+                'timed_calls': [
+                    {'kind': kind, 'target': label, 'ms': round(elapsed * 1000, 2)}
+                    for kind, label, elapsed in profile.call_log
+                ],
+                'functions': _hottest_functions(profiler) if profiler is not None else [],
+            }))
+            response['Server-Timing'] = profile.server_timing()
+            response[f'{PROFILE_HEADER}-Id'] = profile_id
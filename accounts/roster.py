@@ -0,0 +1,177 @@
+"""
+Bulk onboarding of students from a roster file.
+
+Rows are streamed from CSV or JSONL (optionally gzipped) and processed in chunks:
+initial passwords are hashed in a process pool, Users and Profiles are inserted
+with ``bulk_create`` and verification emails are queued in the outbox for
+``python manage.py email_worker``. Only one chunk is held in memory at a time.
+"""
+import csv
+import gzip
+import io
+import json
+import logging
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .archive import _chunks
+from .email_utils import queue_emails
+from .models import Profile
+from .utils import build_verification_email
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_FIELDS = ('roll', 'name', 'passing_year')
+DEPARTMENTS = {code for code, _ in Profile.DEPARTMENT_CHOICES}
+DEGREES = {code for code, _ in Profile.DEGREE_CHOICES}
+
+
+class RosterError(ValueError):
+    """A roster row that cannot be imported."""
+
+
+def read_roster(path, format=None):
+    """
+    Yield ``(line_number, row_dict)`` from a CSV (with a header row) or JSONL file.
+    The format is taken from the extension unless given; ``.gz`` files are decompressed.
+    """
+    name = path[:-3] if path.endswith('.gz') else path
+    format = format or ('csv' if name.endswith('.csv') else 'jsonl')
+    opener = gzip.open if path.endswith('.gz') else io.open
+
+    with opener(path, 'rt', encoding='utf-8', newline='') as roster_file:
+        if format == 'csv':
+            reader = csv.DictReader(roster_file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(roster_file, 1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError:
+                        yield line_number, None
+
+
+def clean_row(row):
+    """Validate and normalise one roster row. Raises RosterError."""
+    if not isinstance(row, dict):
+        raise RosterError('not a JSON object')
+    row = {key.strip().lower(): (value.strip() if isinstance(value, str) else value)
+           for key, value in row.items() if key}
+
+    missing = [field for field in REQUIRED_FIELDS if not row.get(field)]
+    if missing:
+        raise RosterError(f"missing {', '.join(missing)}")
+
+    roll = str(row['roll'])
+    if len(roll) > Profile._meta.get_field('roll').max_length:
+        raise RosterError(f'roll {roll!r} is too long')
+    try:
+        passing_year = int(row['passing_year'])
+    except (TypeError, ValueError):
+        raise RosterError(f"passing_year {row['passing_year']!r} is not a number")
+
+    department = row.get('department') or 'CE'
+    degree = row.get('degree') or 'B.Tech'
+    if department not in DEPARTMENTS:
+        raise RosterError(f'unknown department {department!r}')
+    if degree not in DEGREES:
+        raise RosterError(f'unknown degree {degree!r}')
+
+    return {
+        'roll': roll,
+        'name': str(row['name'])[:100],
+        'passing_year': passing_year,
+        'department': department,
+        'degree': degree,
+        'email': row.get('email') or f'{roll}@iitb.ac.in',
+        'password': row.get('password') or None,
+    }
+
+
+def import_roster(rows, chunk_size=500, workers=None, send_verification=True, dry_run=False, on_error=None):
+    """
+    Create Users and Profiles for roster rows (``(line_number, row)`` pairs) that
+    are not registered yet. Returns a dict of counts: created, existing, invalid, queued.
+
+    ``on_error(line_number, message)`` is called for each rejected row.
+    """
+    counts = {'created': 0, 'existing': 0, 'invalid': 0, 'queued': 0}
+
+    def reject(line_number, message):
+        counts['invalid'] += 1
+        if on_error:
+            on_error(line_number, message)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in _chunks(rows, chunk_size):
+            students = {}
+            for line_number, row in chunk:
+                try:
+                    student = clean_row(row)
+                except RosterError as e:
+                    reject(line_number, str(e))
+                    continue
+                if student['roll'] in students:
+                    reject(line_number, f"duplicate roll {student['roll']}")
+                    continue
+                students[student['roll']] = student
+
+            existing = set(User.objects.filter(username__in=students).values_list('username', flat=True))
+            existing |= set(Profile.objects.filter(roll__in=students).values_list('roll', flat=True))
+            counts['existing'] += len(existing)
+            new = [student for roll, student in students.items() if roll not in existing]
+            if dry_run:
+                # Report what would be created
+                counts['created'] += len(new)
+            elif new:
+                counts['created'] += _create_chunk(new, executor, send_verification)
+                counts['queued'] += len(new) if send_verification else 0
+    return counts
+
+
+def _create_chunk(students, executor, send_verification):
+    # Rows without an initial password get an unusable one (set it via "forgot password")
+    passwords = [student['password'] for student in students]
+    to_hash = [password for password in passwords if password]
+    hashed = iter(executor.map(make_password, to_hash, chunksize=max(1, len(to_hash) // 32)))
+    password_hashes = [next(hashed) if password else make_password(None) for password in passwords]
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=student['roll'], email=student['email'], password=password_hash)
+            for student, password_hash in zip(students, password_hashes)
+        ])
+        if users and users[0].pk is None:
+            # Backends without RETURNING support
+            by_username = User.objects.in_bulk([student['roll'] for student in students], field_name='username')
+            users = [by_username[student['roll']] for student in students]
+
+        profiles = Profile.objects.bulk_create([
+            Profile(
+                user=user,
+                roll=student['roll'],
+                name=student['name'],
+                department=student['department'],
+                passing_year=student['passing_year'],
+                degree=student['degree'],
+                verification_token=str(uuid.uuid4()) if send_verification else '',
+            )
+            for user, student in zip(users, students)
+        ])
+
+        if send_verification:
+            queue_emails(_verification_emails(users, profiles))
+    logger.info(f"Imported {len(users)} students from roster")
+    return len(users)
+
+
+def _verification_emails(users, profiles):
+    for user, profile in zip(users, profiles):
+        subject, message, html_message = build_verification_email(user, profile.verification_token)
+        yield subject, message, [user.email], html_message
@@ -0,0 +1,74 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.core.signals import setting_changed
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Profile, Project, LoginSession
+from . import access_ids, catalog, profiling, thumbnails, tokens, userdata_cache
+
+
+@receiver(setting_changed)
+def reset_access_id_generator(sender, setting, **kwargs):
+    """The generator is built once; rebuild it when tests override the setting."""
+    if setting == 'SSO_ACCESS_ID_GENERATOR':
+        access_ids.get_access_id_generator.cache_clear()
+
+
+@receiver(setting_changed)
+def reset_token_keys(sender, setting, **kwargs):
+    """The signing and verification keys are loaded once; reload them when the key files change."""
+    if setting in ('SSO_TOKEN_SIGNING_KEY_FILE', 'SSO_TOKEN_PUBLIC_KEY_FILES'):
+        tokens.get_signing_key.cache_clear()
+        tokens.get_verification_keys.cache_clear()
+
+
+@receiver(connection_created)
+def profile_connection_queries(sender, connection, **kwargs):
+    """Time every query for the request profile (accounts/profiling.py)."""
+    profiling.install_execute_wrapper(connection)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def invalidate_profile_user_data(sender, instance, **kwargs):
+    """Profile edits (edit_profile, admin) change the getuserdata payload."""
+    userdata_cache.invalidate_user(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_user_user_data(sender, instance, created=False, **kwargs):
+    # last_login is updated on every login and the password hash may be upgraded
+    # then too (accounts/hashers.py); neither is part of the payload
+    if created or kwargs.get('update_fields') in (frozenset({'last_login'}), frozenset({'password'})):
+        return
+    userdata_cache.invalidate_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=LoginSession)
+def invalidate_session_user_data(sender, instance, created=False, **kwargs):
+    """Logout and admin changes deactivate or remove sessions."""
+    if not created:
+        userdata_cache.invalidate_session(instance.sessionkey)
+
+
+@receiver(post_save, sender=Project)
+def refresh_project_logo_thumbnails(sender, instance, **kwargs):
+    """
+    Regenerate the logo variants when the logo changes, once the save has
+    committed: image work stays out of the transaction, and a rolled back save
+    generates nothing. The catalog is invalidated again to pick them up.
+    """
+    if thumbnails.is_current(instance):
+        return
+
+    def refresh():
+        if thumbnails.refresh_project_thumbnails(instance):
+            catalog.invalidate()
+
+    transaction.on_commit(refresh)
+
+
+@receiver([post_save, post_delete], sender=Project)
+def invalidate_project_catalog(sender, instance, **kwargs):
+    """Creating, editing, verifying or deleting a project can change the home page catalog."""
+    catalog.invalidate()
@@ -1,5 +1,29 @@
-from django.contrib.sitemaps import Sitemap
+"""
+Sitemaps, served precomputed.
+
+The XML is rendered by Django's sitemap views once, cached per catalog version
+(bumped whenever a project changes, see accounts/catalog.py) and served with an
+ETag and Last-Modified so crawlers revalidating an unchanged sitemap get a 304.
+``/sitemap.xml`` becomes a sitemap index once a section needs more than one
+page (``Sitemap.limit`` URLs each), with the pages at ``/sitemap-<section>.xml?p=N``.
+
+Like the catalog, this relies on the default cache being shared by all workers.
+With a per-process cache each worker renders its own copy, keeps serving it for
+up to SSO_PROJECT_CATALOG_TIMEOUT seconds after a project changes, and may send
+a different Last-Modified, so crawlers get fewer 304s (accounts/checks.py warns).
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.sitemaps import Sitemap, views as sitemap_views
+from django.core.cache import cache
+from django.http import HttpResponse
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import catalog
 from .models import Project
 
 
@@ -22,8 +46,8 @@ class ProjectSitemap(Sitemap):
     priority = 0.6
 
     def items(self):
-        # Only include verified projects in sitemap
-        return Project.objects.filter(is_verified=True)
+        # Only include verified projects in sitemap, in a stable order for paging
+        return Project.objects.filter(is_verified=True).only('id', 'created_at').order_by('created_at', 'id')
 
     def lastmod(self, obj):
         return obj.created_at
@@ -32,3 +56,47 @@ class ProjectSitemap(Sitemap):
         # Link to the project's main URL
         return f'/project/{obj.id}/ssocall/'
 
+
+
+SITEMAPS = {
+    'static': StaticViewSitemap,
+    'projects': ProjectSitemap,
+}
+
+
+def _render_sitemap(request, section):
+    """Render with Django's views. Returns (content, last_modified timestamp)."""
+    if section is None:
+        if any(sitemap().paginator.num_pages > 1 for sitemap in SITEMAPS.values()):
+            response = sitemap_views.index(request, SITEMAPS, sitemap_url_name='sitemap_section')
+        else:
+            response = sitemap_views.sitemap(request, SITEMAPS)
+    else:
+        response = sitemap_views.sitemap(request, SITEMAPS, section=section)
+    response.render()
+    last_modified = parse_http_date_safe(response.get('Last-Modified', '')) or int(timezone.now().timestamp())
+    return response.content, last_modified
+
+
+def cached_sitemap(request, section=None):
+    """Serve /sitemap.xml (or one section page) from cache with conditional GET support."""
+    key = f"sso:sitemap:{catalog.get_version()}:{request.scheme}:{section}:{request.GET.get('p', 1)}"
+    entry = cache.get(key)
+    if entry is None:
+        content, last_modified = _render_sitemap(request, section)
+        entry = {
+            'content': content,
+            'etag': f'"{hashlib.md5(content).hexdigest()}"',
+            'last_modified': last_modified,
+        }
+        cache.set(key, entry, settings.SSO_PROJECT_CATALOG_TIMEOUT)
+
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+    if response is None:
+        response = HttpResponse(entry['content'], content_type='application/xml')
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    # Let crawlers and proxies keep a copy but revalidate it every time
+    response['Cache-Control'] = 'public, no-cache'
+    response['X-Robots-Tag'] = 'noindex, noodp, noarchive'
+    return response
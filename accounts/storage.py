@@ -0,0 +1,144 @@
+"""
+MinIO media storage that remembers the URLs it generates.
+
+Pages call ``logo.url`` for every project they list, and with presigned URLs
+(MINIO_STORAGE_MEDIA_USE_PRESIGNED) each call signs a request. Generated URLs are
+kept in a small per-process LRU keyed by the object name and a version that
+changes whenever this process saves or deletes that object. Entries live for
+SSO_MEDIA_URL_CACHE_TIMEOUT seconds, and never more than half the lifetime of a
+presigned URL, so a cached URL always has time left when it is handed out.
+``get_media_url_stats()`` reports how much time was spent in ``url()``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from minio_storage.storage import MinioMediaStorage
+
+from . import metrics, profiling
+
+# Lifetime of presigned URLs when url() is not given a max_age (the MinIO client default)
+PRESIGNED_URL_EXPIRY = timedelta(days=7)
+
+_stats_lock = threading.Lock()
+_stats = {'calls': 0, 'hits': 0, 'misses': 0, 'url_seconds': 0.0, 'generate_seconds': 0.0}
+
+
+def _record(outcome, seconds, generate_seconds=0.0):
+    with _stats_lock:
+        _stats['calls'] += 1
+        _stats[outcome] += 1
+        _stats['url_seconds'] += seconds
+        _stats['generate_seconds'] += generate_seconds
+    metrics.record_cache_lookup('media_url', outcome)
+
+
+def get_media_url_stats():
+    """
+    URL cache counters for this process: ``url_seconds`` is the total time spent
+    in ``url()`` (what rendering pays), ``generate_seconds`` the part of it spent
+    generating URLs on misses.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['hit_ratio'] = stats['hits'] / stats['calls'] if stats['calls'] else 0.0
+    stats['avg_url_ms'] = 1000 * stats['url_seconds'] / stats['calls'] if stats['calls'] else 0.0
+    return stats
+
+
+class CachedURLMixin:
+    """Storage mixin caching ``url(name)`` per process (see the module docstring)."""
+    url_cache_size = 4096
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._url_lock = threading.Lock()
+        self._urls = OrderedDict()
+        self._versions = {}
+
+    def url_cache_timeout(self):
+        timeout = settings.SSO_MEDIA_URL_CACHE_TIMEOUT
+        if getattr(self, 'presign_urls', False):
+            timeout = min(timeout, PRESIGNED_URL_EXPIRY.total_seconds() / 2)
+        return timeout
+
+    def url(self, name, *args, **kwargs):
+        start = time.perf_counter()
+        timeout = self.url_cache_timeout()
+        if args or kwargs or timeout <= 0:
+            # Custom expiries are not cached
+            url = super().url(name, *args, **kwargs)
+            elapsed = time.perf_counter() - start
+            _record('misses', elapsed, elapsed)
+            return url
+
+        now = time.monotonic()
+        with self._url_lock:
+            key = (name, self._versions.get(name, 0))
+            entry = self._urls.get(key)
+            if entry is not None and entry[1] > now:
+                self._urls.move_to_end(key)
+                url = entry[0]
+            else:
+                url = None
+
+        if url is not None:
+            _record('hits', time.perf_counter() - start)
+            return url
+
+        generate_start = time.perf_counter()
+        url = super().url(name)
+        generated = time.perf_counter()
+        with self._url_lock:
+            self._urls[key] = (url, now + timeout)
+            self._urls.move_to_end(key)
+            while len(self._urls) > self.url_cache_size:
+                self._urls.popitem(last=False)
+        _record('misses', time.perf_counter() - start, generated - generate_start)
+        return url
+
+    def forget_url(self, name):
+        """Move ``name`` to a new version so its cached URL is no longer used."""
+        with self._url_lock:
+            version = self._versions.get(name, 0)
+            self._urls.pop((name, version), None)
+            self._versions[name] = version + 1
+
+    def _save(self, name, content):
+        name = super()._save(name, content)
+        self.forget_url(name)
+        return name
+
+    def delete(self, name):
+        super().delete(name)
+        self.forget_url(name)
+
+
+class ProfiledStorageMixin:
+    """Storage mixin timing object store calls as ``minio`` in the request profile (accounts/profiling.py)."""
+
+    def _open(self, name, mode='rb'):
+        with profiling.track('minio', f'open {name}'):
+            return super()._open(name, mode)
+
+    def _save(self, name, content):
+        with profiling.track('minio', f'save {name}'):
+            return super()._save(name, content)
+
+    def delete(self, name):
+        with profiling.track('minio', f'delete {name}'):
+            super().delete(name)
+
+    def exists(self, name):
+        with profiling.track('minio', f'exists {name}'):
+            return super().exists(name)
+
+    def size(self, name):
+        with profiling.track('minio', f'size {name}'):
+            return super().size(name)
+
+
+class CachedMinioMediaStorage(ProfiledStorageMixin, CachedURLMixin, MinioMediaStorage):
+    """The media bucket with cached URLs and profiled calls; used for project logos."""
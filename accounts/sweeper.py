@@ -0,0 +1,118 @@
+"""
+Set-based expiry of stale sessions.
+
+Replaces the per-login loop that called ``is_session_valid()`` on every active
+session of a project. Run it with ``python manage.py expire_sessions`` (cron or
+``--interval``), or in-process by setting ``SSO_SESSION_SWEEP_INTERVAL``.
+"""
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import LoginSession, SSOSession, Project, LOGIN_SESSION_LIFETIME, SSO_SESSION_LIFETIME
+
+logger = logging.getLogger(__name__)
+
+SWEEP_LOCK_KEY = 'sso:sweeper:lock'
+
+_periodic_thread = None
+
+
+def expire_stale_sessions(project=None, batch_size=1000, now=None):
+    """
+    Deactivate LoginSessions and SSOSessions past their lifetime.
+    LoginSessions are flipped in batches with their projects' active_logins
+    released in the same transaction. Returns ``(login_sessions, sso_sessions)``.
+    """
+    now = now or timezone.now()
+
+    stale_logins = LoginSession.objects.filter(active=True, created_at__lt=now - LOGIN_SESSION_LIFETIME)
+    if project is not None:
+        stale_logins = stale_logins.filter(project=project)
+
+    expired_logins = 0
+    while True:
+        batch = list(stale_logins.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            break
+        expired_logins += LoginSession.objects.filter(pk__in=batch).deactivate()
+
+    expired_sso = 0
+    if project is None:
+        expired_sso = SSOSession.objects.filter(
+            active=True, created_at__lt=now - SSO_SESSION_LIFETIME
+        ).update(active=False)
+
+    return expired_logins, expired_sso
+
+
+def reconcile_active_logins():
+    """
+    Recompute every project's active_logins from its active sessions with a
+    single aggregate UPDATE. Returns the number of projects that were corrected.
+
+    The project rows are locked first. Logins and logouts change the counter and
+    their session in one transaction, so once the locks are held every one of them
+    has either committed (and is counted) or waits until the UPDATE commits. Without
+    the lock, the UPDATE could count sessions before a login committed and then
+    overwrite that login's increment.
+    """
+    active_count = Coalesce(
+        Subquery(
+            LoginSession.objects.filter(project=OuterRef('pk'), active=True)
+            .order_by()
+            .values('project')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+    with transaction.atomic():
+        list(Project.objects.select_for_update().order_by('pk').values_list('pk', flat=True))
+        return Project.objects.exclude(active_logins=active_count).update(active_logins=active_count)
+
+
+def sweep(batch_size=1000, reconcile=True):
+    expired_logins, expired_sso = expire_stale_sessions(batch_size=batch_size)
+    corrected = reconcile_active_logins() if reconcile else 0
+    logger.info(
+        f"Session sweep: {expired_logins} login sessions and {expired_sso} SSO sessions expired, "
+        f"{corrected} project counters corrected"
+    )
+    return expired_logins, expired_sso, corrected
+
+
+def _run_periodically(interval):
+    stop = threading.Event()
+    while not stop.wait(interval):
+        # Only one worker across the deployment sweeps per interval (needs a shared cache)
+        if not cache.add(SWEEP_LOCK_KEY, os.getpid(), interval):
+            continue
+        try:
+            sweep()
+        except Exception as e:
+            logger.error(f"Session sweep failed: {e}")
+        finally:
+            close_old_connections()
+
+
+def start_periodic_sweeper():
+    """
+    Start the in-process sweeper thread if SSO_SESSION_SWEEP_INTERVAL is set.
+    Called from the WSGI/ASGI entry points so management commands never start it.
+    """
+    global _periodic_thread
+    interval = settings.SSO_SESSION_SWEEP_INTERVAL
+    if interval <= 0 or _periodic_thread is not None:
+        return
+    _periodic_thread = threading.Thread(
+        target=_run_periodically, args=(interval,), name='session-sweeper', daemon=True
+    )
+    _periodic_thread.start()
@@ -1,3 +1,1315 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import smtplib
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import SkipTest, mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import (
+    AsyncClient, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.contrib.messages import get_messages
+from django.urls import include, path, resolve, reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts import access_ids, async_views, exports, metrics, outbox, sweeper, thumbnails, tokens, userdata_cache
+from accounts.archive import archive_model
+from accounts.checks import check_shared_caches
+from accounts.email_utils import (
+    CircuitBreaker, EmailSender, SenderQuota, SMTPConnectionPool, queue_email, send_or_queue_email,
+)
+from accounts.management.commands.audit_queries import QUERY_BUDGETS
+from accounts.management.commands.resend_verification import RateLimiter
+from accounts.middleware import AnonymousPageCacheMiddleware, MetricsMiddleware, get_page_cache_stats
+from accounts.models import (
+    LOGIN_SESSION_LIFETIME, SSO_SESSION_LIFETIME, UNVERIFIED_PROJECT_LOGIN_LIMIT, LoginSession, OutboundEmail,
+    Profile, Project, SSOSession, release_project_logins,
+)
+from accounts.profiling import PROFILE_HEADER, ProfilingMiddleware, make_profile_token
+from accounts.sweeper import expire_stale_sessions, reconcile_active_logins, sweep
+from accounts.utils import build_user_data
+
+
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+class QueryBudgetTests(TestCase):
+    """Hot views must run exactly the queries budgeted in audit_queries.QUERY_BUDGETS."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('22b0001', email='22b0001@iitb.ac.in', password='password')
+        Profile.objects.create(
+            user=cls.user, roll='22b0001', name='Test Student', passing_year=2026, email_verified=True,
+            verification_token='verify-token', reset_token='reset-token',
+        )
+        cls.project = Project.objects.create(name='Test', redirect_url='https://example.com/cb', is_verified=True)
+        cls.sessions = [
+            LoginSession.objects.create(user=cls.user, project=cls.project, sessionkey=f'test-session-{i}')
+            for i in range(5)
+        ]
+        Project.objects.filter(pk=cls.project.pk).update(active_logins=len(cls.sessions))
+        SSOSession.objects.create(user=cls.user, device='test', session_key='test-sso-session')
+
+    def setUp(self):
+        clear_caches()
+        self.anonymous = Client()
+        self.client.force_login(self.user)
+
+    def assertBudget(self, name, method, url, **kwargs):
+        with self.assertNumQueries(QUERY_BUDGETS[name]):
+            return method(url, secure=True, **kwargs)
+
+    def post_json(self, client, url, payload):
+        return client.post(url, data=json.dumps(payload), content_type='application/json', secure=True)
+
+    def test_home_anonymous(self):
+        self.assertBudget('home (anonymous)', self.anonymous.get, reverse('home'))
+        self.assertBudget('home (anonymous, cached)', self.anonymous.get, reverse('home'))
+
+    def test_home_with_query_string_is_not_cached(self):
+        # Any query string would otherwise add a cache entry
+        self.anonymous.get(reverse('home'), secure=True)
+        before = get_page_cache_stats()
+        response = self.anonymous.get(reverse('home') + '?utm_source=mail', secure=True)
+        self.assertNotIn('ETag', response)
+        self.assertEqual(get_page_cache_stats(), before)
+
+    def test_home_logged_in(self):
+        # The project catalog is shared with anonymous visitors and normally warm
+        self.anonymous.get(reverse('home'), secure=True)
+        self.assertBudget('home (logged in)', self.client.get, reverse('home'))
+
+    def test_project_ssocall(self):
+        response = self.assertBudget('project_ssocall', self.client.get,
+                                     reverse('project_ssocall', kwargs={'id': self.project.id}))
+        self.assertEqual(response.status_code, 200)
+
+    def test_return_user_data(self):
+        url = reverse('return_user_data')
+        payload = {'id': self.sessions[0].sessionkey}
+        with self.assertNumQueries(QUERY_BUDGETS['return_user_data']):
+            response = self.post_json(self.anonymous, url, payload)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(QUERY_BUDGETS['return_user_data (cached)']):
+            cached = self.post_json(self.anonymous, url, payload)
+        self.assertEqual(cached.json(), response.json())
+
+    def test_return_user_data_batch(self):
+        ids = [session.sessionkey for session in self.sessions]
+        with self.assertNumQueries(QUERY_BUDGETS['return_user_data_batch']):
+            response = self.post_json(self.anonymous, reverse('return_user_data_batch'), {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+
+    def test_confirm_email(self):
+        self.assertBudget('confirm_email', self.anonymous.get,
+                          reverse('confirm_email', kwargs={'token': 'verify-token'}))
+
+    def test_resetpassword(self):
+        self.assertBudget('resetpassword', self.anonymous.get,
+                          reverse('resetpassword', kwargs={'token': 'reset-token'}))
+
+    def test_logout(self):
+        self.assertBudget('logout', self.client.get, reverse('logout'), HTTP_USER_AGENT='test')
+
+
+
+class ArchiveTests(TestCase):
+    def test_archived_sessions_are_deleted_in_bulk(self):
+        clear_caches()
+        user = User.objects.create_user('22b0001')
+        project = Project.objects.create(name='Test', redirect_url='https://example.com/cb')
+        sessions = [
+            LoginSession.objects.create(user=user, project=project, sessionkey=f'old-session-{i}', active=False)
+            for i in range(5)
+        ]
+        LoginSession.objects.update(created_at=timezone.now() - timedelta(days=100))
+        userdata_cache.set_many_user_data([(session, {'roll': '22b0001'}) for session in sessions])
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            # Archive the chunk, then per batch: select, delete (no per-row signals)
+            with self.assertNumQueries(1 + 2 * 2 + 1):
+                path, archived, deleted = archive_model(
+                    LoginSession, timezone.now() - timedelta(days=90), output_dir, chunk_size=3,
+                )
+        self.assertEqual((archived, deleted), (5, 5))
+        self.assertFalse(LoginSession.objects.exists())
+        self.assertEqual(userdata_cache.get_many_user_data([session.sessionkey for session in sessions]), {})
+        # The receiver is back for everyone else
+        session = LoginSession.objects.create(user=user, project=project, sessionkey='new-session')
+        userdata_cache.set_user_data(session, {'roll': '22b0001'})
+        session.delete()
+        self.assertIsNone(userdata_cache.get_user_data('new-session'))
+
+
+class SweeperTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('22b0001')
+        cls.projects = [
+            Project.objects.create(name=name, redirect_url='https://example.com/cb', is_verified=True)
+            for name in ('First', 'Second')
+        ]
+
+    def setUp(self):
+        clear_caches()
+
+    def create_sessions(self, project, count, age=timedelta(0)):
+        sessions = [
+            LoginSession.objects.create(user=self.user, project=project, sessionkey=f'{project.name}-{age}-{i}')
+            for i in range(count)
+        ]
+        LoginSession.objects.filter(pk__in=[session.pk for session in sessions]).update(
+            created_at=timezone.now() - age,
+        )
+        Project.objects.filter(pk=project.pk).update(active_logins=F('active_logins') + count)
+        return sessions
+
+    def active_logins(self):
+        return list(Project.objects.order_by('name').values_list('active_logins', flat=True))
+
+    def test_expire_stale_sessions(self):
+        first, second = self.projects
+        stale = self.create_sessions(first, 3, age=LOGIN_SESSION_LIFETIME + timedelta(minutes=1))
+        self.create_sessions(first, 2)
+        self.create_sessions(second, 2, age=LOGIN_SESSION_LIFETIME + timedelta(minutes=1))
+        old_sso = SSOSession.objects.create(user=self.user, device='test')
+        SSOSession.objects.filter(pk=old_sso.pk).update(created_at=timezone.now() - SSO_SESSION_LIFETIME - timedelta(minutes=1))
+        SSOSession.objects.create(user=self.user, device='test')
+        userdata_cache.set_user_data(stale[0], {'roll': '22b0001'})
+
+        # A full project only expires its own login sessions
+        self.assertEqual(expire_stale_sessions(project=first, batch_size=2), (3, 0))
+        self.assertEqual(self.active_logins(), [2, 2])
+        self.assertIsNone(userdata_cache.get_user_data(stale[0].sessionkey))
+
+        self.assertEqual(sweep(batch_size=2), (2, 1, 0))
+        self.assertEqual(self.active_logins(), [2, 0])
+        self.assertEqual(LoginSession.objects.filter(active=True).count(), 2)
+        self.assertEqual(SSOSession.objects.filter(active=True).count(), 1)
+        self.assertEqual(sweep(), (0, 0, 0))
+
+    def test_reconcile_active_logins(self):
+        first, second = self.projects
+        self.create_sessions(first, 3)
+        self.create_sessions(second, 1)
+        LoginSession.objects.filter(project=first).update(active=False)
+        Project.objects.filter(pk=second.pk).update(active_logins=5)
+
+        self.assertEqual(reconcile_active_logins(), 2)
+        self.assertEqual(self.active_logins(), [0, 1])
+        self.assertEqual(reconcile_active_logins(), 0)
+
+    def test_one_sweep_per_interval(self):
+        with mock.patch('accounts.sweeper.threading.Event') as event, \
+                mock.patch('accounts.sweeper.sweep') as sweep_sessions, \
+                mock.patch('accounts.sweeper.close_old_connections'):
+            # Two workers wake up in the same interval, then the thread stops
+            event.return_value.wait.side_effect = [False, False, True]
+            sweeper._run_periodically(60)
+        sweep_sessions.assert_called_once_with()
+
+
+class LogoThumbnailTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.storage = FileSystemStorage(location=media.name)
+        for patcher in (
+            mock.patch('accounts.thumbnails.get_storage', return_value=self.storage),
+            mock.patch.object(Project._meta.get_field('logo'), 'storage', self.storage),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def set_logo(self, project, name, color):
+        data = io.BytesIO()
+        Image.new('RGB', (300, 200), color).save(data, 'PNG')
+        project.logo.save(name, ContentFile(data.getvalue()), save=False)
+
+    def test_generated_after_commit_and_replaced_variants_deleted(self):
+        project = Project(name='Test', redirect_url='https://example.com/cb')
+        self.set_logo(project, 'red.png', 'red')
+        with self.captureOnCommitCallbacks() as callbacks:
+            project.save()
+            self.assertEqual(Project.objects.get(pk=project.pk).logo_thumbnails, {})
+        for callback in callbacks:
+            callback()
+        project.refresh_from_db()
+        old = thumbnails.variant_names(project.logo_thumbnails)
+        self.assertEqual(len(old), 4)
+
+        self.set_logo(project, 'blue.png', 'blue')
+        with self.captureOnCommitCallbacks(execute=True):
+            project.save()
+        project.refresh_from_db()
+        new = thumbnails.variant_names(project.logo_thumbnails)
+        self.assertEqual(len(new), 4)
+        self.assertTrue(all(self.storage.exists(name) for name in new))
+        self.assertFalse(any(self.storage.exists(name) for name in old))
+
+
+class AsyncURLs:
+    """The site with the async views, as SSO_ASYNC_VIEWS mounts them."""
+    urlpatterns = [
+        path('login/', async_views.login_view, name='login'),
+        path('project/<str:id>/ssocall/', async_views.project_ssocall, name='project_ssocall'),
+        path('project/getuserdata', async_views.return_user_data, name='return_user_data'),
+        path('', include('config.urls')),
+    ]
+
+
+def messages_of(response):
+    return [str(message) for message in get_messages(response.wsgi_request)]
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AsyncViewParityTests(TestCase):
+    """The async views must answer every request the way the sync ones do."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.verified = User.objects.create_user('22b0001', password='password')
+        Profile.objects.create(user=cls.verified, roll='22b0001', name='Verified', passing_year=2026, email_verified=True)
+        cls.unverified = User.objects.create_user('22b0002', password='password')
+        Profile.objects.create(user=cls.unverified, roll='22b0002', name='Unverified', passing_year=2026)
+        # Accounts made with createsuperuser have no Profile
+        cls.no_profile = User.objects.create_user('admin', password='password')
+        cls.project = Project.objects.create(name='Verified', redirect_url='https://example.com/cb', is_verified=True)
+        cls.full_project = Project.objects.create(
+            name='Full', redirect_url='https://example.com/cb', active_logins=UNVERIFIED_PROJECT_LOGIN_LIMIT,
+        )
+        for i in range(UNVERIFIED_PROJECT_LOGIN_LIMIT):
+            LoginSession.objects.create(user=cls.verified, project=cls.full_project, sessionkey=f'full-{i}')
+
+    def setUp(self):
+        clear_caches()
+
+    def both(self, request):
+        """``request()`` against the sync and then the async views, state rolled back in between."""
+        with mock.patch('accounts.views.logger'), mock.patch('accounts.async_views.logger'):
+            sid = transaction.savepoint()
+            sync = request()
+            transaction.savepoint_rollback(sid)
+            clear_caches()
+            with override_settings(ROOT_URLCONF=AsyncURLs):
+                return sync, request()
+
+    def login(self, username, password='password'):
+        response = Client().post('/login/', {'username': username, 'password': password},
+                                 secure=True, HTTP_USER_AGENT='test')
+        return response.status_code, response.get('Location'), messages_of(response)
+
+    def ssocall(self, project_id, user=None):
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        response = client.get(f'/project/{project_id}/ssocall/', secure=True)
+        sessions = LoginSession.objects.filter(project_id=project_id, active=True).count()
+        active_logins = Project.objects.filter(pk=project_id).values_list('active_logins', flat=True).first()
+        redirect_url = response.context['redirecturl'].split('accessid=')[0] if response.status_code == 200 else None
+        return response.status_code, response.get('Location'), messages_of(response), redirect_url, sessions, active_logins
+
+    def getuserdata(self, body, content_type='application/json'):
+        response = Client().post('/project/getuserdata', body, content_type=content_type, secure=True)
+        return response.status_code, response.json()
+
+    def test_async_urls(self):
+        for url, view in (
+            ('/login/', async_views.login_view),
+            (f'/project/{self.project.pk}/ssocall/', async_views.project_ssocall),
+            ('/project/getuserdata', async_views.return_user_data),
+        ):
+            self.assertIs(resolve(url, AsyncURLs).func, view)
+
+    def test_login(self):
+        for username, password in (
+            ('22b0001', 'password'), ('22b0002', 'password'), ('22b0001', 'wrong'), ('admin', 'password'),
+        ):
+            with self.subTest(username=username, password=password):
+                sync, async_ = self.both(lambda: self.login(username, password))
+                self.assertEqual(async_, sync)
+
+    def test_login_missing_profile(self):
+        for logger, urls in (('accounts.views', settings.ROOT_URLCONF), ('accounts.async_views', AsyncURLs)):
+            with self.subTest(logger), override_settings(ROOT_URLCONF=urls), self.assertLogs(logger, 'ERROR') as logs:
+                status, _, errors = self.login('admin')
+            self.assertEqual(status, 200)
+            self.assertEqual(errors, ['An error occurred while logging in. Please try again.'])
+            self.assertIn('user admin has no profile', logs.output[0])
+
+    def test_project_ssocall(self):
+        for name, project_id, user in (
+            ('issued', self.project.pk, self.verified),
+            ('project full', self.full_project.pk, self.verified),
+            ('unknown project', 'e7a1d4a0-0000-4000-8000-000000000000', self.verified),
+            ('anonymous', self.project.pk, None),
+        ):
+            with self.subTest(name):
+                sync, async_ = self.both(lambda: self.ssocall(project_id, user))
+                self.assertEqual(async_, sync)
+
+    def test_return_user_data(self):
+        active = LoginSession.objects.create(user=self.verified, project=self.project, sessionkey='active-session')
+        expired = LoginSession.objects.create(user=self.verified, project=self.project, sessionkey='expired-session')
+        LoginSession.objects.filter(pk=expired.pk).update(created_at=timezone.now() - timedelta(days=365))
+        Project.objects.filter(pk=self.project.pk).update(active_logins=2)
+
+        for name, body in (
+            ('active', {'id': active.sessionkey}),
+            ('expired', {'id': expired.sessionkey}),
+            ('unknown', {'id': 'no-such-session'}),
+            ('missing id', {}),
+            ('bad token', {'id': 'eyJhbGciOiJFZERTQSJ9.e30.c2ln'}),
+        ):
+            with self.subTest(name):
+                def request():
+                    result = self.getuserdata(json.dumps(body))
+                    # Expired sessions are released on the way
+                    return result, Project.objects.get(pk=self.project.pk).active_logins
+
+                sync, async_ = self.both(request)
+                self.assertEqual(async_, sync)
+
+    def test_return_user_data_cached(self):
+        LoginSession.objects.create(user=self.verified, project=self.project, sessionkey='active-session')
+        body = json.dumps({'id': 'active-session'})
+        sync, async_ = self.both(lambda: [self.getuserdata(body), self.getuserdata(body)])
+        self.assertEqual(async_, sync)
+
+    def test_return_user_data_malformed_json(self):
+        sync, async_ = self.both(lambda: self.getuserdata('{not json')[0])
+        self.assertEqual(async_, sync)
+
+
+class AsyncMiddlewareTests(TestCase):
+    """Our middleware must not force a thread switch under ASGI."""
+
+    def test_middleware_adapts_to_get_response(self):
+        async def async_view(request):
+            return HttpResponse()
+
+        for middleware in (MetricsMiddleware, ProfilingMiddleware, AnonymousPageCacheMiddleware):
+            with self.subTest(middleware=middleware.__name__):
+                self.assertTrue(iscoroutinefunction(middleware(async_view)))
+                self.assertFalse(iscoroutinefunction(middleware(lambda request: HttpResponse())))
+
+    async def test_profiling_middleware_counts_async_queries(self):
+        async def view(request):
+            await Project.objects.acount()
+            await Project.objects.acount()
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        await ProfilingMiddleware(view)(request)
+        self.assertEqual(request.profile.queries, 2)
+
+    async def test_page_cache_under_asgi(self):
+        clear_caches()
+        client = AsyncClient()
+        hits = get_page_cache_stats()['hits']
+        first = await client.get(reverse('home'), secure=True)
+        second = await client.get(reverse('home'), secure=True)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(get_page_cache_stats()['hits'], hits + 1)
+
+class ProfileTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('admin', is_staff=True)
+
+    def profiled_request(self, token):
+        request = RequestFactory().get('/', headers={PROFILE_HEADER: token})
+        with mock.patch('accounts.profiling.logger'):
+            ProfilingMiddleware(lambda request: HttpResponse())(request)
+        return request.profile
+
+    def test_active_staff(self):
+        profile = self.profiled_request(make_profile_token('admin'))
+        self.assertEqual(profile.requested_by, 'admin')
+
+    def test_revoked_with_staff_status(self):
+        token = make_profile_token('admin')
+        for change in ({'is_staff': False}, {'is_active': False}):
+            with self.subTest(**change):
+                User.objects.filter(pk=self.staff.pk).update(**change)
+                self.assertFalse(self.profiled_request(token).detailed)
+                User.objects.filter(pk=self.staff.pk).update(is_staff=True, is_active=True)
+
+    def test_unknown_user(self):
+        self.assertFalse(self.profiled_request(make_profile_token('nobody')).detailed)
+
+    @override_settings(SSO_PROFILE_TOKEN_MAX_AGE=60)
+    def test_lifetime_is_capped(self):
+        with mock.patch('accounts.profiling.time.time', return_value=time.time() - 120):
+            # Issued two minutes ago for an hour
+            expired = make_profile_token('admin', max_age=3600)
+        self.assertFalse(self.profiled_request(expired).detailed)
+
+    async def test_async(self):
+        async def view(request):
+            return HttpResponse()
+
+        request = RequestFactory().get('/', headers={PROFILE_HEADER: make_profile_token('admin')})
+        with mock.patch('accounts.profiling.logger'):
+            await ProfilingMiddleware(view)(request)
+        self.assertEqual(request.profile.requested_by, 'admin')
+
+
+def write_key(directory, name, key):
+    from cryptography.hazmat.primitives import serialization
+
+    path = f'{directory}/{name}.pem'
+    with open(path, 'wb') as key_file:
+        if hasattr(key, 'private_bytes'):
+            key_file.write(key.private_bytes(
+                serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+            ))
+        else:
+            key_file.write(key.public_bytes(
+                serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+            ))
+    return path
+
+
+class AccessTokenTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('22b0001')
+        cls.profile = Profile.objects.create(user=user, roll='22b0001', name='Student', passing_year=2026)
+        cls.project = Project.objects.create(
+            name='Signed', redirect_url='https://example.com/cb', is_verified=True, signed_access_tokens=True,
+        )
+        cls.session = LoginSession.objects.create(user=user, project=cls.project, sessionkey='signed-session')
+
+    def setUp(self):
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+        clear_caches()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.key = Ed25519PrivateKey.generate()
+        self.retired_key = Ed25519PrivateKey.generate()
+        self.enterContext(override_settings(
+            SSO_TOKEN_SIGNING_KEY_FILE=write_key(directory, 'signing', self.key),
+            SSO_TOKEN_PUBLIC_KEY_FILES=[write_key(directory, 'retired', self.retired_key.public_key())],
+            SSO_TOKEN_ISSUER='https://sso.example.com',
+        ))
+
+    def issue(self):
+        return tokens.issue_access_token(self.session, build_user_data(self.profile))
+
+    def forge(self, header=None, claims=None, key=None):
+        """A token signed like issue_access_token, with the header and claims replaced."""
+        header = header or {'alg': 'EdDSA', 'typ': 'JWT', 'kid': tokens.key_id(self.key.public_key())}
+        claims = claims or {'jti': self.session.sessionkey, 'exp': int(time.time()) + 60}
+        signing_input = f'{tokens._b64encode(tokens._json(header))}.{tokens._b64encode(tokens._json(claims))}'
+        signature = (key or self.key).sign(signing_input.encode('ascii'))
+        return f'{signing_input}.{tokens._b64encode(signature)}'
+
+    def test_round_trip(self):
+        claims = tokens.verify_access_token(self.issue())
+        self.assertEqual(claims['jti'], 'signed-session')
+        self.assertEqual(claims['aud'], str(self.project.pk))
+        self.assertEqual(claims['iss'], 'https://sso.example.com')
+        self.assertEqual(claims['exp'], int(self.session.expires_at.timestamp()))
+        self.assertEqual(claims['roll'], '22b0001')
+        self.assertEqual(tokens.session_key_for(self.issue()), 'signed-session')
+        self.assertEqual(tokens.session_key_for('opaque-id'), 'opaque-id')
+
+    def test_retired_key_still_verifies(self):
+        header = {'alg': 'EdDSA', 'kid': tokens.key_id(self.retired_key.public_key())}
+        self.assertEqual(tokens.session_key_for(self.forge(header=header, key=self.retired_key)), 'signed-session')
+
+    def test_rejected(self):
+        encoded_header, encoded_claims, signature = self.issue().split('.')
+        tampered_claims = tokens._b64encode(tokens._json({'jti': 'someone-else', 'exp': int(time.time()) + 60}))
+        kid = tokens.key_id(self.key.public_key())
+        for name, token, error in (
+            ('tampered claims', f'{encoded_header}.{tampered_claims}.{signature}', 'Bad signature'),
+            ('tampered signature', f'{encoded_header}.{encoded_claims}.{signature[::-1]}', 'Bad signature'),
+            ('wrong alg', self.forge(header={'alg': 'HS256', 'kid': kid}), 'Unsupported algorithm'),
+            ('no alg', self.forge(header={'alg': 'none', 'kid': kid}), 'Unsupported algorithm'),
+            ('unknown kid', self.forge(header={'alg': 'EdDSA', 'kid': 'unknown'}), 'Unknown signing key'),
+            ('kid not a string', self.forge(header={'alg': 'EdDSA', 'kid': ['x']}), 'Unknown signing key'),
+            ('other key', self.forge(key=self.retired_key), 'Bad signature'),
+            ('expired', self.forge(claims={'jti': 'signed-session', 'exp': int(time.time()) - 1}), 'Token has expired'),
+            ('no exp', self.forge(claims={'jti': 'signed-session'}), 'Token has expired'),
+            ('exp not a number', self.forge(claims={'jti': 'signed-session', 'exp': 'never'}), 'Token has expired'),
+        ):
+            with self.subTest(name), self.assertRaisesMessage(tokens.InvalidAccessToken, error):
+                tokens.session_key_for(token)
+
+    def test_malformed(self):
+        for token in ('a.b.c', '..', 'é.é.é', 'e30.e30', 'e30.e30.e30.e30', 'W10.W10.c2ln', '//8.e30.c2ln', None, 12):
+            with self.subTest(token=token), self.assertRaisesMessage(tokens.InvalidAccessToken, 'Malformed token'):
+                tokens.verify_access_token(token)
+
+    def test_jwks(self):
+        response = self.client.get('/.well-known/jwks.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+        keys = response.json()['keys']
+        self.assertEqual([key['kid'] for key in keys], [
+            tokens.key_id(self.key.public_key()), tokens.key_id(self.retired_key.public_key()),
+        ])
+        self.assertEqual(keys[0], {
+            'kty': 'OKP', 'crv': 'Ed25519', 'use': 'sig', 'alg': 'EdDSA', 'kid': keys[0]['kid'],
+            'x': tokens._b64encode(tokens._raw_public_bytes(self.key.public_key())),
+        })
+
+    def test_jwks_without_keys(self):
+        with override_settings(SSO_TOKEN_SIGNING_KEY_FILE='', SSO_TOKEN_PUBLIC_KEY_FILES=[]):
+            self.assertFalse(tokens.is_enabled())
+            self.assertEqual(self.client.get('/.well-known/jwks.json').json(), {'keys': []})
+
+    def test_getuserdata(self):
+        for name, urls in (('sync', settings.ROOT_URLCONF), ('async', AsyncURLs)):
+            with self.subTest(name), override_settings(ROOT_URLCONF=urls):
+                clear_caches()
+                response = self.client.post(
+                    '/project/getuserdata', {'id': self.issue()}, content_type='application/json',
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json(), build_user_data(self.profile))
+
+                for token in (self.forge(key=self.retired_key), 'not.a.token', 'é.é.é'):
+                    response = self.client.post('/project/getuserdata', {'id': token}, content_type='application/json')
+                    self.assertEqual(response.status_code, 403)
+                    self.assertEqual(response.json(), {'error': 'Invalid access token'})
+
+
+class AccessIdGeneratorTests(SimpleTestCase):
+    def test_follows_setting_changes(self):
+        self.assertIsInstance(access_ids.get_access_id_generator(), access_ids.RandomAccessIdGenerator)
+        with override_settings(SSO_ACCESS_ID_GENERATOR='accounts.access_ids.UUIDAccessIdGenerator'):
+            self.assertIsInstance(access_ids.get_access_id_generator(), access_ids.UUIDAccessIdGenerator)
+        self.assertIsInstance(access_ids.get_access_id_generator(), access_ids.RandomAccessIdGenerator)
+
+
+class MetricsFlushTests(SimpleTestCase):
+    def setUp(self):
+        # Samples from earlier tests
+        metrics.flush()
+        clear_caches()
+
+    def test_recording_never_touches_the_cache(self):
+        with mock.patch('accounts.metrics._cache') as cache:
+            for _ in range(3):
+                metrics.inc('sso_password_logins_total', ('success',))
+            metrics.observe('sso_request_duration_seconds', ('login_view',), 0.02)
+        cache.assert_not_called()
+
+        metrics.flush()
+        stored = caches['default']
+        self.assertEqual(stored.get(metrics._key('sso_password_logins_total', ('success',), '')), 3)
+        self.assertEqual(stored.get(metrics._key('sso_request_duration_seconds', ('login_view',), 'count')), 1)
+
+    def test_redis_flush_is_one_pipeline(self):
+        cache = RedisCache('redis://localhost', {})
+        client = mock.MagicMock()
+        cache.__dict__['_cache'] = mock.Mock(get_client=mock.Mock(return_value=client))
+        pipeline = client.pipeline.return_value.__enter__.return_value
+
+        with mock.patch('accounts.metrics._cache', return_value=cache):
+            metrics.inc('sso_password_logins_total', ('success',), 2)
+            metrics.inc('sso_password_logins_total', ('invalid',))
+            metrics.flush()
+
+        pipeline.incrby.assert_has_calls([
+            mock.call(cache.make_and_validate_key(metrics._key('sso_password_logins_total', ('success',), '')), 2),
+            mock.call(cache.make_and_validate_key(metrics._key('sso_password_logins_total', ('invalid',), '')), 1),
+        ], any_order=True)
+        pipeline.execute.assert_called_once_with()
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+
+    def warned_settings(self):
+        return {warning.msg.split(' (', 1)[0] for warning in check_shared_caches(None)}
+
+    @override_settings(DEBUG=False, CACHES=locmem)
+    def test_warns_about_per_process_cache(self):
+        self.assertEqual(self.warned_settings(), {
+            'The project catalog and sitemap', 'SSO_METRICS_CACHE_ALIAS', 'SSO_PAGE_CACHE_ALIAS', 'EMAIL_STATE_CACHE_ALIAS',
+        })
+
+    @override_settings(DEBUG=False, CACHES=redis)
+    def test_shared_cache(self):
+        self.assertEqual(self.warned_settings(), set())
+
+    @override_settings(DEBUG=True, CACHES=locmem)
+    def test_development(self):
+        self.assertEqual(self.warned_settings(), set())
+
+
+class SenderQuotaTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_quota_is_per_host(self):
+        configs = [
+            {'EMAIL_HOST': host, 'EMAIL_HOST_USER': 'itc@example.com', 'DAILY_QUOTA': 2}
+            for host in ('smtp.gmail.com', 'smtp.relay.example')
+        ]
+        quota = SenderQuota(configs)
+        self.assertEqual(quota.reserve(0, 2), 2)
+        self.assertEqual(quota.remaining(), [0, 2])
+
+
+EMAIL_CONFIGS = [
+    {'EMAIL_HOST': f'smtp.{name}.example', 'EMAIL_PORT': 587, 'EMAIL_USE_TLS': True,
+     'EMAIL_HOST_USER': f'itc@{name}.example', 'EMAIL_HOST_PASSWORD': 'password', 'DAILY_QUOTA': 100}
+    for name in ('first', 'second')
+]
+
+
+class InlineExecutor:
+    """Stands in for ThreadPoolExecutor, running every task on the calling thread."""
+
+    def __init__(self, max_workers=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, *iterables):
+        return map(fn, *iterables)
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', EMAIL_CONFIGS=EMAIL_CONFIGS,
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_DELAY=60,
+)
+class OutboxTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        # EmailSender is a per-process singleton built from EMAIL_CONFIGS
+        EmailSender._instance = None
+        self.addCleanup(setattr, EmailSender, '_instance', None)
+        self.enterContext(mock.patch('accounts.email_utils.logger'))
+
+    def queue(self, **fields):
+        queue_email('Verify your email', 'Hello', ['22b0001@iitb.ac.in'])
+        message = OutboundEmail.objects.latest('pk')
+        OutboundEmail.objects.filter(pk=message.pk).update(**fields)
+        return message
+
+    def failing_smtp(self):
+        return mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=smtplib.SMTPServerDisconnected('Connection unexpectedly closed'),
+        )
+
+    def test_claim_and_send(self):
+        message = self.queue()
+        self.queue(next_attempt_at=timezone.now() + timedelta(minutes=5))
+        self.queue(status=OutboundEmail.SENT)
+
+        claimed = outbox.claim_batch(10)
+        self.assertEqual([claimed_message.pk for claimed_message in claimed], [message.pk])
+        self.assertEqual((claimed[0].status, claimed[0].attempts), (OutboundEmail.SENDING, 1))
+        # Claimed rows are not handed to a second worker
+        self.assertEqual(outbox.claim_batch(10), [])
+
+        self.assertTrue(outbox.deliver(claimed[0]))
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboundEmail.SENT)
+        self.assertIsNotNone(message.sent_at)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Verify your email')
+        self.assertEqual(mail.outbox[0].to, ['22b0001@iitb.ac.in'])
+
+    def test_failure_backs_off(self):
+        message = self.queue()
+        with self.failing_smtp():
+            for attempt, delay in ((1, 60), (2, 120)):
+                start = timezone.now()
+                self.assertFalse(outbox.deliver(outbox.claim_batch(10)[0]))
+                message.refresh_from_db()
+                self.assertEqual((message.status, message.attempts), (OutboundEmail.PENDING, attempt))
+                self.assertGreaterEqual(message.next_attempt_at, start + timedelta(seconds=delay))
+                self.assertLessEqual(message.next_attempt_at, timezone.now() + timedelta(seconds=delay))
+                self.assertTrue(message.last_error)
+                # Not due again until the delay has passed
+                self.assertEqual(outbox.claim_batch(10), [])
+                OutboundEmail.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(mail.outbox, [])
+
+    def test_retry_delay(self):
+        self.assertEqual(
+            [outbox.retry_delay(attempts).total_seconds() for attempts in (1, 2, 3, 20)],
+            [60, 120, 240, 86400],
+        )
+
+    def test_dead_letter(self):
+        message = self.queue(attempts=2)
+        with self.failing_smtp(), mock.patch('accounts.outbox.logger') as logger:
+            self.assertFalse(outbox.deliver(outbox.claim_batch(10)[0]))
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboundEmail.DEAD, 3))
+        logger.error.assert_called_once()
+        self.assertEqual(outbox.claim_batch(10), [])
+
+        self.assertEqual(outbox.requeue(OutboundEmail.objects.all()), 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboundEmail.PENDING, 0))
+
+    def test_reclaims_stale_claims(self):
+        now = timezone.now()
+        stale = self.queue(status=OutboundEmail.SENDING, attempts=1,
+                           claimed_at=now - outbox.CLAIM_TIMEOUT - timedelta(minutes=1))
+        self.queue(status=OutboundEmail.SENDING, attempts=1, claimed_at=now - timedelta(minutes=1))
+
+        claimed = outbox.claim_batch(10)
+        self.assertEqual([message.pk for message in claimed], [stale.pk])
+        self.assertEqual(claimed[0].attempts, 2)
+        self.assertGreaterEqual(claimed[0].claimed_at, now)
+
+    @override_settings(EMAIL_OUTBOX_ENABLED=True)
+    def test_email_worker(self):
+        for _ in range(3):
+            self.queue()
+        stdout = io.StringIO()
+        # Deliver on the test thread, which holds the test transaction; the real
+        # worker threads each close their own connection afterwards
+        with mock.patch('accounts.outbox.ThreadPoolExecutor', InlineExecutor), \
+                mock.patch('accounts.outbox.connection'):
+            call_command('email_worker', '--once', '--batch-size', '2', stdout=stdout)
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.SENT).count(), 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(stdout.getvalue().splitlines(), ['Sent 2/2 emails', 'Sent 1/1 emails'])
+
+    def test_send_or_queue_email(self):
+        with override_settings(EMAIL_OUTBOX_ENABLED=True):
+            self.assertTrue(send_or_queue_email('Queued', 'Hello', ['22b0001@iitb.ac.in']))
+        self.assertEqual(list(OutboundEmail.objects.values_list('subject', 'recipients', 'status')),
+                         [('Queued', ['22b0001@iitb.ac.in'], OutboundEmail.PENDING)])
+        self.assertEqual(mail.outbox, [])
+
+        with override_settings(EMAIL_OUTBOX_ENABLED=False):
+            self.assertTrue(send_or_queue_email('Inline', 'Hello', ['22b0001@iitb.ac.in']))
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+        self.assertEqual([message.subject for message in mail.outbox], ['Inline'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class RosterImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        registered = User.objects.create_user('22b0009')
+        Profile.objects.create(user=registered, roll='22b0009', name='Registered', passing_year=2026)
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with (gzip.open if name.endswith('.gz') else open)(path, 'wt', encoding='utf-8') as roster_file:
+            roster_file.write(content)
+        return path
+
+    def import_roster(self, path, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_roster', path, '--workers', '1', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue().splitlines()
+
+    def test_csv(self):
+        path = self.write('roster.csv', (
+            'Roll,Name,Passing_Year,Department,Email,Password\n'
+            '22b0001, First Student ,2026,AE,first@example.com,initial-password\n'
+            '22b0002,Second Student,2027,,,\n'
+            '22b0003,,2026,,,\n'
+            '22b0004,Bad Year,soon,,,\n'
+            '22b0005,Bad Department,2026,XX,,\n'
+            '22b0001,Duplicate,2026,,,\n'
+            '22b0009,Registered,2026,,,\n'
+        ))
+        stdout, errors = self.import_roster(path)
+
+        self.assertIn('Created 2 accounts', stdout)
+        self.assertIn('1 already registered, 4 invalid rows, 2 verification emails queued', stdout)
+        self.assertEqual(errors, [
+            'line 4: missing name',
+            "line 5: passing_year 'soon' is not a number",
+            "line 6: unknown department 'XX'",
+            'line 7: duplicate roll 22b0001',
+        ])
+
+        first = Profile.objects.select_related('user').get(roll='22b0001')
+        self.assertEqual((first.name, first.passing_year, first.department, first.degree),
+                         ('First Student', 2026, 'AE', 'B.Tech'))
+        self.assertEqual(first.user.email, 'first@example.com')
+        self.assertTrue(first.user.check_password('initial-password'))
+        second = Profile.objects.select_related('user').get(roll='22b0002')
+        self.assertEqual((second.department, second.user.email), ('CE', '22b0002@iitb.ac.in'))
+        self.assertFalse(second.user.has_usable_password())
+
+        self.assertEqual(sorted(OutboundEmail.objects.values_list('recipients', flat=True)),
+                         [['22b0002@iitb.ac.in'], ['first@example.com']])
+        self.assertTrue(first.verification_token)
+
+    def test_gzipped_jsonl(self):
+        path = self.write('roster.jsonl.gz', '\n'.join([
+            json.dumps({'roll': '22b0001', 'name': 'First Student', 'passing_year': 2026, 'degree': 'PhD'}),
+            '',
+            '{not json',
+            json.dumps(['22b0002']),
+            json.dumps({'roll': '22b0003', 'name': 'No Year'}),
+        ]))
+        stdout, errors = self.import_roster(path, '--no-email')
+
+        self.assertIn('Created 1 accounts', stdout)
+        self.assertEqual(errors, [
+            'line 3: not a JSON object', 'line 4: not a JSON object', 'line 5: missing passing_year',
+        ])
+        self.assertEqual(Profile.objects.get(roll='22b0001').degree, 'PhD')
+        self.assertEqual(Profile.objects.get(roll='22b0001').verification_token, '')
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    def test_existing_rolls_are_skipped(self):
+        path = self.write('roster.csv', 'roll,name,passing_year\n22b0001,First Student,2026\n22b0009,Again,2030\n')
+        self.import_roster(path, '--chunk-size', '1')
+        stdout, errors = self.import_roster(path, '--chunk-size', '1')
+
+        self.assertIn('Created 0 accounts', stdout)
+        self.assertIn('2 already registered', stdout)
+        self.assertEqual(errors, [])
+        self.assertEqual(Profile.objects.get(roll='22b0009').name, 'Registered')
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_dry_run(self):
+        path = self.write('roster.csv', 'roll,name,passing_year\n22b0001,First Student,2026\n22b0002,,2026\n')
+        with self.assertNumQueries(2):
+            # Only the lookups of already registered rolls
+            stdout, errors = self.import_roster(path, '--dry-run')
+
+        self.assertIn('Would create 1 accounts', stdout)
+        self.assertEqual(errors, ['line 3: missing name'])
+        self.assertFalse(User.objects.filter(username='22b0001').exists())
+        self.assertFalse(OutboundEmail.objects.exists())
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('admin', is_staff=True)
+        cls.student = User.objects.create_user('22b0001')
+        Profile.objects.create(user=cls.student, roll='22b0001', name='@SUM(A1:A9)', passing_year=2026)
+        cls.project = Project.objects.create(
+            name='=HYPERLINK("https://evil.example")', redirect_url='https://example.com/cb', owner=cls.student,
+        )
+        cls.sessions = {}
+        for label, moment in (
+            ('before', datetime(2026, 2, 28, 23, 59, 59)),
+            ('start', datetime(2026, 3, 1, 0, 0)),
+            ('late on the last day', datetime(2026, 3, 2, 23, 30)),
+            ('after', datetime(2026, 3, 3, 0, 0, 1)),
+        ):
+            session = LoginSession.objects.create(user=cls.student, project=cls.project, sessionkey=label)
+            LoginSession.objects.filter(pk=session.pk).update(created_at=timezone.make_aware(moment))
+            cls.sessions[label] = session
+
+    def export(self, name, user=None, **params):
+        self.client.force_login(user or self.staff)
+        return self.client.get(f'/staff/export/{name}/', params, secure=True)
+
+    def test_parse_boundary(self):
+        self.assertIsNone(exports.parse_boundary(''))
+        self.assertEqual(exports.parse_boundary('2026-03-01'), timezone.make_aware(datetime(2026, 3, 1)))
+        self.assertEqual(exports.parse_boundary('2026-03-01', end=True),
+                         timezone.make_aware(datetime(2026, 3, 1, 23, 59, 59, 999999)))
+        self.assertEqual(exports.parse_boundary('2026-03-01T12:30:00+05:30'),
+                         datetime(2026, 3, 1, 7, 0, tzinfo=dt_timezone.utc))
+        for value in ('yesterday', '2026-13-01'):
+            with self.subTest(value), self.assertRaises(ValueError):
+                exports.parse_boundary(value)
+
+    def test_since_and_until(self):
+        response = self.export('login-sessions', since='2026-03-01', until='2026-03-02')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertRegex(response['Content-Disposition'], r'^attachment; filename="login-sessions-\d{14}\.csv"$')
+
+        header, *rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(header, ['id', 'user__username', 'project_id', 'project__name', 'active', 'created_at'])
+        # A bare date for until means the end of that day; rows come out oldest first
+        self.assertEqual([row[0] for row in rows], [
+            str(self.sessions['start'].pk), str(self.sessions['late on the last day'].pk),
+        ])
+        self.assertEqual(rows[0][1:], [
+            '22b0001', str(self.project.pk), '\'=HYPERLINK("https://evil.example")', 'True', '2026-03-01 00:00:00+00:00',
+        ])
+
+    def test_formulas_are_escaped_in_csv_only(self):
+        response = self.export('profiles')
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[1][:3], ['22b0001', "'@SUM(A1:A9)", 'CE'])
+
+        for value in ('+1', '-1', '\tx', '\rx'):
+            self.assertEqual(exports._csv_cell(value), f"'{value}")
+        self.assertEqual(exports._csv_cell(-1), -1)
+        self.assertEqual(exports._csv_cell('22b0001'), '22b0001')
+
+        response = self.export('profiles', format='jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(json.loads(b''.join(response.streaming_content))['name'], '@SUM(A1:A9)')
+
+    def test_staff_only(self):
+        self.assertEqual(self.export('profiles', user=self.student).status_code, 403)
+        self.client.logout()
+        response = self.client.get('/staff/export/profiles/', secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith('/login/'))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.export('passwords').status_code, 404)
+        self.assertEqual(self.export('profiles', format='xlsx').status_code, 400)
+        self.assertEqual(self.export('profiles', since='last week').status_code, 400)
+
+    def test_command(self):
+        path = f'{self.enterContext(tempfile.TemporaryDirectory())}/sessions.jsonl.gz'
+        call_command('export_data', 'login-sessions', '--format', 'jsonl', '--since', '2026-03-01',
+                     '--output', path, stderr=io.StringIO())
+        with gzip.open(path, 'rt') as export_file:
+            rows = [json.loads(line) for line in export_file]
+        self.assertEqual([row['id'] for row in rows], [
+            self.sessions[label].pk for label in ('start', 'late on the last day', 'after')
+        ])
+        self.assertNotIn('sessionkey', rows[0])
+
+
+@override_settings(EMAIL_CONFIGS=EMAIL_CONFIGS)
+class ResendVerificationTests(TestCase):
+    def setUp(self):
+        clear_caches()
+        EmailSender._instance = None
+        self.addCleanup(setattr, EmailSender, '_instance', None)
+        self.enterContext(mock.patch('accounts.email_utils.logger'))
+        self.checkpoint = f'{self.enterContext(tempfile.TemporaryDirectory())}/checkpoint.json'
+
+    def create_profile(self, roll, verified=False):
+        user = User.objects.create_user(roll, email=f'{roll}@iitb.ac.in')
+        return Profile.objects.create(user=user, roll=roll, name=roll, passing_year=2026, email_verified=verified)
+
+    def resend(self):
+        call_command('resend_verification', '--rate', '0', '--checkpoint', self.checkpoint, stdout=io.StringIO())
+        with open(self.checkpoint) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def test_failed_profiles_are_retried(self):
+        first, second, third = (self.create_profile(roll) for roll in ('22b0001', '22b0002', '22b0003'))
+        self.create_profile('22b0004', verified=True)
+        send_many = SMTPConnectionPool.send_many
+
+        def bounce_second(pool, messages):
+            bounced = [message for message in messages if message.to == [second.user.email]]
+            return send_many(pool, [message for message in messages if message not in bounced]) + bounced
+
+        with mock.patch.object(SMTPConnectionPool, 'send_many', autospec=True, side_effect=bounce_second):
+            state = self.resend()
+        self.assertEqual(state, {'last_pk': third.pk, 'sent': 2, 'failed': [second.pk]})
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [first.user.email, third.user.email])
+
+        fourth = self.create_profile('22b0005')
+        mail.outbox = []
+        state = self.resend()
+        self.assertEqual(state, {'last_pk': fourth.pk, 'sent': 4, 'failed': []})
+        self.assertEqual([message.to[0] for message in mail.outbox], [second.user.email, fourth.user.email])
+
+    def test_rate_limit_spaces_every_message(self):
+        with mock.patch('accounts.management.commands.resend_verification.time') as clock:
+            clock.monotonic.return_value = 100.0
+            limiter = RateLimiter(rate=2)
+            for _ in range(3):
+                limiter.wait()
+        self.assertEqual([call.args[0] for call in clock.sleep.call_args_list], [0.5, 1.0])
+
+
+@override_settings(EMAIL_CONFIGS=EMAIL_CONFIGS)
+class EmailSenderTests(SimpleTestCase):
+    def setUp(self):
+        clear_caches()
+        EmailSender._instance = None
+        self.addCleanup(setattr, EmailSender, '_instance', None)
+        self.enterContext(mock.patch('accounts.email_utils.logger'))
+        self.now = 1_000_000.0
+        self.enterContext(mock.patch('accounts.email_utils.time.time', side_effect=lambda: self.now))
+        # No jitter
+        self.enterContext(mock.patch('accounts.email_utils.random.uniform', side_effect=lambda low, high: high))
+
+    def open_circuit(self, breaker):
+        """Fail the half-open probe once the recovery timeout has passed."""
+        self.now = breaker.open_until
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+
+    def test_circuit_transitions(self):
+        breaker = CircuitBreaker('itc@first.example', failure_threshold=3, recovery_timeout=60,
+                                 max_recovery_timeout=3600)
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(breaker.allow_request())
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(breaker.open_until, self.now + 60 * 1.2)
+        self.assertFalse(breaker.is_available())
+        self.assertFalse(breaker.allow_request())
+
+        # Sends that were already in flight fail too, without pushing the retry further out
+        open_until = breaker.open_until
+        for _ in range(5):
+            breaker.record_failure()
+        self.assertEqual((breaker.state, breaker.open_until, breaker.consecutive_opens), (CircuitBreaker.OPEN, open_until, 1))
+
+        self.now = open_until
+        self.assertTrue(breaker.is_available())
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # Only one probe at a time
+        self.assertFalse(breaker.is_available())
+        self.assertFalse(breaker.allow_request())
+
+        breaker.record_success()
+        self.assertEqual((breaker.state, breaker.failures, breaker.consecutive_opens), (CircuitBreaker.CLOSED, 0, 0))
+        self.assertTrue(breaker.allow_request())
+
+    def test_recovery_timeout_doubles(self):
+        breaker = CircuitBreaker('itc@first.example', failure_threshold=1, recovery_timeout=60,
+                                 max_recovery_timeout=300)
+        breaker.record_failure()
+        timeouts = [breaker.open_until - self.now]
+        for _ in range(3):
+            self.open_circuit(breaker)
+            timeouts.append(breaker.open_until - self.now)
+        self.assertEqual(timeouts, [60 * 1.2, 120 * 1.2, 240 * 1.2, 300 * 1.2])
+
+        # A successful probe starts over
+        self.now = breaker.open_until
+        breaker.allow_request()
+        breaker.record_success()
+        breaker.record_failure()
+        self.assertEqual(breaker.open_until - self.now, 60 * 1.2)
+
+    def test_rotation_prefers_the_most_quota_left(self):
+        sender = EmailSender()
+        sender._quota.reserve(0, 10)
+        self.assertEqual(sender._rotate_email_config(), 1)
+        self.assertEqual(sender._quota.sent_today(), [10, 1])
+        self.assertEqual(sender._rotate_email_config(tried={1}), 0)
+
+        # Skips accounts whose circuit is open or whose quota is used up
+        sender._breakers[1].state = CircuitBreaker.OPEN
+        sender._breakers[1].open_until = self.now + 60
+        self.assertEqual(sender._rotate_email_config(), 0)
+        sender._quota.reserve(0, 100)
+        self.assertIsNone(sender._rotate_email_config())
+
+    def test_rotation_round_robin_on_ties(self):
+        sender = EmailSender()
+        picked = []
+        for _ in range(4):
+            index = sender._rotate_email_config()
+            picked.append(index)
+            # Give the quota back so both accounts stay tied
+            sender._quota.release(index)
+        self.assertEqual(sorted(picked), [0, 0, 1, 1])
+        self.assertNotEqual(picked[0], picked[1])
+
+    @override_settings(EMAIL_RETRY_BASE_DELAY=0.5, EMAIL_RETRY_MAX_DELAY=3)
+    def test_backoff(self):
+        sender = EmailSender()
+        with mock.patch('accounts.email_utils.time.sleep') as sleep:
+            for attempt in range(10):
+                sender._backoff(attempt, total_configs=2)
+        # Only after each full round over the accounts, doubling up to the maximum
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 1, 2, 3, 3])
+
+
+# Waiting for the database lock is the point here, not a slow query
+@override_settings(SSO_SLOW_QUERY_MS=0, SSO_SLOW_REQUEST_MS=0)
+class ActiveLoginsConcurrencyTests(TransactionTestCase):
+    """
+    Project.active_logins is only ever changed with single UPDATEs, so concurrent
+    logins, getuserdata calls and logouts must leave it equal to the number of
+    active sessions. Each thread drives the views with its own Client.
+
+    Needs a test database that threads can share: PostgreSQL, or SQLite with a
+    TEST NAME file and OPTIONS ``'transaction_mode': 'IMMEDIATE'`` (otherwise
+    concurrent writers fail with "database is locked").
+    """
+    threads = 8
+    logins_per_thread = 10
+
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor == 'sqlite':
+            if connection.is_in_memory_db():
+                raise SkipTest('threads cannot share an in-memory SQLite test database')
+            if connection.settings_dict['OPTIONS'].get('transaction_mode') != 'IMMEDIATE':
+                raise SkipTest("concurrent SQLite writers need OPTIONS 'transaction_mode': 'IMMEDIATE'")
+        super().setUpClass()
+
+    def setUp(self):
+        clear_caches()
+        self.users = []
+        for i in range(self.threads):
+            user = User.objects.create_user(f'22b{i:04d}')
+            Profile.objects.create(user=user, roll=user.username, name=user.username, passing_year=2026)
+            self.users.append(user)
+        self.project = Project.objects.create(name='Test', redirect_url='https://example.com/cb', is_verified=True)
+        self.lowest = 0
+        self.errors = []
+
+    def run_threads(self, target, count):
+        barrier = threading.Barrier(count)
+
+        def run(index):
+            try:
+                barrier.wait()
+                target(index)
+            except Exception as e:
+                self.errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.errors, [])
+
+    def check_counter(self, project=None):
+        active_logins = Project.objects.values_list('active_logins', flat=True).get(pk=(project or self.project).pk)
+        self.lowest = min(self.lowest, active_logins)
+        return active_logins
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def ssocall(self, client, project=None):
+        response = client.get(f'/project/{(project or self.project).pk}/ssocall/', secure=True)
+        if response.status_code != 200:
+            return None
+        return response.context['redirecturl'].split('accessid=')[1]
+
+    def getuserdata(self, client, access_id):
+        return client.post('/project/getuserdata', {'id': access_id}, content_type='application/json',
+                           secure=True).status_code
+
+    def logout(self, client):
+        client.get('/logout/', secure=True, HTTP_USER_AGENT='test')
+
+    def test_concurrent_logins_and_logouts(self):
+        def work(index):
+            user = self.users[index]
+            client = self.client_for(user)
+            for i in range(self.logins_per_thread):
+                access_id = self.ssocall(client)
+                if access_id is None:
+                    raise AssertionError(f'login {i} of {user.username} was refused')
+                self.check_counter()
+                if i % 2:
+                    # Two getuserdata calls expiring the same session must release it once
+                    LoginSession.objects.filter(sessionkey=access_id).update(
+                        created_at=timezone.now() - timedelta(days=1),
+                    )
+                    self.assertEqual([self.getuserdata(client, access_id) for _ in range(2)], [403, 403])
+                if i % 5 == 2:
+                    self.logout(client)
+                    client.force_login(user)
+                self.check_counter()
+
+        self.run_threads(work, self.threads)
+
+        active_sessions = LoginSession.objects.filter(project=self.project, active=True).count()
+        self.assertEqual(self.check_counter(), active_sessions)
+        self.assertGreater(active_sessions, 0)
+        self.assertGreaterEqual(self.lowest, 0)
+
+    @mock.patch('accounts.views.messages')
+    def test_unverified_project_limit(self, messages):
+        project = Project.objects.create(name='Unverified', redirect_url='https://example.com/cb')
+        issued = []
+
+        def work(index):
+            client = self.client_for(self.users[index])
+            for _ in range(3):
+                access_id = self.ssocall(client, project)
+                if access_id is not None:
+                    issued.append(access_id)
+
+        self.run_threads(work, self.threads)
+
+        self.assertEqual(len(issued), UNVERIFIED_PROJECT_LOGIN_LIMIT)
+        self.assertEqual(LoginSession.objects.filter(project=project, active=True).count(), UNVERIFIED_PROJECT_LOGIN_LIMIT)
+        self.assertEqual(self.check_counter(project), UNVERIFIED_PROJECT_LOGIN_LIMIT)
+
+    def test_concurrent_logouts_release_each_session_once(self):
+        # Every user is signed in on one device per thread
+        clients = [[self.client_for(user) for user in self.users] for _ in range(self.threads)]
+        for user_clients in clients[:3]:
+            for client in user_clients:
+                self.ssocall(client)
+        self.assertEqual(self.check_counter(), 3 * len(self.users))
+
+        # Every thread logs every user out on its device at once
+        self.run_threads(lambda index: [self.logout(client) for client in clients[index]], self.threads)
+
+        self.assertEqual(LoginSession.objects.filter(active=True).count(), 0)
+        self.assertEqual(self.check_counter(), 0)
+        self.assertGreaterEqual(self.lowest, 0)
+
+    def test_reconcile_during_logins(self):
+        def work(index):
+            if index == 0:
+                for _ in range(self.logins_per_thread):
+                    reconcile_active_logins()
+                return
+            client = self.client_for(self.users[index])
+            for i in range(self.logins_per_thread):
+                self.ssocall(client)
+                if i % 3 == 2:
+                    self.logout(client)
+                    client.force_login(self.users[index])
+
+        self.run_threads(work, self.threads)
+
+        active_sessions = LoginSession.objects.filter(project=self.project, active=True).count()
+        self.assertEqual(self.check_counter(), active_sessions)
+        self.assertEqual(reconcile_active_logins(), 0)
+
+    def test_release_never_goes_below_zero(self):
+        self.ssocall(self.client_for(self.users[0]))
+        self.run_threads(lambda index: release_project_logins(self.project.pk, 1), self.threads)
+        self.assertEqual(self.check_counter(), 0)
+        self.assertGreaterEqual(self.lowest, 0)
@@ -0,0 +1,162 @@
+"""
+Resized WebP and PNG variants of project logos.
+
+Owners upload logos of any size, but pages show them at 44-80 CSS pixels. For
+each width in PROJECT_LOGO_THUMBNAIL_WIDTHS the logo is centre-cropped to a
+square (as ``object-fit: cover`` would show it) and stored next to the original
+under ``project_logos/thumbs/``. The names contain a hash of the original's
+bytes, so a variant never changes once written and is served with an
+``immutable`` Cache-Control. What was generated is recorded in
+``Project.logo_thumbnails``; templates use it through ``logo_variants()`` and
+fall back to the original while it is empty (see ``python manage.py
+backfill_thumbnails``). Variants are generated after the project's save has
+committed (accounts/signals.py), and those of a replaced logo are deleted.
+"""
+import hashlib
+import io
+import logging
+import posixpath
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .storage import CachedMinioMediaStorage
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'project_logos/thumbs'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# format: (Pillow format, save options)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 85, 'method': 6}),
+    'png': ('PNG', {'optimize': True}),
+}
+
+
+class ThumbnailStorage(CachedMinioMediaStorage):
+    """The media bucket, writing objects with a long-lived immutable Cache-Control."""
+
+    def __init__(self):
+        super().__init__()
+        self.object_metadata = {**(self.object_metadata or {}), 'Cache-Control': IMMUTABLE_CACHE_CONTROL}
+
+
+@lru_cache(maxsize=None)
+def get_storage():
+    return ThumbnailStorage()
+
+
+def is_current(project):
+    """Whether the recorded variants belong to the current logo and width setting."""
+    thumbnails = project.logo_thumbnails or {}
+    if not project.logo:
+        return not thumbnails
+    return (
+        thumbnails.get('source') == project.logo.name
+        and thumbnails.get('widths') == list(settings.PROJECT_LOGO_THUMBNAIL_WIDTHS)
+    )
+
+
+def render_thumbnail(image, width, format):
+    """Encode a ``width`` x ``width`` crop of ``image`` in ``format``; returns bytes."""
+    pil_format, options = FORMATS[format]
+    thumbnail = ImageOps.fit(image, (width, width), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    thumbnail.save(output, pil_format, **options)
+    return output.getvalue()
+
+
+def generate_thumbnails(logo, storage=None):
+    """
+    Write every variant of ``logo`` (a FieldFile) and return the dict stored in
+    ``Project.logo_thumbnails``.
+    """
+    storage = storage or get_storage()
+    logo.open('rb')
+    try:
+        data = logo.read()
+    finally:
+        logo.close()
+
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    stem = posixpath.splitext(posixpath.basename(logo.name))[0]
+    widths = list(settings.PROJECT_LOGO_THUMBNAIL_WIDTHS)
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        variants = {}
+        for format in FORMATS:
+            variants[format] = {}
+            for width in widths:
+                name = f'{THUMBNAIL_DIR}/{stem}-{digest}-{width}.{format}'
+                if not storage.exists(name):
+                    name = storage.save(name, ContentFile(render_thumbnail(image, width, format)))
+                variants[format][str(width)] = name
+
+    return {'source': logo.name, 'widths': widths, 'variants': variants}
+
+
+def refresh_project_thumbnails(project, force=False):
+    """
+    Generate the variants of ``project.logo`` unless they are current. Writes the
+    result with an UPDATE (no signals) and returns True if anything changed.
+    Unreadable images are logged and leave the project on its original logo.
+    """
+    from .models import Project
+
+    if is_current(project) and not force:
+        return False
+    previous = project.logo_thumbnails or {}
+    thumbnails = {}
+    if project.logo:
+        try:
+            thumbnails = generate_thumbnails(project.logo)
+        except Exception:
+            logger.exception(f"Could not generate logo thumbnails for project {project.pk}")
+    project.logo_thumbnails = thumbnails
+    project.__dict__.pop('logo_variants', None)
+    Project.objects.filter(pk=project.pk).update(logo_thumbnails=thumbnails)
+
+    # After a failed attempt at the same logo, keep its variants for the next one
+    if thumbnails or previous.get('source') != project.logo.name:
+        delete_variants(variant_names(previous) - variant_names(thumbnails))
+    return True
+
+
+def variant_names(thumbnails):
+    """Storage names of every variant recorded in a ``Project.logo_thumbnails`` dict."""
+    return {name for names in (thumbnails or {}).get('variants', {}).values() for name in names.values()}
+
+
+def delete_variants(names, storage=None):
+    """Delete variant files; failures are logged, since an orphaned file is harmless."""
+    storage = storage or get_storage()
+    for name in names:
+        try:
+            storage.delete(name)
+        except Exception:
+            logger.exception(f"Could not delete logo thumbnail {name}")
+
+
+def logo_variants(thumbnails):
+    """
+    ``srcset`` values for a ``<picture>`` built from ``Project.logo_thumbnails``:
+    ``webp_srcset``, ``png_srcset`` and ``png`` (the smallest PNG, for ``src``).
+    Empty if there are no variants.
+    """
+    variants = (thumbnails or {}).get('variants')
+    if not variants:
+        return {}
+    storage = get_storage()
+    srcsets = {}
+    for format, names in variants.items():
+        srcsets[f'{format}_srcset'] = ', '.join(
+            f'{storage.url(name)} {width}w' for width, name in sorted(names.items(), key=lambda item: int(item[0]))
+        )
+    smallest = min(variants['png'], key=int)
+    srcsets['png'] = storage.url(variants['png'][smallest])
+    return srcsets
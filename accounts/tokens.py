@@ -0,0 +1,186 @@
+"""
+Signed access tokens for relying projects.
+
+Projects with ``signed_access_tokens`` enabled receive a compact JWS (EdDSA over
+Ed25519) as their ``accessid`` instead of an opaque session key. The token holds
+the same user data that ``/project/getuserdata`` returns, so a project can check
+the signature against the published key set (``/.well-known/jwks.json``) and
+skip the round trip entirely.
+"""
+import base64
+import hashlib
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+
+ALGORITHM = 'EdDSA'
+
+
+class InvalidAccessToken(Exception):
+    """Raised when a token is malformed, badly signed or expired."""
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(value):
+    padding = '=' * (-len(value) % 4)
+    return base64.urlsafe_b64decode(value + padding)
+
+
+def _json(data):
+    return json.dumps(data, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def _read_key_file(path):
+    with open(path, 'rb') as key_file:
+        return key_file.read()
+
+
+@lru_cache(maxsize=1)
+def get_signing_key():
+    """
+    Load the Ed25519 private key from ``SSO_TOKEN_SIGNING_KEY_FILE``.
+    Returns None when token signing is not configured.
+    """
+    if not settings.SSO_TOKEN_SIGNING_KEY_FILE:
+        return None
+
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+    return load_pem_private_key(_read_key_file(settings.SSO_TOKEN_SIGNING_KEY_FILE), password=None)
+
+
+@lru_cache(maxsize=1)
+def get_verification_keys():
+    """
+    Return ``{kid: public_key}`` for the signing key and any retired keys listed in
+    ``SSO_TOKEN_PUBLIC_KEY_FILES`` (kept so tokens issued before a rotation still verify).
+    """
+    keys = []
+    signing_key = get_signing_key()
+    if signing_key is not None:
+        keys.append(signing_key.public_key())
+    if settings.SSO_TOKEN_PUBLIC_KEY_FILES:
+        from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+        for path in settings.SSO_TOKEN_PUBLIC_KEY_FILES:
+            keys.append(load_pem_public_key(_read_key_file(path)))
+    return {key_id(key): key for key in keys}
+
+
+def is_enabled():
+    """Token issuance is only available once a signing key is configured."""
+    return get_signing_key() is not None
+
+
+def _raw_public_bytes(public_key):
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+    return public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+
+def key_id(public_key):
+    """RFC 7638 thumbprint of the key, used as the ``kid`` header."""
+    thumbprint_input = _json({'crv': 'Ed25519', 'kty': 'OKP', 'x': _b64encode(_raw_public_bytes(public_key))})
+    return _b64encode(hashlib.sha256(thumbprint_input).digest())
+
+
+def get_jwks():
+    """Public key set in JWK Set format."""
+    return {
+        'keys': [
+            {
+                'kty': 'OKP',
+                'crv': 'Ed25519',
+                'x': _b64encode(_raw_public_bytes(key)),
+                'kid': kid,
+                'use': 'sig',
+                'alg': ALGORITHM,
+            }
+            for kid, key in get_verification_keys().items()
+        ]
+    }
+
+
+def issue_access_token(session, user_data):
+    """
+    Sign a token for a LoginSession. The ``jti`` claim is the session key, so the
+    token can still be exchanged at ``/project/getuserdata`` like an opaque ID.
+    """
+    signing_key = get_signing_key()
+    if signing_key is None:
+        raise InvalidAccessToken('Token signing is not configured')
+
+    header = {'alg': ALGORITHM, 'typ': 'JWT', 'kid': key_id(signing_key.public_key())}
+    claims = dict(user_data)
+    claims.update({
+        'iss': settings.SSO_TOKEN_ISSUER,
+        'aud': str(session.project_id),
+        'sub': str(session.user_id),
+        'jti': session.sessionkey,
+        'iat': int(session.created_at.timestamp()),
+        'exp': int(session.expires_at.timestamp()),
+    })
+
+    signing_input = f'{_b64encode(_json(header))}.{_b64encode(_json(claims))}'
+    signature = signing_key.sign(signing_input.encode('ascii'))
+    return f'{signing_input}.{_b64encode(signature)}'
+
+
+def looks_like_token(value):
+    return isinstance(value, str) and value.count('.') == 2
+
+
+def session_key_for(access_id):
+    """
+    The LoginSession key behind an accessid: signed tokens carry it in their jti
+    claim, opaque IDs are the key itself. Raises InvalidAccessToken for bad tokens.
+    """
+    if not looks_like_token(access_id):
+        return access_id
+    claims = verify_access_token(access_id)
+    if 'jti' not in claims:
+        raise InvalidAccessToken('Token has no jti claim')
+    return claims['jti']
+
+
+def verify_access_token(token):
+    """
+    Check the signature and expiry of a token and return its claims.
+    Raises InvalidAccessToken on any failure.
+    """
+    from cryptography.exceptions import InvalidSignature
+
+    try:
+        encoded_header, encoded_claims, encoded_signature = token.split('.')
+        header = json.loads(_b64decode(encoded_header))
+        claims = json.loads(_b64decode(encoded_claims))
+        signature = _b64decode(encoded_signature)
+    except (ValueError, AttributeError):
+        raise InvalidAccessToken('Malformed token')
+
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        raise InvalidAccessToken('Malformed token')
+
+    if header.get('alg') != ALGORITHM:
+        raise InvalidAccessToken('Unsupported algorithm')
+
+    kid = header.get('kid')
+    public_key = get_verification_keys().get(kid) if isinstance(kid, str) else None
+    if public_key is None:
+        raise InvalidAccessToken('Unknown signing key')
+
+    try:
+        public_key.verify(signature, f'{encoded_header}.{encoded_claims}'.encode('ascii'))
+    except InvalidSignature:
+        raise InvalidAccessToken('Bad signature')
+
+    expires = claims.get('exp')
+    if not isinstance(expires, (int, float)) or expires < timezone.now().timestamp():
+        raise InvalidAccessToken('Token has expired')
+
+    return claims
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     home, 
@@ -10,15 +11,26 @@ from .views import (
     edit_profile, 
     documentation, 
     return_user_data,
+    return_user_data_batch,
+    jwks,
     forgotpassword,
     resetpassword,
     add_project,
     manage_projects,
     project_details,
     verify_project,
-    delete_project
+    delete_project,
+    email_health,
+    cache_stats,
+    export_data,
+    metrics_view,
+    profile_token
 )
 
+if settings.SSO_ASYNC_VIEWS:
+    # Serve the hot SSO endpoints with their async versions (see accounts.async_views)
+    from .async_views import login_view, project_ssocall, return_user_data
+
 # URL patterns for the application
 urlpatterns = [
     # Home page
@@ -49,6 +61,10 @@ urlpatterns = [
 
     # API for retrieving user data via SSO session
     path('project/getuserdata', return_user_data, name='return_user_data'),
+    path('project/getuserdata/batch', return_user_data_batch, name='return_user_data_batch'),
+
+    # Public keys for verifying signed access tokens
+    path('.well-known/jwks.json', jwks, name='jwks'),
 
     # Forgot password
     path('forgotpassword/', forgotpassword, name='forgotpassword'),
@@ -70,4 +86,19 @@ urlpatterns = [
 
     # Delete project
     path('projects/<uuid:project_id>/delete/', delete_project, name='delete_project'),
+
+    # Sender account health (staff only)
+    path('staff/email-health/', email_health, name='email_health'),
+
+    # Cache hit ratios of this worker (staff only)
+    path('staff/cache-stats/', cache_stats, name='cache_stats'),
+
+    # Signed header for detailed request profiles (staff only)
+    path('staff/profile-token/', profile_token, name='profile_token'),
+
+    # Prometheus metrics (staff or SSO_METRICS_TOKEN)
+    path('metrics', metrics_view, name='metrics'),
+
+    # Streaming data exports (staff only)
+    path('staff/export/<str:name>/', export_data, name='export_data'),
 ]
@@ -0,0 +1,166 @@
+"""
+Read-through cache for the ``/project/getuserdata`` payload.
+
+Entries are keyed by session key and never outlive the LoginSession. Profile or
+User changes bump a per-user version so every cached payload for that user is
+ignored on the next read; session changes delete the entry directly. Any Django
+cache backend works (``SSO_USERDATA_CACHE_ALIAS``), including local memory.
+The ``a``-prefixed functions are the same operations for async views.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from . import metrics
+
+KEY_PREFIX = 'sso:userdata'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _cache():
+    return caches[settings.SSO_USERDATA_CACHE_ALIAS]
+
+
+def _payload_key(session_key):
+    return f'{KEY_PREFIX}:session:{session_key}'
+
+
+def _version_key(user_id):
+    return f'{KEY_PREFIX}:user:{user_id}'
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+    metrics.record_cache_lookup('userdata', outcome)
+
+
+def get_stats():
+    """Hit/miss counters for this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = stats['hits'] / total if total else 0.0
+    return stats
+
+
+def get_user_data(session_key):
+    """Return the cached payload for a session key, or None on a miss."""
+    cache = _cache()
+    entry = cache.get(_payload_key(session_key))
+    if entry is not None and entry['version'] == cache.get(_version_key(entry['user_id']), 0):
+        _record('hits')
+        return entry['data']
+    _record('misses')
+    return None
+
+
+async def aget_user_data(session_key):
+    cache = _cache()
+    entry = await cache.aget(_payload_key(session_key))
+    if entry is not None and entry['version'] == await cache.aget(_version_key(entry['user_id']), 0):
+        _record('hits')
+        return entry['data']
+    _record('misses')
+    return None
+
+
+def get_many_user_data(session_keys):
+    """Cached payloads for several session keys, as ``{session_key: data}`` (hits only)."""
+    cache = _cache()
+    entries = cache.get_many([_payload_key(key) for key in session_keys])
+    versions = cache.get_many({_version_key(entry['user_id']) for entry in entries.values()})
+
+    found = {}
+    for session_key in session_keys:
+        entry = entries.get(_payload_key(session_key))
+        if entry is not None and entry['version'] == versions.get(_version_key(entry['user_id']), 0):
+            found[session_key] = entry['data']
+    with _stats_lock:
+        _stats['hits'] += len(found)
+        _stats['misses'] += len(set(session_keys)) - len(found)
+    return found
+
+
+def _timeout(session):
+    return min(
+        int((session.expires_at - timezone.now()).total_seconds()),
+        settings.SSO_USERDATA_CACHE_TIMEOUT,
+    )
+
+
+def set_user_data(session, data):
+    """Cache a payload until the session expires (capped by SSO_USERDATA_CACHE_TIMEOUT)."""
+    timeout = _timeout(session)
+    if timeout <= 0:
+        return
+
+    cache = _cache()
+    entry = {
+        'user_id': session.user_id,
+        'version': cache.get(_version_key(session.user_id), 0),
+        'data': data,
+    }
+    cache.set(_payload_key(session.sessionkey), entry, timeout)
+
+
+async def aset_user_data(session, data):
+    timeout = _timeout(session)
+    if timeout <= 0:
+        return
+
+    cache = _cache()
+    entry = {
+        'user_id': session.user_id,
+        'version': await cache.aget(_version_key(session.user_id), 0),
+        'data': data,
+    }
+    await cache.aset(_payload_key(session.sessionkey), entry, timeout)
+
+
+def set_many_user_data(sessions_data):
+    """
+    Cache payloads for several sessions, given as ``(session, data)`` pairs, in
+    one round trip. They share the shortest timeout among them.
+    """
+    sessions_data = [(session, data) for session, data in sessions_data if _timeout(session) > 0]
+    if not sessions_data:
+        return
+    timeout = min(_timeout(session) for session, _ in sessions_data)
+
+    cache = _cache()
+    versions = cache.get_many({_version_key(session.user_id) for session, _ in sessions_data})
+    cache.set_many({
+        _payload_key(session.sessionkey): {
+            'user_id': session.user_id,
+            'version': versions.get(_version_key(session.user_id), 0),
+            'data': data,
+        }
+        for session, data in sessions_data
+    }, timeout)
+
+
+def invalidate_session(session_key):
+    _cache().delete(_payload_key(session_key))
+
+
+def invalidate_sessions(session_keys):
+    """``invalidate_session()`` for many sessions with one ``delete_many``."""
+    _cache().delete_many([_payload_key(session_key) for session_key in session_keys])
+
+
+def invalidate_user(user_id):
+    """Drop every cached payload for a user by bumping their version."""
+    cache = _cache()
+    key = _version_key(user_id)
+    # The version must outlive any payload it guards
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, 1, None)
@@ -5,13 +5,8 @@ import environ
 import os
 from pathlib import Path
 from .models import SSOSession
-import hashlib
-import base64
-import uuid
-from datetime import datetime
-from .models import LoginSession
-import time
-from .email_utils import send_email
+from .access_ids import get_access_id_generator
+from .email_utils import send_or_queue_email
 from django.template.loader import render_to_string
 
 
@@ -19,18 +14,10 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 env = environ.Env()
 environ.Env.read_env(env_file=os.path.join(BASE_DIR, '.env'))
 
-def send_verification_email(user):
+def build_verification_email(user, token):
     """
-    Send email verification link to the user
+    Return the (subject, message, html_message) of the verification email for a token
     """
-    # Generate a unique verification token
-    token = str(uuid.uuid4())
-    
-    # Update user's profile with the verification token
-    profile = user.profile
-    profile.verification_token = token
-    profile.save()
-    
     # Construct verification link
     verification_link = f"{env('HOST_URL')}{reverse('confirm_email', kwargs={'token': token})}"
     
@@ -40,11 +27,27 @@ def send_verification_email(user):
         'verification_link': verification_link
     })
     
-    # Send email
     subject = 'Verify Your Email - ITC SSO'
     message = f'Click the following link to verify your email: {verification_link}'
+    return subject, message, html_message
+
+
+def send_verification_email(user):
+    """
+    Send email verification link to the user
+    """
+    # Generate a unique verification token
+    token = str(uuid.uuid4())
+    
+    # Update user's profile with the verification token
+    profile = user.profile
+    profile.verification_token = token
+    profile.save()
     
-    return send_email(
+    # Send email
+    subject, message, html_message = build_verification_email(user, token)
+    
+    return send_or_queue_email(
         subject, 
         message, 
         [user.email], 
@@ -76,7 +79,7 @@ def send_reset_password_email(user):
     subject = 'Password Reset - ITC SSO'
     message = f'Click the following link to reset your password: {reset_link}'
     
-    return send_email(
+    return send_or_queue_email(
         subject, 
         message, 
         [user.email], 
@@ -101,12 +104,21 @@ def get_user_from_sso(request):
     return None
 
 
+def build_user_data(profile):
+    """
+    User data shared with relying projects, both from getuserdata and inside signed tokens.
+    """
+    return {
+        "name": profile.name,
+        "roll": profile.roll,
+        "department": profile.department,
+        "degree": profile.degree,
+        "passing_year": profile.passing_year
+    }
+
+
 def generate_encrypted_id(user_id, project_id):
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    raw_string = f"{user_id}-{project_id}-{timestamp}"
-    hash_object = hashlib.sha256(raw_string.encode())
-    encrypted_id = base64.urlsafe_b64encode(hash_object.digest()).decode('utf-8')
-    if LoginSession.objects.filter(sessionkey=encrypted_id).exists():
-        time.sleep(1)
-        return generate_encrypted_id(user_id, project_id)
-    return encrypted_id
+    """
+    Mint a new access ID with the configured generator (see accounts.access_ids).
+    """
+    return get_access_id_generator().generate(user_id, project_id)
@@ -4,8 +4,19 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
 from .models import Profile, Project, LoginSession, SSOSession
 from .forms import RegistrationForm, LoginForm, EditProfileForm, ProjectForm
-from .utils import send_verification_email, send_reset_password_email, generate_encrypted_id
-from django.http import JsonResponse
+from .utils import send_verification_email, send_reset_password_email, generate_encrypted_id, build_user_data
+from . import catalog, exports, metrics, profiling, tokens, userdata_cache
+from .sweeper import expire_stale_sessions
+from .email_utils import EmailSender
+from .middleware import get_page_cache_stats
+from .storage import get_media_url_stats
+from django.http import (
+    JsonResponse, StreamingHttpResponse, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, Http404,
+)
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 from rest_framework import status
 from rest_framework.decorators import api_view
 import logging
@@ -21,23 +32,21 @@ def home(request):
     """
     Show the homepage. If the user is logged in, display their current and previous SSO sessions,
     as well as all verified Project. If the user is not logged in, show the default homepage.
+    The verified project sidebar comes from the cached catalog (see accounts.catalog).
     """
-
-    project = Project.objects.filter(is_verified=True)
+    catalog_version = catalog.get_version()
+    context = {
+        'Project': catalog.get_verified_projects(catalog_version),
+        'project_catalog_version': catalog_version,
+        'project_catalog_timeout': settings.SSO_PROJECT_CATALOG_TIMEOUT,
+    }
 
     if request.user.is_authenticated:
         sso_sessions = SSOSession.objects.filter(user=request.user).order_by('-created_at')[0:5]
         
-        return render(request, 'home.html', {
-            'sso_sessions': sso_sessions,
-            'user': request.user,
-            'Project': project,
-        })
+        return render(request, 'home.html', dict(context, sso_sessions=sso_sessions, user=request.user))
     else:
-        return render(request, 'home.html', {
-            'sso_sessions': None,
-            'Project': project,
-        })
+        return render(request, 'home.html', dict(context, sso_sessions=None))
 
 def documentation(request):
     """ Render the documentation page """
@@ -75,14 +84,23 @@ def login_view(request):
                     # Get next URL from POST data if available, otherwise from GET parameter
                     next_url = request.POST.get('next', next_url)
                     
+                    metrics.inc('sso_password_logins_total', ('success',))
                     messages.success(request, f'Welcome, {user.username}!')
                     # Use the next_url directly instead of hardcoding 'home'
                     return redirect(next_url)
                 else:
+                    metrics.inc('sso_password_logins_total', ('unverified',))
                     messages.error(request, 'Email not verified. Please verify your email to log in.')
             else:
+                metrics.inc('sso_password_logins_total', ('invalid',))
                 messages.error(request, 'Invalid roll number or password, are you registered?')
+        except Profile.DoesNotExist:
+            # e.g. accounts made with createsuperuser
+            metrics.inc('sso_password_logins_total', ('error',))
+            logger.error(f"Login error: user {roll} has no profile")
+            messages.error(request, 'An error occurred while logging in. Please try again.')
         except Exception as e:
+            metrics.inc('sso_password_logins_total', ('error',))
             logger.error(f"Login error: {e}")
             messages.error(request, 'An error occurred while logging in. Please try again.')
 
@@ -103,11 +121,9 @@ def logout_view(request):
             else:
                 SSOSession.objects.filter(user=request.user, device=request.META['HTTP_USER_AGENT'][:100]).latest('created_at').update(active=False)
                 
-            # Deactivate all active login sessions for this user
-            # This will trigger the save method which decrements the active_logins counter
-            for session in LoginSession.objects.filter(user=request.user, active=True):
-                session.active = False
-                session.save()
+            # Deactivate all active login sessions for this user and release
+            # their projects' active_logins in bulk
+            LoginSession.objects.filter(user=request.user, active=True).deactivate()
                 
         except SSOSession.DoesNotExist:
             logger.error(f"Session not found for user {request.user.username}")
@@ -328,51 +344,115 @@ def verify_project(request, project_id):
     messages.success(request, f'Project {project.name} has been verified.')
     return redirect('admin:accounts_project_changelist')
 
+@user_passes_test(lambda u: u.is_staff)
+def email_health(request):
+    """
+    Show the circuit breaker state, daily quota use and connection stats of each sender account
+    """
+    sender = EmailSender()
+    return JsonResponse({
+        'health': sender.health(),
+        'connections': sender.stats(),
+    })
+
+@user_passes_test(lambda u: u.is_staff)
+def cache_stats(request):
+    """
+    Show the hit ratios of the page, getuserdata and media URL caches in this worker process
+    """
+    return JsonResponse({
+        'page_cache': get_page_cache_stats(),
+        'userdata_cache': userdata_cache.get_stats(),
+        'media_urls': get_media_url_stats(),
+    })
+
+@user_passes_test(lambda u: u.is_staff)
+def profile_token(request):
+    """
+    Issue a signed X-SSO-Profile header value; requests sending it log a detailed profile
+    """
+    return JsonResponse({
+        'header': profiling.PROFILE_HEADER,
+        'value': profiling.make_profile_token(request.user.username),
+        'expires_in': settings.SSO_PROFILE_TOKEN_MAX_AGE,
+    })
+
+def metrics_view(request):
+    """
+    Prometheus metrics (see accounts.metrics) for staff or for scrapers sending
+    ``Authorization: Bearer <SSO_METRICS_TOKEN>``
+    """
+    token = settings.SSO_METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    if not request.user.is_staff and not (token and constant_time_compare(authorization, f'Bearer {token}')):
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@login_required(login_url='/login/')
+def export_data(request, name):
+    """
+    Stream an export (see accounts.exports) as CSV or JSONL. Staff only.
+    Query parameters: format, since and until (ISO dates or datetimes).
+    """
+    if not request.user.is_staff:
+        return HttpResponseForbidden('Forbidden')
+    if name not in exports.EXPORTS:
+        raise Http404('Unknown export')
+    format = request.GET.get('format', 'csv')
+    if format not in exports.FORMATS:
+        return HttpResponseBadRequest('format must be csv or jsonl')
+    try:
+        since = exports.parse_boundary(request.GET.get('since'))
+        until = exports.parse_boundary(request.GET.get('until'), end=True)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(
+        exports.stream_export(name, format, since, until),
+        content_type=exports.FORMATS[format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{name}-{timezone.now():%Y%m%d%H%M%S}.{format}"'
+    return response
+
 @login_required(login_url='/login/')
 def project_ssocall(request, id):
     project = get_object_or_404(Project, id=id)    
     user = request.user
 
-    if not project.can_accept_new_login():
-        messages.error(request, 'This unverified project has reached its maximum login limit (10 active logins).')
-        return redirect('home')
-
     newid = generate_encrypted_id(user.id, project.id)
     project_url = project.redirect_url
 
-    # First clean up any expired sessions for this project
-    for session in LoginSession.objects.filter(project=project, active=True):
-        if not session.is_session_valid():
-            # The is_session_valid method will handle the deactivation and counter decrement
-            pass
-
-    # Update the active_logins count to ensure it's accurate
-    active_count = LoginSession.objects.filter(project=project, active=True).count()
-    if project.active_logins != active_count:
-        project.active_logins = active_count
-        project.save()
-
-    # Check if there's an existing valid session
-    if LoginSession.objects.filter(sessionkey=newid).exists():
-        session = LoginSession.objects.get(sessionkey=newid)
-        if session.is_session_valid():
-            return redirect(f'{project_url}?accessid={session.sessionkey}')
-        else:
-            # Session has expired, it's already been deactivated by is_session_valid
-            session.delete()  # We can delete it now as we'll create a new one
+    with transaction.atomic():
+        # Count this login against the project; fails once an unverified project is full.
+        # Expired sessions are normally released by the sweeper, but a full project
+        # releases its own before refusing the login.
+        if not project.reserve_login():
+            expire_stale_sessions(project=project)
+            if not project.reserve_login():
+                metrics.inc('sso_logins_total', (str(project.id), 'refused'))
+                messages.error(request, 'This unverified project has reached its maximum login limit (10 active logins).')
+                return redirect('home')
 
-    # Create a new session and increment the counter
-    session = LoginSession.objects.create(sessionkey=newid, user=user, project=project)
-    project.active_logins += 1
-    project.save()
+        session = LoginSession.objects.create(sessionkey=newid, user=user, project=project)
+    metrics.inc('sso_logins_total', (str(project.id), 'issued'))
 
     return render(request, 'ssologin.html', {
         'project': project, 
-        'redirecturl': f'{project_url}?accessid={session.sessionkey}',
+        'redirecturl': f'{project_url}?accessid={get_access_id(session, user.profile)}',
         'user': user.profile.name
     })
 
 
+def get_access_id(session, profile):
+    """
+    Return the accessid handed to the project: a signed token for projects that
+    opted in (and when a signing key is configured), otherwise the session key.
+    """
+    if session.project.signed_access_tokens and tokens.is_enabled():
+        return tokens.issue_access_token(session, build_user_data(profile))
+    return session.sessionkey
+
+
 @api_view(['POST'])
 def return_user_data(request):
     """
@@ -383,6 +463,15 @@ def return_user_data(request):
     if not session_id:
         return JsonResponse({"error": "Session ID is required"}, status=status.HTTP_400_BAD_REQUEST)
 
+    try:
+        session_id = tokens.session_key_for(session_id)
+    except tokens.InvalidAccessToken:
+        return JsonResponse({"error": "Invalid access token"}, status=status.HTTP_403_FORBIDDEN)
+
+    data = userdata_cache.get_user_data(session_id)
+    if data is not None:
+        return JsonResponse(data, status=200)
+
     try:
         session = LoginSession.objects.get(sessionkey=session_id)
     except LoginSession.DoesNotExist:
@@ -393,13 +482,72 @@ def return_user_data(request):
         return JsonResponse({"error": "Session has expired"}, status=status.HTTP_403_FORBIDDEN)
 
     person = Profile.objects.get(user=session.user)
-    return JsonResponse({
-        "name": person.name,
-        "roll": person.roll,
-        "department": person.department,
-        "degree": person.degree,
-        "passing_year": person.passing_year
-    }, status=200)
+    data = build_user_data(person)
+    userdata_cache.set_user_data(session, data)
+    return JsonResponse(data, status=200)
+
+
+@api_view(['POST'])
+def return_user_data_batch(request):
+    """
+    Resolve many access IDs at once: ``{"ids": [...]}`` in, one result per ID out,
+    in request order. Each result carries either ``data`` or an ``error`` and the
+    ``status`` the single-ID endpoint would have answered with.
+    Cache misses are resolved with one query and expired sessions deactivated in bulk.
+    """
+    ids = request.data.get('ids')
+    if not isinstance(ids, list) or not ids or not all(isinstance(access_id, str) for access_id in ids):
+        return JsonResponse({"error": "A non-empty list of IDs is required"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > settings.SSO_USERDATA_BATCH_LIMIT:
+        return JsonResponse(
+            {"error": f"At most {settings.SSO_USERDATA_BATCH_LIMIT} IDs per request"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    results = {}
+    session_keys = {}
+    for access_id in ids:
+        try:
+            session_keys[access_id] = tokens.session_key_for(access_id)
+        except tokens.InvalidAccessToken:
+            results[access_id] = {"error": "Invalid access token", "status": status.HTTP_403_FORBIDDEN}
+
+    cached = userdata_cache.get_many_user_data(list(session_keys.values()))
+    missing = {key for key in session_keys.values() if key not in cached}
+    sessions = {
+        session.sessionkey: session
+        for session in LoginSession.objects.select_related('user__profile').filter(sessionkey__in=missing)
+    } if missing else {}
+
+    now = timezone.now()
+    expired = [session.pk for session in sessions.values() if now > session.expires_at]
+    if expired:
+        LoginSession.objects.filter(pk__in=expired).deactivate()
+    fresh = {
+        session_key: build_user_data(session.user.profile)
+        for session_key, session in sessions.items() if now <= session.expires_at
+    }
+    userdata_cache.set_many_user_data([(sessions[session_key], data) for session_key, data in fresh.items()])
+
+    for access_id, session_key in session_keys.items():
+        data = cached.get(session_key, fresh.get(session_key))
+        if data is not None:
+            results[access_id] = {"data": data, "status": status.HTTP_200_OK}
+        elif session_key in sessions:
+            results[access_id] = {"error": "Session has expired", "status": status.HTTP_403_FORBIDDEN}
+        else:
+            results[access_id] = {"error": "Session not found", "status": status.HTTP_404_NOT_FOUND}
+
+    return JsonResponse({"results": [dict(results[access_id], id=access_id) for access_id in ids]}, status=200)
+
+
+def jwks(request):
+    """
+    Publish the public keys used to sign access tokens (JWK Set format).
+    """
+    response = JsonResponse(tokens.get_jwks())
+    response['Cache-Control'] = 'public, max-age=3600'
+    return response
 
 @login_required
 def delete_project(request, project_id):
@@ -46,6 +46,8 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'accounts.middleware.MetricsMiddleware',
+    'accounts.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  
@@ -55,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'accounts.middleware.AnonymousPageCacheMiddleware',
 ]
 
 
@@ -62,7 +65,8 @@ ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that times renders for accounts/profiling.py
+        'BACKEND': 'accounts.profiling.ProfiledDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -89,6 +93,25 @@ DATABASES = {
     }
 }
 
+# Password hashing (see accounts/hashers.py). Stored hashes are upgraded to the
+# preferred algorithm and cost on each user's next login. Size the cost with
+# `python manage.py bench_password_hashers`; 'argon2' needs argon2-cffi installed.
+PASSWORD_HASH_ALGORITHM = env('PASSWORD_HASH_ALGORITHM', default='pbkdf2_sha256')
+PASSWORD_HASH_ITERATIONS = env.int('PASSWORD_HASH_ITERATIONS', default=None)
+PASSWORD_HASH_SCRYPT_WORK_FACTOR = env.int('PASSWORD_HASH_SCRYPT_WORK_FACTOR', default=None)
+
+_PASSWORD_HASHER_CLASSES = {
+    'pbkdf2_sha256': 'accounts.hashers.TunablePBKDF2PasswordHasher',
+    'scrypt': 'accounts.hashers.TunableScryptPasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'pbkdf2_sha1': 'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'bcrypt_sha256': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+}
+# The preferred hasher comes first; the rest only verify (and upgrade) older hashes
+PASSWORD_HASHERS = [_PASSWORD_HASHER_CLASSES[PASSWORD_HASH_ALGORITHM]] + [
+    path for name, path in _PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASH_ALGORITHM
+]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -132,6 +155,8 @@ for i in range(1, EMAIL_CONFIG_COUNT + 1):
         'EMAIL_USE_TLS': env.bool(f'EMAIL_USE_TLS_{i}', default=True),
         'EMAIL_HOST_USER': env(f'EMAIL_HOST_USER_{i}', default=env('EMAIL_HOST_USER', default='')),
         'EMAIL_HOST_PASSWORD': env(f'EMAIL_HOST_PASSWORD_{i}', default=env('EMAIL_HOST_PASSWORD', default='')),
+        # Messages this account may send per day (Gmail allows roughly 500)
+        'DAILY_QUOTA': env.int(f'EMAIL_DAILY_QUOTA_{i}', default=env.int('EMAIL_DAILY_QUOTA', default=500)),
     }
     
     # Only add configuration if user and password are provided
@@ -146,6 +171,7 @@ if not EMAIL_CONFIGS:
         'EMAIL_USE_TLS': True,
         'EMAIL_HOST_USER': '',
         'EMAIL_HOST_PASSWORD': '',
+        'DAILY_QUOTA': 500,
     }]
 
 # Default to the first configuration
@@ -155,11 +181,102 @@ EMAIL_USE_TLS = EMAIL_CONFIGS[0]['EMAIL_USE_TLS']
 EMAIL_HOST_USER = EMAIL_CONFIGS[0]['EMAIL_HOST_USER']
 EMAIL_HOST_PASSWORD = EMAIL_CONFIGS[0]['EMAIL_HOST_PASSWORD']
 
+# SMTP connection pool per email configuration
+EMAIL_POOL_SIZE = env.int('EMAIL_POOL_SIZE', default=4)
+EMAIL_POOL_IDLE_TIMEOUT = env.int('EMAIL_POOL_IDLE_TIMEOUT', default=60)  # seconds
+EMAIL_POOL_HEALTH_CHECK_INTERVAL = env.int('EMAIL_POOL_HEALTH_CHECK_INTERVAL', default=15)  # seconds
+
+# Cache holding sent counts and rotation state shared by every worker; point
+# CACHE_URL at a shared backend (e.g. Redis) when running more than one process
+# (accounts.W001 warns when it is per process)
+EMAIL_STATE_CACHE_ALIAS = env('EMAIL_STATE_CACHE_ALIAS', default='default')
+
+# Retries and circuit breaking across email configurations
+EMAIL_RETRY_BASE_DELAY = env.float('EMAIL_RETRY_BASE_DELAY', default=0.5)  # seconds
+EMAIL_RETRY_MAX_DELAY = env.float('EMAIL_RETRY_MAX_DELAY', default=8)  # seconds
+EMAIL_CIRCUIT_FAILURE_THRESHOLD = env.int('EMAIL_CIRCUIT_FAILURE_THRESHOLD', default=3)
+EMAIL_CIRCUIT_RECOVERY_TIMEOUT = env.int('EMAIL_CIRCUIT_RECOVERY_TIMEOUT', default=60)  # seconds
+EMAIL_CIRCUIT_MAX_RECOVERY_TIMEOUT = env.int('EMAIL_CIRCUIT_MAX_RECOVERY_TIMEOUT', default=3600)  # seconds
+
 # Add a check to warn about missing email configuration
 if not EMAIL_HOST_USER or not EMAIL_HOST_PASSWORD:
     import warnings
     warnings.warn("Email configuration is missing. Email sending will be disabled.", UserWarning)
 
+# Access ID generator used by project_ssocall (see accounts/access_ids.py)
+SSO_ACCESS_ID_GENERATOR = env('SSO_ACCESS_ID_GENERATOR', default='accounts.access_ids.RandomAccessIdGenerator')
+
+# Run the session sweeper inside web workers every N seconds (0 disables it;
+# use `python manage.py expire_sessions` from cron instead)
+SSO_SESSION_SWEEP_INTERVAL = env.int('SSO_SESSION_SWEEP_INTERVAL', default=0)
+
+# Serve login, project_ssocall and getuserdata with their async versions
+# (accounts/async_views.py); only worthwhile when running under ASGI
+SSO_ASYNC_VIEWS = env.bool('SSO_ASYNC_VIEWS', default=False)
+
+# Session history retention (see `python manage.py archive_sessions`)
+SESSION_RETENTION_DAYS = env.int('SESSION_RETENTION_DAYS', default=90)
+SESSION_ARCHIVE_DIR = env('SESSION_ARCHIVE_DIR', default=str(BASE_DIR / 'archives'))
+
+# Signed access tokens (opt-in per project). Generate a key with
+# `python manage.py generate_token_key <path>`; list retired public keys so
+# tokens signed before a rotation keep verifying until they expire.
+SSO_TOKEN_SIGNING_KEY_FILE = env('SSO_TOKEN_SIGNING_KEY_FILE', default='')
+SSO_TOKEN_PUBLIC_KEY_FILES = env.list('SSO_TOKEN_PUBLIC_KEY_FILES', default=[])
+SSO_TOKEN_ISSUER = env('SSO_TOKEN_ISSUER', default=env('HOST_URL', default=''))
+
+# Cache backend, e.g. redis://127.0.0.1:6379/1 (defaults to per-process local memory)
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='locmemcache://'),
+}
+
+# getuserdata payload cache (see accounts/userdata_cache.py)
+SSO_USERDATA_CACHE_ALIAS = env('SSO_USERDATA_CACHE_ALIAS', default='default')
+SSO_USERDATA_CACHE_TIMEOUT = env.int('SSO_USERDATA_CACHE_TIMEOUT', default=3600)
+# How long the verified project catalog and its rendered sidebar are cached
+# (they are also invalidated whenever a project changes, in every worker only when
+# CACHE_URL is shared; see accounts/catalog.py)
+SSO_PROJECT_CATALOG_TIMEOUT = env.int('SSO_PROJECT_CATALOG_TIMEOUT', default=3600)
+# How long each worker reuses a generated media (logo) URL; capped at half the
+# lifetime of presigned URLs (accounts/storage.py). 0 disables it.
+SSO_MEDIA_URL_CACHE_TIMEOUT = env.int('SSO_MEDIA_URL_CACHE_TIMEOUT', default=3600)
+# Square sizes (px) of the WebP/PNG project logo variants (accounts/thumbnails.py);
+# pages show logos at 44-80 CSS px, so these cover 1x and 2x screens
+PROJECT_LOGO_THUMBNAIL_WIDTHS = env.list('PROJECT_LOGO_THUMBNAIL_WIDTHS', cast=int, default=[88, 160])
+
+# Full-page cache for anonymous visitors (accounts/middleware.py); pages that issue
+# a CSRF token, such as login and register, are never stored. 0 disables it.
+SSO_PAGE_CACHE_TIMEOUT = env.int('SSO_PAGE_CACHE_TIMEOUT', default=300)
+SSO_PAGE_CACHE_MAX_AGE = env.int('SSO_PAGE_CACHE_MAX_AGE', default=60)
+SSO_PAGE_CACHE_ALIAS = env('SSO_PAGE_CACHE_ALIAS', default='default')
+SSO_PAGE_CACHE_URL_NAMES = env.list('SSO_PAGE_CACHE_URL_NAMES', default=['home', 'docs', 'robots_txt'])
+
+# Prometheus metrics at /metrics (accounts/metrics.py). A thread in each worker adds
+# its counts to the cache every SSO_METRICS_FLUSH_INTERVAL seconds, which must be shared
+# (Redis) with more than one process; without a token only staff can read the endpoint.
+SSO_METRICS_TOKEN = env('SSO_METRICS_TOKEN', default='')
+SSO_METRICS_CACHE_ALIAS = env('SSO_METRICS_CACHE_ALIAS', default='default')
+SSO_METRICS_FLUSH_INTERVAL = env.int('SSO_METRICS_FLUSH_INTERVAL', default=10)
+SSO_METRICS_VIEWS = env.list('SSO_METRICS_VIEWS', default=[
+    'login_view', 'project_ssocall', 'return_user_data', 'return_user_data_batch', 'register',
+])
+
+# Requests and queries slower than these (ms) are logged as JSON to the
+# accounts.profiling logger (accounts/profiling.py); 0 disables either log.
+SSO_SLOW_REQUEST_MS = env.int('SSO_SLOW_REQUEST_MS', default=1000)
+SSO_SLOW_QUERY_MS = env.int('SSO_SLOW_QUERY_MS', default=100)
+# How long a signed X-SSO-Profile header (manage.py profile_token) stays valid;
+# it also stops working once its user is no longer active staff
+SSO_PROFILE_TOKEN_MAX_AGE = env.int('SSO_PROFILE_TOKEN_MAX_AGE', default=900)
+
+# Most access IDs /project/getuserdata/batch resolves per request
+SSO_USERDATA_BATCH_LIMIT = env.int('SSO_USERDATA_BATCH_LIMIT', default=100)
+
+# Email outbox: views queue mail and `python manage.py email_worker` sends it
+EMAIL_OUTBOX_ENABLED = env.bool('EMAIL_OUTBOX_ENABLED', default=False)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.int('EMAIL_OUTBOX_MAX_ATTEMPTS', default=5)
+EMAIL_OUTBOX_RETRY_DELAY = env.int('EMAIL_OUTBOX_RETRY_DELAY', default=60)  # seconds, doubles per attempt
+
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 SESSION_COOKIE_AGE = 1209600  
 SESSION_COOKIE_SECURE = True  
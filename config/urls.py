@@ -19,22 +19,17 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
-from django.contrib.sitemaps.views import sitemap
 from django.views.generic import TemplateView, RedirectView
-from accounts.sitemaps import StaticViewSitemap, ProjectSitemap
-
-# Sitemap configuration
-sitemaps = {
-    'static': StaticViewSitemap,
-    'projects': ProjectSitemap,
-}
+from accounts.sitemaps import cached_sitemap
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('accounts.urls')),
     
     # SEO - Sitemap
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    # Precomputed; becomes a sitemap index when the sections outgrow one page
+    path('sitemap.xml', cached_sitemap, name='django.contrib.sitemaps.views.sitemap'),
+    path('sitemap-<str:section>.xml', cached_sitemap, name='sitemap_section'),
     
     # SEO - Robots.txt
     path('robots.txt', TemplateView.as_view(template_name='robots.txt', content_type='text/plain'), name='robots_txt'),
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+from accounts.sweeper import start_periodic_sweeper  # noqa: E402
+
+start_periodic_sweeper()